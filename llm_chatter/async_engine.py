@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from loguru import logger
+from openai import AsyncOpenAI
+
+from app.widgets.side_dock_area.plugins.llm_chatter.router import (
+    RoutePlan, StreamStallError, is_retryable, max_retries_for
+)
+from app.widgets.side_dock_area.plugins.llm_chatter.scheduler import (
+    PRIORITY_BACKGROUND, estimate_tokens, get_scheduler
+)
+from app.widgets.side_dock_area.plugins.llm_chatter.stall_watchdog import record_stall_event
+from app.widgets.side_dock_area.plugins.llm_chatter.worker import (
+    OpenAIChatWorker, _tool_to_openai_schema, build_title_prompt
+)
+
+
+ACQUIRE_POLL_INTERVAL = 0.05  # 调度器排队的轮询间隔（秒）
+
+
+class AsyncChatJob(OpenAIChatWorker):
+    """
+    由 AsyncLLMEngine 在 asyncio 事件循环中执行的对话请求。
+    信号、取消接口与 OpenAIChatWorker 一致，调用方无需区分两种引擎。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._engine: Optional["AsyncLLMEngine"] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def cancel(self):
+        super().cancel()
+        # 取消协程会在 await 处抛出 CancelledError，async with 负责关闭连接
+        if self._engine is not None and self._task is not None:
+            self._engine.loop.call_soon_threadsafe(self._task.cancel)
+
+
+class AsyncLLMEngine:
+    """
+    在单个后台线程中运行 asyncio 事件循环，所有对话流、标题生成与工具调用
+    共享该循环与按端点复用的 AsyncOpenAI 客户端，无需为每个请求占用一个线程。
+    结果通过 AsyncChatJob 的 Qt 信号回到主线程。
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._clients: Dict[tuple, AsyncOpenAI] = {}
+        # 工具执行是阻塞接口，放在小线程池中等待；调度器排队在事件循环中轮询，不占用该线程池
+        self._blocking_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-async-blocking")
+        self._thread = threading.Thread(target=self._run_loop, name="llm-async-engine", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _client(self, api_key: str, base_url: Optional[str]) -> AsyncOpenAI:
+        key = (api_key, base_url)
+        if key not in self._clients:
+            self._clients[key] = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=60.0, max_retries=0)
+        return self._clients[key]
+
+    # ---------------- 对话 ----------------
+    def submit(self, job: AsyncChatJob) -> AsyncChatJob:
+        job._engine = self
+
+        def _start():
+            job._task = self.loop.create_task(self._run_job(job))
+
+        self.loop.call_soon_threadsafe(_start)
+        return job
+
+    async def _run_job(self, job: AsyncChatJob):
+        if job._is_cancelled:
+            job._mark_finished()
+            return
+        job.state = job.ACTIVE
+        try:
+            if job._replay_cached_response():
+                return
+            await self._route(job)
+        except asyncio.CancelledError:
+            job.error_occurred.emit("[已取消] 用户手动中止请求")
+        except Exception as e:
+            job._emit_api_error(e)
+        finally:
+            job._mark_finished()
+
+    async def _route(self, job: AsyncChatJob):
+        """重试 / 熔断 / 备用端点的决策由 RoutePlan 给出（与 OpenAIChatWorker.run 共用），这里只负责异步等待"""
+        route = RoutePlan([job.llm_config] + job.fallback_configs)
+        job.full_response = ""
+        for llm_config in route.endpoints():
+            if llm_config is not job.llm_config:
+                job.fallback_used.emit(llm_config.get("模型名称", ""))
+            for attempt in range(max_retries_for(llm_config) + 1):
+                try:
+                    completed = await self._run_once(job, llm_config)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if job.full_response or job._tools_executed or not is_retryable(e):
+                        raise
+                    delay = route.on_failure(llm_config, attempt, e)
+                    if delay is None:
+                        break
+                    await asyncio.sleep(delay)
+                    continue
+                route.on_success(llm_config)
+                if completed:
+                    job._complete(llm_config)
+                return
+        route.raise_last_error()
+
+    async def _run_once(self, job: AsyncChatJob, llm_config: Dict) -> bool:
+        request = job._build_request(llm_config)
+        if request is None:
+            return False
+        api_key, base_url, req_kwargs = request
+        client = self._client(api_key, base_url)
+        job._load_runtime_options(llm_config)
+        job._active_config = llm_config
+        job.metrics.model = req_kwargs["model"]
+        tool_specs = [spec for spec in map(_tool_to_openai_schema, job.tools) if spec]
+        conversation = list(job.messages)
+
+        for round_idx in range(job.max_tool_rounds + 1):
+            req_kwargs["messages"] = conversation
+            if tool_specs and round_idx < job.max_tool_rounds:
+                req_kwargs["tools"] = tool_specs
+            else:
+                req_kwargs.pop("tools", None)
+
+            round_content, tool_calls = await self._request_round(job, client, req_kwargs)
+            if not tool_calls:
+                break
+            # 工具执行沿用 worker 的并发 / 超时 / 缓存逻辑，在阻塞线程池中等待结果
+            results = await self.loop.run_in_executor(self._blocking_pool, job._execute_tool_calls, tool_calls)
+            if results is None:
+                raise asyncio.CancelledError()
+            job._append_tool_round(conversation, round_content, tool_calls, results)
+        return True
+
+    async def _acquire(self, llm_config: Dict, tokens: int, priority: int, cancel_event: threading.Event = None,
+                       job: AsyncChatJob = None):
+        """
+        在事件循环中等待调度器放行。登记后以 asyncio.sleep 轮询，不占用阻塞线程池，
+        因此大量后台请求排队时也不会挡住后登记的交互请求。
+        传入 job 时记录其登记，排队期间 job.promote() 可提升优先级。
+        """
+        scheduler = get_scheduler()
+        waiter = scheduler.enqueue(llm_config, tokens, priority)
+        if job is not None:
+            job._track_waiter(waiter)
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                ticket, wait = scheduler.poll(waiter)
+                if ticket is not None:
+                    return ticket
+                await asyncio.sleep(min(wait, ACQUIRE_POLL_INTERVAL) if wait else ACQUIRE_POLL_INTERVAL)
+        finally:
+            # 放行后 withdraw 为空操作；取消（CancelledError）时从队列中移除登记
+            scheduler.withdraw(waiter)
+            if job is not None:
+                job._sched_waiter = None
+
+    async def _request_round(self, job: AsyncChatJob, client: AsyncOpenAI, req_kwargs: Dict) -> tuple:
+        attempt = 0
+        while True:
+            prompt_tokens = estimate_tokens(req_kwargs["messages"])
+            ticket = await self._acquire(job._active_config, prompt_tokens + req_kwargs["max_tokens"],
+                                         job.priority, job._cancel_event, job)
+            if ticket is None:
+                raise asyncio.CancelledError()
+            output_start = len(job.full_response)
+            round_state = job._new_round_state()
+            stall = None
+            job.metrics.on_request_sent(prompt_tokens)
+            try:
+                if not job.stream:
+                    response = await client.chat.completions.create(**req_kwargs)
+                    job.metrics.on_connected()
+                    return job._consume_message(response)
+                stall = await self._stream(job, client, req_kwargs, round_state)
+            finally:
+                job._release_ticket(ticket, prompt_tokens, output_start)
+            if stall is None:
+                return job._finish_round_state(round_state)
+
+            kind, elapsed, first_token_seen = stall
+            retry = not first_token_seen and attempt < job.stall_retries
+            record_stall_event({
+                "model": req_kwargs["model"],
+                "api_url": str(client.base_url),
+                "kind": kind,
+                "threshold": job.first_token_timeout if kind == "first_token" else job.chunk_gap_timeout,
+                "elapsed": round(elapsed, 3),
+                "response_chars": len(job.full_response),
+                "attempt": attempt,
+                "retried": retry,
+                "engine": "async",
+            })
+            if retry:
+                attempt += 1
+                continue
+            if not job.full_response and not first_token_seen:
+                raise StreamStallError(f"等待首个 Token 超过 {job.first_token_timeout:.0f} 秒")
+            raise StreamStallError(f"流式响应超过 {job.chunk_gap_timeout:.0f} 秒无数据")
+
+    async def _stream(self, job: AsyncChatJob, client: AsyncOpenAI, req_kwargs: Dict, round_state: Dict):
+        """读取一次流式响应；停滞时返回 (类型, 已等待秒数, 是否已收到数据)，正常结束返回 None"""
+        started = time.monotonic()
+        first_token_seen = False
+        try:
+            stream = await asyncio.wait_for(client.chat.completions.create(**req_kwargs), job.first_token_timeout)
+        except asyncio.TimeoutError:
+            return "first_token", time.monotonic() - started, False
+        job.metrics.on_connected()
+        try:
+            iterator = stream.__aiter__()
+            while True:
+                timeout = job.chunk_gap_timeout if first_token_seen else \
+                    max(0.0, job.first_token_timeout - (time.monotonic() - started))
+                waited_from = time.monotonic()
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return None
+                except asyncio.TimeoutError:
+                    if first_token_seen:
+                        return "chunk_gap", time.monotonic() - waited_from, True
+                    return "first_token", time.monotonic() - started, False
+                if job._apply_chunk(chunk, round_state):
+                    first_token_seen = True
+        finally:
+            await stream.close()
+
+    # ---------------- 标题生成 ----------------
+    def submit_title(self, current_title: str, messages_for_summary: List[Dict], llm_config: Dict,
+                     callback: Callable):
+        """异步生成对话标题，回调约定与 TitleGenerationTask 相同"""
+        asyncio.run_coroutine_threadsafe(
+            self._generate_title(current_title, messages_for_summary, llm_config, callback), self.loop
+        )
+
+    async def _generate_title(self, current_title: str, messages_for_summary: List[Dict], llm_config: Dict,
+                              callback: Callable):
+        try:
+            messages = [{"role": "user", "content": build_title_prompt(current_title, messages_for_summary)}]
+            client = self._client(llm_config["API_KEY"], llm_config["API_URL"])
+            ticket = await self._acquire(llm_config, estimate_tokens(messages) + 500, PRIORITY_BACKGROUND)
+            try:
+                resp = await client.chat.completions.create(
+                    model=llm_config["模型名称"],
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=500,
+                    stream=False
+                )
+            finally:
+                get_scheduler().release(ticket)
+            callback(resp.choices[0].message.content.strip())
+        except Exception as e:
+            callback(None, error=f"[TitleGen Error] {str(e)}")
+
+
+_engine: Optional[AsyncLLMEngine] = None
+
+
+def get_async_engine() -> AsyncLLMEngine:
+    global _engine
+    if _engine is None:
+        _engine = AsyncLLMEngine()
+    return _engine
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+端到端流式管线基准：输入框发送 → OpenAIChatWorker → MessageCard / CodeWebViewer 渲染，
+请求发往本地 MockOpenAIServer，可在无显示器环境（offscreen 平台）下运行。
+
+    python -m app.widgets.side_dock_area.plugins.llm_chatter.benchmarks.pipeline_bench --output bench.json
+
+每类回复记录：首个可见 Token 时间、渲染次数与累计耗时、GUI 线程阻塞时间、峰值 RSS、完整回复耗时。
+注意 QtWebEngine 的渲染进程独立于主进程，峰值 RSS 仅统计主进程。
+"""
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("QTWEBENGINE_CHROMIUM_FLAGS", "--disable-gpu")
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from PyQt5.QtCore import Qt, QCoreApplication, QEventLoop, QTimer, QT_VERSION_STR, PYQT_VERSION_STR
+from PyQt5 import QtWebEngineWidgets  # noqa: F401  必须在创建 QApplication 之前导入
+from PyQt5.QtWidgets import QApplication
+
+from app.widgets.side_dock_area.plugins.llm_chatter.benchmarks.workloads import build_workloads
+from app.widgets.side_dock_area.plugins.llm_chatter.mock_server import MockOpenAIServer
+
+BENCH_CONFIG_NAME = "基准测试"
+
+
+def peak_rss_mb() -> Optional[float]:
+    """当前进程的峰值常驻内存（MB）；无法获取时返回 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / 1024 / 1024, 1)
+    except ImportError:
+        return None
+
+
+def wait_until(predicate, timeout: float, poll_ms: int = 5) -> bool:
+    """运行事件循环直到条件成立或超时"""
+    deadline = time.perf_counter() + timeout
+    loop = QEventLoop()
+    while not predicate():
+        if time.perf_counter() >= deadline:
+            return False
+        QTimer.singleShot(poll_ms, loop.quit)
+        loop.exec_()
+    return True
+
+
+class GuiBlockMonitor:
+    """
+    用固定间隔的 QTimer 心跳估算 GUI 线程被阻塞的时间：
+    两次心跳的实际间隔超出预期（加容差）的部分计为阻塞。
+    """
+
+    def __init__(self, interval_ms: int = 5, tolerance_ms: int = 11):
+        self.interval_ms = interval_ms
+        self.tolerance_ms = tolerance_ms
+        self._timer = QTimer()
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self._tick)
+        self._last: Optional[float] = None
+        self.blocked_ms = 0.0
+        self.max_stall_ms = 0.0
+
+    def start(self):
+        self.blocked_ms = 0.0
+        self.max_stall_ms = 0.0
+        self._last = time.perf_counter()
+        self._timer.start(self.interval_ms)
+
+    def stop(self):
+        self._timer.stop()
+        self._tick()
+
+    def _tick(self):
+        now = time.perf_counter()
+        gap_ms = (now - self._last) * 1000
+        self._last = now
+        if gap_ms > self.interval_ms + self.tolerance_ms:
+            self.blocked_ms += gap_ms - self.interval_ms
+            self.max_stall_ms = max(self.max_stall_ms, gap_ms)
+
+
+class RenderProbe:
+    """包装 CodeWebViewer._render，统计渲染次数、累计耗时与首次显示内容的时间（以 contentRendered 为准）"""
+
+    def __init__(self, viewer, sent_at: float):
+        self.viewer = viewer
+        self.sent_at = sent_at
+        self.ticks = 0
+        self.render_ms = 0.0
+        self.first_content_render_at: Optional[float] = None
+        self.first_paint_at: Optional[float] = None
+        self.last_render_at: Optional[float] = None
+        self.last_load_at: Optional[float] = None
+
+        original = viewer._render
+
+        def timed_render():
+            started = time.perf_counter()
+            original()
+            finished = time.perf_counter()
+            self.ticks += 1
+            self.render_ms += (finished - started) * 1000
+            self.last_render_at = finished
+            if self.first_content_render_at is None and viewer.get_plain_text().strip():
+                self.first_content_render_at = finished
+
+        # 实例属性优先于类方法，渲染定时器与 finish_streaming 都会走到包装函数
+        viewer._render = timed_render
+        viewer.contentRendered.connect(self._on_content_rendered)
+
+    def _on_content_rendered(self):
+        self.last_load_at = time.perf_counter()
+        if self.first_paint_at is None and self.first_content_render_at is not None:
+            self.first_paint_at = self.last_load_at
+
+    @property
+    def settled(self) -> bool:
+        """最后一次渲染的正文已显示到页面"""
+        return self.last_render_at is not None and self.last_load_at is not None \
+            and self.last_load_at >= self.last_render_at
+
+
+class _BenchHomepage:
+    """对话窗口只读取 homepage 上的少量可选属性"""
+    workflow_name = "pipeline_benchmark"
+
+
+def create_window(server_url: str):
+    from app.widgets.side_dock_area.plugins.llm_chatter.main_widget import OpenAIChatToolWindow
+
+    window = OpenAIChatToolWindow(_BenchHomepage())
+    window._get_available_mcp_tools = lambda: []  # 基准测试不连接 MCP 服务
+    window.resize(900, 900)
+    window.show()  # 首次显示时才加载模型配置，之后再加入基准配置
+    window._valid_configs[BENCH_CONFIG_NAME] = {
+        "模型名称": "mock", "API_KEY": "bench", "API_URL": server_url, "是否思考": False, "最大Token": 32768,
+    }
+    window.model_combo.addItem(BENCH_CONFIG_NAME)
+    window.model_combo.setCurrentText(BENCH_CONFIG_NAME)
+    return window
+
+
+def run_once(window, workload: str, timeout: float) -> Dict:
+    config = window._valid_configs[BENCH_CONFIG_NAME]
+    config["模型名称"] = workload  # 模拟服务按模型名选择场景
+    window._create_new_session()
+    wait_until(lambda: False, 0.05)  # 处理上一轮卡片的延迟删除，避免计入本次测量
+
+    monitor = GuiBlockMonitor()
+    window.input_area.setPlainText(f"benchmark {workload}")
+    monitor.start()
+    sent_at = time.perf_counter()
+    window._on_send_clicked()
+    session = window.session_manager.get_current_session()
+    probe = RenderProbe(window._stream_cards[session.session_id].content_widget, sent_at)
+    replied_at = []
+    window._session_workers[session.session_id].finished_with_content.connect(
+        lambda _: replied_at.append(time.perf_counter()))
+
+    completed = wait_until(lambda: not session.is_streaming, timeout)
+    wait_until(lambda: probe.settled, 5.0)
+    monitor.stop()
+
+    def _ms(at: Optional[float]) -> Optional[float]:
+        return round((at - sent_at) * 1000, 1) if at is not None else None
+
+    return {
+        "completed": completed,
+        "time_to_first_paint_ms": _ms(probe.first_paint_at),
+        "time_to_first_render_ms": _ms(probe.first_content_render_at),
+        "reply_latency_ms": _ms(replied_at[0] if replied_at else None),
+        "settled_ms": _ms(probe.last_load_at),
+        "render_ticks": probe.ticks,
+        "render_ms": round(probe.render_ms, 1),
+        "gui_blocked_ms": round(monitor.blocked_ms, 1),
+        "gui_max_stall_ms": round(monitor.max_stall_ms, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _median(runs: List[Dict]) -> Dict:
+    summary = {}
+    for key, value in runs[0].items():
+        values = [run[key] for run in runs if isinstance(run.get(key), (int, float)) and not isinstance(run[key], bool)]
+        if values and not isinstance(value, bool):
+            summary[key] = round(statistics.median(values), 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端流式管线基准测试")
+    parser.add_argument("--output", help="结果 JSON 路径（默认输出到标准输出）")
+    parser.add_argument("--repeat", type=int, default=3, help="每类回复的重复次数，结果取中位数")
+    parser.add_argument("--scale", type=float, default=1.0, help="回复规模倍数")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--ttft", type=float, default=0.2, help="模拟服务的首 Token 延迟（秒）")
+    parser.add_argument("--chunk-chars", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=300.0, help="单次回复的超时时间（秒）")
+    parser.add_argument("--workloads", nargs="*", help="只运行指定的回复类型")
+    args = parser.parse_args()
+
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    contents = build_workloads(args.scale)
+    if args.workloads:
+        contents = {name: text for name, text in contents.items() if name in args.workloads}
+    script = {"models": {
+        name: {"content": text, "ttft": args.ttft, "tokens_per_second": args.tokens_per_second,
+               "chunk_chars": args.chunk_chars}
+        for name, text in contents.items()
+    }}
+
+    results = {}
+    with MockOpenAIServer(script) as server:
+        window = create_window(server.url)
+        for name, text in contents.items():
+            runs = [run_once(window, name, args.timeout) for _ in range(args.repeat)]
+            results[name] = {"chars": len(text), "median": _median(runs), "runs": runs}
+        window.close()
+
+    report = {
+        "benchmark": "llm_chatter.pipeline",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "qpa_platform": app.platformName(),
+        },
+        "config": {
+            "repeat": args.repeat, "scale": args.scale, "tokens_per_second": args.tokens_per_second,
+            "ttft": args.ttft, "chunk_chars": args.chunk_chars,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Markdown 渲染热路径的微基准（不依赖 Qt）：把流式回复记录逐 chunk 回放，
+每个渲染节拍（tick）依次执行 markdown_render 中的各阶段，统计单阶段耗时与内存分配，
+并在不同消息长度下测量单次渲染耗时，拟合 log-log 斜率以验证成本随长度线性增长。
+
+    python -m app.widgets.side_dock_area.plugins.llm_chatter.benchmarks.render_bench --output render.json
+
+回放语料默认使用同目录的 render_corpus.json，格式为
+    {"transcripts": [{"name": ..., "chunks": ["...", ...]}, ...]}
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from app.widgets.side_dock_area.plugins.llm_chatter import markdown_render as mr
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_corpus.json")
+SCALING_LENGTHS = (1000, 2000, 4000, 8000, 16000, 32000)
+
+
+def _markdown_convert(text: str) -> str:
+    md = mr.get_markdown_instance()
+    md.reset()
+    return md.convert(text)
+
+
+def build_stages(completed: bool) -> List[Tuple[str, Callable[[str], str]]]:
+    """与 render_markdown_body 相同顺序的各阶段，前一阶段的输出是后一阶段的输入"""
+    return [
+        ("sanitize", mr._sanitize_incomplete_markdown),
+        ("unwrap_code_links", mr._unwrap_code_blocks_with_context_links),
+        ("context_links", mr._inject_context_links),
+        ("think_cards", lambda text: mr._inject_think_cards(text, completed=completed)),
+        ("markdown", _markdown_convert),
+        ("wrap_code", mr._wrap_code_blocks_with_copy_button_web),
+    ]
+
+
+def load_corpus(path: str) -> List[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)["transcripts"]
+
+
+def replay_ticks(chunks: List[str], chunks_per_tick: int) -> List[Tuple[str, bool]]:
+    """按每 tick 到达的 chunk 数切分回放过程，返回每次渲染时的累计文本及是否为最终渲染"""
+    ticks = []
+    text = ""
+    for i, chunk in enumerate(chunks, 1):
+        text += chunk
+        if i % chunks_per_tick == 0 and i < len(chunks):
+            ticks.append((text, False))
+    ticks.append((text, True))
+    return ticks
+
+
+def time_tick(text: str, completed: bool) -> Dict[str, float]:
+    """逐阶段执行一次渲染，返回各阶段耗时（毫秒）"""
+    timings = {}
+    value = text
+    for name, stage in build_stages(completed):
+        started = time.perf_counter()
+        value = stage(value)
+        timings[name] = (time.perf_counter() - started) * 1000
+    return timings
+
+
+def alloc_tick(text: str, completed: bool) -> Dict[str, float]:
+    """逐阶段执行一次渲染，返回各阶段的峰值内存分配（KB）；tracemalloc 会拖慢执行，与计时分开跑"""
+    allocations = {}
+    value = text
+    for name, stage in build_stages(completed):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        value = stage(value)
+        allocations[name] = max(0, tracemalloc.get_traced_memory()[1] - baseline) / 1024
+    return allocations
+
+
+def _stage_summary(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for name in samples[0]:
+        values = sorted(sample[name] for sample in samples)
+        summary[name] = {
+            "total": round(sum(values), 3),
+            "mean": round(statistics.mean(values), 4),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+            "max": round(values[-1], 4),
+        }
+    return summary
+
+
+def bench_transcript(transcript: Dict, chunks_per_tick: int) -> Dict:
+    ticks = replay_ticks(transcript["chunks"], chunks_per_tick)
+    # 预热：加载扩展与编译正则，不计入统计
+    mr.render_markdown_body(ticks[-1][0], completed=True)
+
+    timings = [time_tick(text, completed) for text, completed in ticks]
+    started = time.perf_counter()
+    for text, completed in ticks:
+        mr.render_markdown_body(text, completed=completed)
+    pipeline_ms = (time.perf_counter() - started) * 1000
+
+    tracemalloc.start()
+    try:
+        allocations = [alloc_tick(text, completed) for text, completed in ticks]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "chars": len(ticks[-1][0]),
+        "chunks": len(transcript["chunks"]),
+        "ticks": len(ticks),
+        "pipeline_ms": round(pipeline_ms, 2),
+        "pipeline_ms_per_tick": round(pipeline_ms / len(ticks), 4),
+        "stage_ms": _stage_summary(timings),
+        "stage_alloc_kb": _stage_summary(allocations),
+    }
+
+
+def _build_text(transcripts: List[Dict], length: int) -> str:
+    """把语料首尾拼接到指定长度；截断处可能留下未闭合语法，正好覆盖流式中途的情况"""
+    texts = ["".join(t["chunks"]) for t in transcripts]
+    parts = []
+    size = 0
+    while size < length:
+        text = texts[len(parts) % len(texts)]
+        parts.append(text)
+        size += len(text) + 2
+    return "\n\n".join(parts)[:length]
+
+
+def _fit_exponent(points: List[Tuple[int, float]]) -> float:
+    """最小二乘拟合 log(cost) = k·log(length) + b，返回 k；k≈1 表示线性"""
+    xs = [math.log(length) for length, _ in points]
+    ys = [math.log(max(cost, 1e-6)) for _, cost in points]
+    mean_x, mean_y = statistics.mean(xs), statistics.mean(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    if not denominator:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator
+
+
+def bench_scaling(transcripts: List[Dict], lengths, repeat: int) -> Dict:
+    """不同消息长度下单次渲染（一个 tick）的耗时，取多次中位数"""
+    rows = []
+    per_stage: Dict[str, List[Tuple[int, float]]] = {}
+    for length in lengths:
+        text = _build_text(transcripts, length)
+        mr.render_markdown_body(text)
+        samples = [time_tick(text, completed=False) for _ in range(repeat)]
+        stage_ms = {name: statistics.median(s[name] for s in samples) for name in samples[0]}
+        total = sum(stage_ms.values())
+        rows.append({"chars": length, "tick_ms": round(total, 4),
+                     "stage_ms": {name: round(value, 4) for name, value in stage_ms.items()}})
+        for name, value in stage_ms.items():
+            per_stage.setdefault(name, []).append((length, value))
+
+    return {
+        "points": rows,
+        "exponent": round(_fit_exponent([(row["chars"], row["tick_ms"]) for row in rows]), 3),
+        "stage_exponents": {name: round(_fit_exponent(points), 3) for name, points in per_stage.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markdown 渲染热路径微基准（无需 Qt）")
+    parser.add_argument("--transcript", default=DEFAULT_CORPUS, help="流式回复记录（JSON）路径")
+    parser.add_argument("--output", help="结果 JSON 路径（默认输出到标准输出）")
+    parser.add_argument("--chunks-per-tick", type=int, default=8, help="每次渲染之间到达的 chunk 数")
+    parser.add_argument("--lengths", type=int, nargs="*", default=list(SCALING_LENGTHS),
+                        help="伸缩性测试的消息长度（字符）")
+    parser.add_argument("--repeat", type=int, default=5, help="伸缩性测试每个长度的重复次数")
+    args = parser.parse_args()
+
+    transcripts = load_corpus(args.transcript)
+    report = {
+        "benchmark": "llm_chatter.render",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "config": {"transcript": os.path.basename(args.transcript), "chunks_per_tick": args.chunks_per_tick,
+                   "lengths": args.lengths, "repeat": args.repeat},
+        "transcripts": {t["name"]: bench_transcript(t, max(1, args.chunks_per_tick)) for t in transcripts},
+        "scaling": bench_scaling(transcripts, args.lengths, args.repeat) if args.lengths else None,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""基准测试用的典型回复：纯文本、大量代码块、大表格与长思考过程（内容确定，便于前后对比）"""
+from typing import Callable, Dict, Tuple
+
+_SENTENCE = ("该节点读取上游数据后进行字段清洗，并将结果传递给下游的特征工程组件；"
+             "建议在连接前确认列名一致，避免运行时出现 KeyError。")
+
+_CODE = '''def process(df, columns=None):
+    """清洗并返回指定列"""
+    columns = columns or list(df.columns)
+    result = df[columns].dropna()
+    for col in columns:
+        if result[col].dtype == "object":
+            result[col] = result[col].str.strip()
+    return result
+'''
+
+
+def prose_reply(paragraphs: int = 30) -> str:
+    parts = ["## 分析结果\n"]
+    for i in range(paragraphs):
+        parts.append(f"**第 {i + 1} 点**：" + _SENTENCE * 3 + f" 相关节点：[数据清洗{i}](jump)。\n")
+    parts.append("- [还有哪些节点可以优化？](ask)\n- [帮我生成单元测试](ask)\n")
+    return "\n".join(parts)
+
+
+def code_blocks_reply(blocks: int = 20) -> str:
+    parts = ["以下是各组件的参考实现：\n"]
+    for i in range(blocks):
+        parts.append(f"### 组件 {i + 1}\n\n{_SENTENCE}\n\n```python\n{_CODE}```\n")
+    return "\n".join(parts)
+
+
+def table_reply(rows: int = 300, cols: int = 8) -> str:
+    header = "| " + " | ".join(f"字段{c}" for c in range(cols)) + " |"
+    divider = "|" + "---|" * cols
+    lines = ["参数对比如下：\n", header, divider]
+    for r in range(rows):
+        lines.append("| " + " | ".join(f"值{r}-{c}" for c in range(cols)) + " |")
+    lines.append("\n以上参数均已按默认值填写。")
+    return "\n".join(lines)
+
+
+def think_reply(paragraphs: int = 80) -> str:
+    thinking = "\n\n".join(f"思考步骤 {i + 1}：" + _SENTENCE * 2 for i in range(paragraphs))
+    return f"<think>\n{thinking}\n</think>\n\n最终结论：画布结构合理，建议补充 [异常值处理](create) 组件。"
+
+
+# 名称 → (生成函数, 默认规模)
+WORKLOADS: Dict[str, Tuple[Callable[[int], str], int]] = {
+    "prose": (prose_reply, 30),
+    "code_blocks": (code_blocks_reply, 20),
+    "huge_table": (table_reply, 300),
+    "long_think": (think_reply, 80),
+}
+
+
+def build_workloads(scale: float = 1.0) -> Dict[str, str]:
+    """按比例缩放各类回复的规模（scale=2 约为两倍长度）"""
+    return {name: generate(max(1, int(size * scale))) for name, (generate, size) in WORKLOADS.items()}
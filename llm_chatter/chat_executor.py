@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from app.widgets.side_dock_area.plugins.llm_chatter.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from app.widgets.side_dock_area.plugins.llm_chatter.worker import OpenAIChatWorker
+
+
+class _ChatJobRunnable(QRunnable):
+    def __init__(self, worker: OpenAIChatWorker):
+        super().__init__()
+        self.worker = worker
+        # 由执行器持有到任务结束，以便 promote() 时从线程池队列中取回重新提交
+        self.setAutoDelete(False)
+
+    def run(self):
+        self.worker.run()
+
+
+class ChatJobExecutor(QObject):
+    """
+    对话请求执行器：在有上限的 QThreadPool 中复用线程执行 OpenAIChatWorker，
+    并跟踪所有未结束的任务，支持多个会话同时流式输出。
+    交互请求在线程池队列中排在后台任务（对比、预取等）之前，且后台任务最多占用
+    max_workers - 1 个线程，始终为用户发送的消息保留一个线程。
+    """
+    jobCountChanged = pyqtSignal(int)
+
+    def __init__(self, max_workers: int = 4, parent=None):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_workers)
+        self._pool.setExpiryTimeout(60000)  # 空闲线程保留 60 秒以便复用
+        self._jobs: Dict[int, OpenAIChatWorker] = {}
+        self._runnables: Dict[int, _ChatJobRunnable] = {}
+        self._background_limit = max(1, max_workers - 1)
+        self._background_started: Set[int] = set()  # 按后台优先级提交到线程池的任务
+        self._background_queue: Deque[OpenAIChatWorker] = deque()
+        self.finished_count = 0
+
+    def submit(self, worker: OpenAIChatWorker) -> OpenAIChatWorker:
+        self._jobs[id(worker)] = worker
+        worker.finished.connect(lambda w=worker: self._on_job_finished(w))
+        if self._is_background(worker) and len(self._background_started) >= self._background_limit:
+            self._background_queue.append(worker)
+        else:
+            self._start(worker)
+        self.jobCountChanged.emit(len(self._jobs))
+        return worker
+
+    @staticmethod
+    def _is_background(worker: OpenAIChatWorker) -> bool:
+        return worker.priority > PRIORITY_INTERACTIVE
+
+    def _start(self, worker: OpenAIChatWorker):
+        if self._is_background(worker):
+            self._background_started.add(id(worker))
+        runnable = self._runnables.setdefault(id(worker), _ChatJobRunnable(worker))
+        # QThreadPool 的优先级越大越先执行，调度器的优先级数值越小越紧急，这里取反
+        self._pool.start(runnable, PRIORITY_BACKGROUND - worker.priority)
+
+    def promote(self, worker: OpenAIChatWorker, priority: int = PRIORITY_INTERACTIVE):
+        """
+        后台任务被用户采用时提升为交互优先级：仍在本地队列或线程池队列中的立即按新优先级提交，
+        已在运行的不再计入后台名额；调度器中的排队登记由 worker.promote() 调整。
+        """
+        worker.promote(priority)
+        key = id(worker)
+        if key not in self._jobs:
+            return
+        if worker in self._background_queue:
+            self._background_queue.remove(worker)
+            self._start(worker)
+        elif key in self._background_started:
+            self._background_started.discard(key)
+            runnable = self._runnables.get(key)
+            if runnable is not None and self._pool.tryTake(runnable):
+                self._start(worker)
+            self._drain_background_queue()
+
+    def _drain_background_queue(self):
+        # 排队期间被取消的后台任务也照常启动，run() 发现已取消会立即结束并发出 finished
+        while self._background_queue and len(self._background_started) < self._background_limit:
+            self._start(self._background_queue.popleft())
+
+    def _on_job_finished(self, worker: OpenAIChatWorker):
+        if self._jobs.pop(id(worker), None) is None:
+            return
+        self.finished_count += 1
+        self._runnables.pop(id(worker), None)
+        self._background_started.discard(id(worker))
+        self._drain_background_queue()
+        self.jobCountChanged.emit(len(self._jobs))
+
+    def jobs(self, state: Optional[str] = None) -> List[OpenAIChatWorker]:
+        return [w for w in self._jobs.values() if state is None or w.state == state]
+
+    def cancel_all(self):
+        for worker in list(self._jobs.values()):
+            worker.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self.jobs(OpenAIChatWorker.PENDING)),
+            "active": len(self.jobs(OpenAIChatWorker.ACTIVE)),
+            "cancelling": len(self.jobs(OpenAIChatWorker.CANCELLING)),
+            "finished": self.finished_count,
+            "threads": self._pool.activeThreadCount(),
+        }
+
+
+_executor: Optional[ChatJobExecutor] = None
+
+
+def get_chat_executor() -> ChatJobExecutor:
+    """进程内共享的执行器（需在主线程中首次调用）"""
+    global _executor
+    if _executor is None:
+        _executor = ChatJobExecutor()
+    return _executor
@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime
 from typing import Dict, List, Optional
 from PyQt5.QtCore import QObject
@@ -5,8 +6,15 @@ from PyQt5.QtCore import QObject
 
 class ChatSession:
     def __init__(self, name: str = None, messages: Optional[List[Dict]] = None):
+        self.session_id = uuid.uuid4().hex
         self.name = name or f"对话 {datetime.now().strftime('%m-%d %H:%M')}"
         self.messages: List[Dict[str, str]] = messages.copy() if messages is not None else []
+        self.history_id: Optional[str] = None  # 对应的历史记录 id，首次保存后绑定
+        # 回复生成期间的显示内容缓冲：会话不在前台时继续写入，切回时据此补齐卡片
+        self.streaming_content = ""
+        self.is_streaming = False
+        # 多模型对比结果（未保留前不计入 messages）：[{"name", "content", "metrics", "error", "done"}]
+        self.compare_results: List[Dict] = []
 
     def get_context_messages(self) -> List[Dict[str, str]]:
         return self.messages.copy()
@@ -58,5 +66,37 @@ class SessionManager(QObject):
     def get_session_names(self) -> List[str]:
         return [s.name for s in self.sessions]
 
-    def set_session_from_messages(self, messages: List[Dict]):
-        self.sessions[self.current_index] = ChatSession(messages=messages.copy())
\ No newline at end of file
+    def find_session(self, session_id: str) -> Optional[ChatSession]:
+        for session in self.sessions:
+            if session.session_id == session_id:
+                return session
+        return None
+
+    def find_by_history_id(self, history_id: str) -> Optional[ChatSession]:
+        for session in self.sessions:
+            if history_id and session.history_id == history_id:
+                return session
+        return None
+
+    def get_streaming_sessions(self) -> List[ChatSession]:
+        return [s for s in self.sessions if s.is_streaming]
+
+    def set_session_from_messages(self, messages: List[Dict], history_id: str = None) -> ChatSession:
+        """
+        载入历史消息为当前会话。
+        该历史已在内存中打开时直接切换过去；当前会话仍在后台生成回复时新建会话而不是覆盖它。
+        """
+        existing = self.find_by_history_id(history_id)
+        if existing is not None:
+            self.current_index = self.sessions.index(existing)
+            return existing
+
+        session = ChatSession(messages=messages.copy())
+        session.history_id = history_id
+        current = self.get_current_session()
+        if current is not None and not current.is_streaming:
+            self.sessions[self.current_index] = session
+        else:
+            self.sessions.append(session)
+            self.current_index = len(self.sessions) - 1
+        return session
\ No newline at end of file
@@ -0,0 +1,61 @@
+# 多模型对比：同一问题并排展示多个模型的回答与性能指标
+from typing import List
+
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout
+from qfluentwidgets import CaptionLabel, PushButton, StrongBodyLabel
+
+from app.widgets.side_dock_area.plugins.llm_chatter.message_card import MessageCard
+from app.widgets.side_dock_area.plugins.llm_chatter.metrics import RequestMetrics
+
+
+class CompareColumn(QWidget):
+    keepRequested = pyqtSignal()
+
+    def __init__(self, window, config_name: str, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+
+        header_layout = QHBoxLayout()
+        header_layout.setSpacing(6)
+        self.title_label = StrongBodyLabel(config_name, self)
+        self.metrics_label = CaptionLabel("等待响应…", self)
+        self.metrics_label.setStyleSheet("color: #aaa;")
+        self.keep_btn = PushButton("保留此回答", self)
+        self.keep_btn.setEnabled(False)
+        self.keep_btn.clicked.connect(self.keepRequested.emit)
+        header_layout.addWidget(self.title_label)
+        header_layout.addWidget(self.metrics_label, 1)
+        header_layout.addWidget(self.keep_btn)
+        layout.addLayout(header_layout)
+
+        # MessageCard 依赖 parent 为对话窗口（滚动、InfoBar），加入布局后会自动改挂到本列
+        self.card = MessageCard(parent=window, role="assistant")
+        layout.addWidget(self.card)
+
+    def append_content(self, text: str):
+        self.card.update_content(text)
+
+    def set_finished(self, metrics: RequestMetrics, error: str = ""):
+        self.card.finish_streaming()
+        self.metrics_label.setText(f"失败 · {metrics.summary()}" if error else metrics.summary())
+        self.keep_btn.setEnabled(not error and metrics.output_chars > 0)
+
+
+class ComparePanel(QWidget):
+    """每个模型一列；keepRequested 发出被保留回答的列序号"""
+    keepRequested = pyqtSignal(int)
+
+    def __init__(self, window, config_names: List[str], parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(6)
+        self.columns: List[CompareColumn] = []
+        for index, name in enumerate(config_names):
+            column = CompareColumn(window, name, self)
+            column.keepRequested.connect(lambda i=index: self.keepRequested.emit(i))
+            layout.addWidget(column, 1)
+            self.columns.append(column)
@@ -13,6 +13,7 @@ from qfluentwidgets import (
 )
 
 from app.utils.utils import serialize_for_json
+from app.widgets.side_dock_area.plugins.llm_chatter.profiling import traced
 
 
 class ContextRegistry:
@@ -313,6 +314,7 @@ class ContextSelector(QWidget):
         popup_top_left = QPoint(btn_global_pos.x(), btn_global_pos.y() - popup_height)
         self.popup.show_at(popup_top_left)
 
+    @traced("context.refresh")
     def _refresh_context_cache(self):
         self._context_cache.clear()
         for context_key, context_func in self._context_items:
@@ -1,10 +1,12 @@
 import os
 import json
+import uuid
 from datetime import datetime
 from typing import List, Dict, Optional
 from pathlib import Path
 
 from app.utils.utils import serialize_for_json, deserialize_from_json
+from app.widgets.side_dock_area.plugins.llm_chatter.profiling import traced
 
 
 class HistoryManager:
@@ -15,6 +17,7 @@ class HistoryManager:
         self.history_dir.mkdir(parents=True, exist_ok=True)
         self._history_sessions: List[Dict] = self._load_history()
 
+    @traced("history.load")
     def _load_history(self) -> List[Dict]:
         if self.history_file.exists():
             try:
@@ -22,6 +25,7 @@ class HistoryManager:
                     data = deserialize_from_json(json.load(f))
                     # 确保必要字段存在
                     for item in data:
+                        item.setdefault('id', uuid.uuid4().hex)
                         if 'title' not in item:
                             item['title'] = '未命名对话'
                         if 'last_time' not in item:
@@ -31,9 +35,10 @@ class HistoryManager:
                 pass
         return []
 
-    def save_session(self, messages: List[Dict], title: str = None):
+    def save_session(self, messages: List[Dict], title: str = None) -> Optional[str]:
+        """新增一条历史记录，返回其 id"""
         if not messages:
-            return
+            return None
         last_msg_time = messages[-1].get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M'))
         if not title:
             # 简单提取用户首条消息前30字作为标题
@@ -44,12 +49,29 @@ class HistoryManager:
             else:
                 title = '新对话'
 
+        history_id = uuid.uuid4().hex
         self._history_sessions.insert(0, {
+            'id': history_id,
             'title': title,
             'last_time': last_msg_time,
             'messages': messages
         })
         self._save_to_disk()
+        return history_id
+
+    def index_of(self, history_id: Optional[str]) -> Optional[int]:
+        """按 id 查找历史记录当前的索引（新增记录会插入到最前，索引并不固定）"""
+        if not history_id:
+            return None
+        for index, item in enumerate(self._history_sessions):
+            if item.get('id') == history_id:
+                return index
+        return None
+
+    def get_history_id(self, index: int) -> Optional[str]:
+        if 0 <= index < len(self._history_sessions):
+            return self._history_sessions[index].get('id')
+        return None
 
     def get_current_title(self, index: int) -> str:
         if 0 <= index < len(self._history_sessions):
@@ -61,6 +83,7 @@ class HistoryManager:
             self._history_sessions[index]['title'] = new_title
             self._save_to_disk()
 
+    @traced("history.save")
     def _save_to_disk(self):
         with open(self.history_file, 'w', encoding='utf-8') as f:
             json.dump(serialize_for_json(self._history_sessions), f, ensure_ascii=False, indent=2)
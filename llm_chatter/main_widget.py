@@ -1,31 +1,48 @@
 # -*- coding: utf-8 -*-
+import difflib
+import os
 import re
+import time
 from pathlib import Path
 
 from loguru import logger
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, TYPE_CHECKING
 
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QThreadPool
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QThreadPool, QPoint, QCoreApplication
 from PyQt5.QtGui import QFont
-from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QLabel, QApplication, QWidget
+from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QLabel, QApplication, QWidget, QAction
 from qfluentwidgets import (
     setFont, ComboBox, FluentIcon, SingleDirectionScrollArea, InfoBar, InfoBarPosition, CardWidget, CaptionLabel,
     TransparentToolButton,
-    TransparentToggleToolButton
+    TransparentToggleToolButton, CheckableMenu, MenuIndicatorType
 )
 
-from app.mcp_server.stdio_server import GlobalMcpServer
-from app.utils.config import Settings
 from app.utils.utils import get_icon
-from app.widgets.side_dock_area.plugins.llm_chatter.chat_session import SessionManager
+from app.widgets.side_dock_area.plugins.llm_chatter.chat_session import ChatSession, SessionManager
 from app.widgets.side_dock_area.plugins.llm_chatter.context_selector import ContextSelector
 from app.widgets.side_dock_area.plugins.llm_chatter.history_manager import HistoryManager
 from app.widgets.side_dock_area.plugins.llm_chatter.llm_config_popup import LLMConfigPopup
-from app.widgets.side_dock_area.plugins.llm_chatter.message_card import MessageCard, create_welcome_card
+from app.widgets.side_dock_area.plugins.llm_chatter.metrics import get_metrics_recorder
 from app.widgets.side_dock_area.plugins.llm_chatter.bottom_input_area import SendableTextEdit
-from app.widgets.side_dock_area.plugins.llm_chatter.worker import OpenAIChatWorker, TitleGenerationTask
+from app.widgets.side_dock_area.plugins.llm_chatter.prefetch import FollowupPrefetcher, extract_followup_questions
+from app.widgets.side_dock_area.plugins.llm_chatter.profiling import span
+from app.widgets.side_dock_area.plugins.llm_chatter.response_cache import get_response_cache, is_response_cache_enabled
+from app.widgets.side_dock_area.plugins.llm_chatter.scheduler import PRIORITY_BACKGROUND, estimate_tokens
+from app.widgets.side_dock_area.plugins.llm_chatter.tool_cache import ToolResultCache, get_tool_cache_ttl
 from app.widgets.side_dock_area.tool_window import ToolWindow, DockPosition
 
+# 以下模块（openai、QtWebEngine、markdown、MCP 服务、全局配置）在面板首次显示或首次使用时才导入，
+# 注册插件时只加载界面骨架。见 benchmarks/import_bench.py
+if TYPE_CHECKING:
+    from app.widgets.side_dock_area.plugins.llm_chatter.compare_panel import ComparePanel
+    from app.widgets.side_dock_area.plugins.llm_chatter.message_card import MessageCard
+    from app.widgets.side_dock_area.plugins.llm_chatter.worker import OpenAIChatWorker
+
+# QtWebEngineWidgets 要么在创建 QApplication 之前导入，要么事先设置共享 OpenGL 上下文；
+# 插件在应用创建前被导入时设置该属性，使 message_card 可以推迟到面板显示时再导入
+if QCoreApplication.instance() is None:
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+
 
 class OpenAIChatToolWindow(ToolWindow):
     name = "大模型对话"
@@ -44,18 +61,66 @@ class OpenAIChatToolWindow(ToolWindow):
     createResponse = pyqtSignal(str)
     contextActionRequested = pyqtSignal(str, str)
     _gen_thread_pool = QThreadPool()
+    _tool_cache = ToolResultCache(max_entries=256)  # 幂等工具结果缓存（按会话隔离）
+    TRANSCRIPT_SLICE_MS = 12  # 渐进重建对话时每个空闲切片创建卡片的时间预算
+    _END = object()  # 待建条目位于对话末尾
 
     def __init__(self, homepage):
         super().__init__(homepage)
         self._gen_thread_pool.setMaxThreadCount(2)  # 限制并发，避免 API 限流
         self.homepage = homepage
-        self._worker: Optional[OpenAIChatWorker] = None
+        # 每个会话各自的生成任务；切换会话不影响后台会话继续生成
+        self._session_workers: Dict[str, "OpenAIChatWorker"] = {}
+        # 仅前台会话的流式卡片会被登记，后台会话只写入 session.streaming_content
+        self._stream_cards: Dict[str, "MessageCard"] = {}
+        # 多模型对比：勾选的配置名、各会话的对比任务与前台对比面板
+        self._compare_names: List[str] = []
+        self._compare_workers: Dict[str, List["OpenAIChatWorker"]] = {}
+        self._compare_panels: Dict[str, "ComparePanel"] = {}
+        self._prefetcher = FollowupPrefetcher()  # 推荐追问的投机预取
+        self._chat_executor = None
         self._is_streaming = False
-        self.session_manager.create_new_session()
+        self._welcome_card = None  # 所有新会话共用的欢迎卡片，首次新建会话时创建
+        # 对话区保留已显示会话的卡片，切换历史模式后按差异更新；需要新建的卡片从底部开始分片创建
+        self._displayed_session_id: Optional[str] = None
+        self._transcript_scroll: Optional[int] = None  # 进入历史模式前对话区的滚动位置
+        self._pending_session: Optional[ChatSession] = None
+        self._pending_entries: List[tuple] = []  # (条目, 插入位置之后的卡片)，自上而下排列，从末尾开始创建
+        self._last_built: Optional[QWidget] = None
+        self._transcript_timer = QTimer(self)
+        self._transcript_timer.setSingleShot(True)
+        self._transcript_timer.timeout.connect(self._build_transcript_slice)
+        # 注册阶段到此为止：执行器、视图池、模型配置、历史与首个会话都推迟到面板首次显示
+        self._initialized = False
         if hasattr(self.homepage, "global_variables_changed"):
-            self.homepage.global_variables_changed.connect(self._load_model_configs)
-        self._initialize_history_manager()
-        self._create_new_session()
+            self.homepage.global_variables_changed.connect(self._on_global_variables_changed)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._ensure_initialized()
+
+    def _ensure_initialized(self):
+        """面板首次显示（或外部首次发起提问）时完成初始化；重复调用直接返回"""
+        if self._initialized:
+            return
+        self._initialized = True
+        started = time.perf_counter()
+        with span("plugin.initialize"):
+            from app.widgets.side_dock_area.plugins.llm_chatter.chat_executor import get_chat_executor
+            from app.widgets.side_dock_area.plugins.llm_chatter.message_card import get_web_view_pool
+
+            self._chat_executor = get_chat_executor()
+            get_web_view_pool().prewarm()  # 空闲时预先创建并加载卡片视图
+            self._load_model_configs()
+            self.session_manager.create_new_session()
+            self._initialize_history_manager()
+            self._create_new_session()
+        logger.info(f"[Startup] 对话面板初始化耗时 {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def _on_global_variables_changed(self, *args):
+        # 未初始化时不必刷新，首次显示会读取最新配置
+        if self._initialized:
+            self._load_model_configs()
 
     def setup_ui(self):
         layout = QVBoxLayout(self)
@@ -77,8 +142,12 @@ class OpenAIChatToolWindow(ToolWindow):
         self.history_btn = TransparentToggleToolButton(FluentIcon.HISTORY, self)
         self.history_btn.setToolTip("历史对话")
         self.history_btn.toggled.connect(self._toggle_history_mode)
+        self.compare_btn = TransparentToggleToolButton(FluentIcon.TILES, self)
+        self.compare_btn.setToolTip("多模型对比")
+        self.compare_btn.toggled.connect(self._toggle_compare_mode)
         left_layout.addWidget(self.new_session_btn)
         left_layout.addWidget(self.history_btn)
+        left_layout.addWidget(self.compare_btn)
         left_layout.addStretch()
         # 右侧保持不变
         right_layout = QHBoxLayout()
@@ -88,7 +157,6 @@ class OpenAIChatToolWindow(ToolWindow):
         right_layout.addWidget(model_label)
 
         self.model_combo = ComboBox(self)
-        self._load_model_configs()
         setFont(self.model_combo, 12)
         right_layout.addWidget(self.model_combo)
         self.settings_btn = TransparentToolButton(FluentIcon.SETTING, self)
@@ -109,12 +177,28 @@ class OpenAIChatToolWindow(ToolWindow):
         self.chat_scroll_area.setWidgetResizable(True)
         self.chat_scroll_area.setViewportMargins(0, 0, 10, 0)
 
-        self.chat_container = QWidget()
+        # 对话卡片与历史列表分属两个容器，进入历史模式只隐藏对话区，不销毁其中的卡片
+        scroll_content = QWidget()
+        scroll_layout = QVBoxLayout(scroll_content)
+        scroll_layout.setContentsMargins(0, 0, 0, 0)
+        scroll_layout.setSpacing(0)
+
+        self.chat_container = QWidget(scroll_content)
         self.chat_layout = QVBoxLayout(self.chat_container)
         self.chat_layout.setContentsMargins(3, 3, 3, 3)
         self.chat_layout.setSpacing(5)
         self.chat_layout.setAlignment(Qt.AlignBottom)  # 关键：防止垂直拉伸
-        self.chat_scroll_area.setWidget(self.chat_container)
+        scroll_layout.addWidget(self.chat_container)
+
+        self.history_container = QWidget(scroll_content)
+        self.history_layout = QVBoxLayout(self.history_container)
+        self.history_layout.setContentsMargins(3, 3, 3, 3)
+        self.history_layout.setSpacing(5)
+        self.history_layout.setAlignment(Qt.AlignTop)
+        self.history_container.hide()
+        scroll_layout.addWidget(self.history_container)
+        self.chat_scroll_area.setWidget(scroll_content)
+        self.chat_scroll_area.verticalScrollBar().rangeChanged.connect(self._on_scroll_range_changed)
 
         layout.addWidget(self.chat_scroll_area, 1)
 
@@ -128,6 +212,7 @@ class OpenAIChatToolWindow(ToolWindow):
         setFont(self.input_area, 15)
         self.input_area.sendMessageRequested.connect(self._on_send_clicked)
         self.input_area.stopMessageRequested.connect(self._on_stop_clicked)
+        self.input_area.textChanged.connect(self._on_input_text_changed)
         layout.addWidget(self.input_area)
 
     def set_system_prompt(self, prompt):
@@ -144,6 +229,8 @@ class OpenAIChatToolWindow(ToolWindow):
         if current_name in self._valid_configs:
             config = self._valid_configs[current_name].copy()
         else:
+            from app.utils.config import Settings
+
             setting = Settings.get_instance()
             config = {
                 "模型名称": setting.llm_model.value,
@@ -170,6 +257,8 @@ class OpenAIChatToolWindow(ToolWindow):
                 self.model_combo.setCurrentIndex(idx)
             InfoBar.success("已更新", "配置已保存并应用。", parent=self, duration=1500)
         else:
+            from app.utils.config import Settings
+
             setting = Settings.get_instance()
             # 更新 cfg 默认配置并持久化
             setting.set(setting.llm_model, new_config["模型名称"])
@@ -188,6 +277,8 @@ class OpenAIChatToolWindow(ToolWindow):
         self._valid_configs.clear()
         self.model_combo.clear()
 
+        from app.utils.config import Settings
+
         setting = Settings.get_instance()
         default_config = {
             "模型名称": setting.llm_model.value,
@@ -235,29 +326,190 @@ class OpenAIChatToolWindow(ToolWindow):
         self._current_history_index = None
         self.history_btn.setChecked(False)
         self._clear_chat_area()
-        # 创建欢迎卡片并标记
-        welcome_card = create_welcome_card(self)
-        welcome_card._is_welcome = True  # ← 关键标记
-        welcome_card.contextActionRequested.connect(self.handle_recommended_question)
-        QTimer.singleShot(300, lambda: self.chat_layout.addWidget(welcome_card))
+        self._displayed_session_id = session.session_id
+        self._show_welcome_card()
+        self._sync_streaming_state()
+
+    def _show_welcome_card(self):
+        """欢迎卡片只创建一次（正文为缓存的 HTML），之后新建会话时直接放回布局"""
+        if self._welcome_card is None:
+            from app.widgets.side_dock_area.plugins.llm_chatter.message_card import create_welcome_card
+
+            self._welcome_card = create_welcome_card(self)
+            self._welcome_card._is_welcome = True  # ← 关键标记
+            self._welcome_card.contextActionRequested.connect(self.handle_recommended_question)
+        self.chat_layout.addWidget(self._welcome_card)
+        self._welcome_card.show()
+
+    def _detach_welcome_card(self):
+        """从布局中移出欢迎卡片但保留视图，供下一个新会话复用"""
+        if self._welcome_card is not None and self.chat_layout.indexOf(self._welcome_card) >= 0:
+            self.chat_layout.removeWidget(self._welcome_card)
+            self._welcome_card.hide()
 
     def _display_current_session(self):
-        """清空布局并重新加载当前会话的所有消息"""
-        self._clear_chat_area()
-
+        """
+        显示当前会话。仍是已显示的会话时把现有卡片与会话消息做序列比对，一致的卡片原样保留，
+        只删除多余的、补建缺少的；换了会话才清空重建。需要新建的卡片从底部（可见部分）开始，在空闲切片中逐批创建。
+        """
+        self._cancel_transcript_build()
         session = self.session_manager.get_current_session()
         if not session:
+            self._clear_chat_area()
             return
-        for msg in session.messages:
-            if msg["role"] == "user":
-                self._append_user_message(msg["content"])
-            elif msg["role"] == "assistant":
-                card = self._append_assistant_message()
-                card.update_content(msg["content"])
+        if session.session_id != self._displayed_session_id:
+            self._clear_chat_area()
+            self._displayed_session_id = session.session_id
+
+        entries = self._transcript_entries(session)
+        widgets = [self.chat_layout.itemAt(i).widget() for i in range(self.chat_layout.count())]
+        if not entries:
+            # 空会话只显示欢迎卡片
+            if widgets != [self._welcome_card] or self._welcome_card is None:
+                self._clear_chat_area()
+                self._show_welcome_card()
+            self._sync_streaming_state()
+            return
+
+        matcher = difflib.SequenceMatcher(None, [self._transcript_widget_key(w) for w in widgets],
+                                          [self._transcript_entry_key(e) for e in entries], autojunk=False)
+        kept: Dict[int, QWidget] = {}
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                kept.update(zip(range(j1, j2), widgets[i1:i2]))
+            else:
+                for widget in widgets[i1:i2]:
+                    self._remove_transcript_widget(widget)
+        if entries[-1][0] == "streaming" and len(entries) - 1 in kept:
+            self._stream_cards[session.session_id] = kept[len(entries) - 1]
+        self._sync_streaming_state()
+
+        scroll, self._transcript_scroll = self._transcript_scroll, None
+        if len(kept) == len(entries):
+            # 未发生变化：恢复进入历史模式前的滚动位置
+            if scroll is not None:
+                QTimer.singleShot(0, lambda: self.chat_scroll_area.verticalScrollBar().setValue(scroll))
+            return
+        # 每个待建条目记下其后紧跟的卡片：保留的卡片、None 表示紧接着创建的下一张、_END 表示末尾
+        pending = []
+        following = self._END
+        for index in reversed(range(len(entries))):
+            if index in kept:
+                following = kept[index]
             else:
-                continue
+                pending.append((entries[index], following))
+                following = None
+        pending.reverse()
+        self._pending_session = session
+        self._pending_entries = pending
+        self._build_transcript_slice()  # 首个切片同步执行，可见的最新消息立即出现
+
+    @staticmethod
+    def _transcript_entries(session: ChatSession) -> List[tuple]:
+        """会话应显示的条目：(kind, role 或 None, 内容)，依次为各条消息以及对比面板或生成中的回复"""
+        entries = [("message", msg["role"], msg["content"])
+                   for msg in session.messages if msg["role"] in ("user", "assistant")]
+        if session.compare_results:
+            entries.append(("compare", None, session.compare_results))
+        # 生成中（或生成失败）的回复从缓冲补齐，之后的增量直接写入该卡片
+        elif session.is_streaming or session.streaming_content:
+            entries.append(("streaming" if session.is_streaming else "partial", "assistant",
+                            session.streaming_content))
+        return entries
+
+    @staticmethod
+    def _transcript_entry_key(entry: tuple) -> tuple:
+        kind, role, content = entry
+        if kind == "compare":
+            return "compare", id(content)
+        if kind == "streaming":
+            return ("streaming",)
+        return role, content
+
+    def _transcript_widget_key(self, widget: QWidget) -> tuple:
+        """
+        卡片的比对键，与 _transcript_entry_key 相等即视为同一条目。比较的是卡片创建时对应的消息内容
+        （source_content），而不是显示文本：工具调用轨迹、缓存提示等只显示在卡片上，不会写入消息。
+        生成中的卡片对应会话的流式条目；欢迎卡片等其它部件不与任何条目相等。
+        """
+        results = getattr(widget, "compare_results", None)
+        if results is not None:
+            return "compare", id(results)
+        if widget is self._welcome_card or getattr(widget, "content_widget", None) is None:
+            return "widget", id(widget)
+        if any(card is widget for card in self._stream_cards.values()):
+            return ("streaming",)
+        return widget.role, getattr(widget, "source_content", None)
+
+    def _remove_transcript_widget(self, widget: QWidget):
+        if widget is self._welcome_card:
+            self._detach_welcome_card()
+            return
+        for registry in (self._stream_cards, self._compare_panels):
+            for key in [key for key, value in registry.items() if value is widget]:
+                registry.pop(key)
+        self.chat_layout.removeWidget(widget)
+        widget.deleteLater()
+
+    def _build_transcript_slice(self, budget_ms: Optional[float] = None):
+        """从底部向上创建待建卡片，用完时间预算后让出事件循环，剩余部分在下一个空闲切片继续"""
+        session = self._pending_session
+        budget_ms = self.TRANSCRIPT_SLICE_MS if budget_ms is None else budget_ms
+        started = time.perf_counter()
+        with span("transcript.build_slice"):
+            while self._pending_entries:
+                (kind, role, content), following = self._pending_entries.pop()
+                if following is self._END:
+                    index = -1
+                else:
+                    # 较早的消息插在其后一张卡片之前
+                    index = self.chat_layout.indexOf(self._last_built if following is None else following)
+                if kind == "compare":
+                    widget = self._append_compare_panel(session, index)
+                elif role == "user":
+                    widget = self._append_user_message(content, index)
+                else:
+                    widget = self._append_assistant_message(index)
+                    widget.update_content(content)
+                    if kind == "streaming":
+                        self._stream_cards[session.session_id] = widget
+                    else:
+                        widget.source_content = content
+                        widget.finish_streaming()
+                self._last_built = widget
+                if (time.perf_counter() - started) * 1000 >= budget_ms:
+                    break
+        if self._pending_entries:
+            self._transcript_timer.start(0)
+        else:
+            self._pending_session = None
+            self._last_built = None
+            QTimer.singleShot(10, self._scroll_to_bottom)
 
-        QTimer.singleShot(10, self._scroll_to_bottom)
+    def _flush_transcript_build(self):
+        """立即建完剩余卡片；按布局位置对应消息下标的操作（删除、重新生成）之前调用"""
+        if not self._pending_entries:
+            return
+        self._transcript_timer.stop()
+        self._build_transcript_slice(budget_ms=float("inf"))
+
+    def _cancel_transcript_build(self):
+        self._transcript_timer.stop()
+        self._pending_entries = []
+        self._pending_session = None
+        self._last_built = None
+
+    def _on_scroll_range_changed(self, _minimum: int, maximum: int):
+        # 渐进重建时较早的卡片插在上方，保持视图停在底部
+        if self._pending_entries and not self._in_history_mode:
+            self.chat_scroll_area.verticalScrollBar().setValue(maximum)
+
+    def _sync_streaming_state(self):
+        """按前台会话是否在生成回复刷新发送 / 停止状态"""
+        session = self.session_manager.get_current_session()
+        self._is_streaming = bool(session and session.is_streaming)
+        self._toggle_send_stop(self._is_streaming)
+        self.input_area.toggle_send_button(not self._is_streaming)
 
     # 历史对话管理
     def _initialize_history_manager(self):
@@ -268,29 +520,47 @@ class OpenAIChatToolWindow(ToolWindow):
 
     def _toggle_history_mode(self, enabled: bool):
         if enabled:
+            if not self._in_history_mode:
+                self._transcript_scroll = self.chat_scroll_area.verticalScrollBar().value()
             self._in_history_mode = True
-            self.chat_layout.setAlignment(Qt.AlignTop)  # 关键：防止垂直拉伸
+            self.chat_container.hide()
+            self.history_container.show()
             self._display_history_sessions()
         else:
-            self._in_history_mode = False
-            self.chat_layout.setAlignment(Qt.AlignBottom)  # 关键：防止垂直拉伸
+            self._show_transcript_view()
             self._display_current_session()
 
+    def _show_transcript_view(self):
+        """退出历史模式：隐藏并清空历史列表，重新显示保留着的对话区"""
+        self._in_history_mode = False
+        self.history_container.hide()
+        self._clear_history_area()
+        self.chat_container.show()
+
+    def _clear_history_area(self):
+        while self.history_layout.count():
+            item = self.history_layout.takeAt(0)
+            if item.widget():
+                item.widget().deleteLater()
+
     def _display_history_sessions(self):
-        self._clear_chat_area()
+        self._clear_history_area()
 
         history_list = self.history_manager.get_history_list()
         if not history_list:
             placeholder = QLabel("暂无历史对话记录", self)
             placeholder.setAlignment(Qt.AlignCenter)
             placeholder.setStyleSheet("color: #999;")
-            self.chat_layout.addWidget(placeholder)
+            self.history_layout.addWidget(placeholder)
             return
 
+        streaming_ids = {s.history_id for s in self.session_manager.get_streaming_sessions()}
         # 倒序显示（最新在上）
         reversed_history = list(enumerate(history_list[::-1]))  # (display_idx, session)
         for display_idx, session in reversed_history:
             title = session['title']
+            if session.get('id') in streaming_ids:
+                title = f"{title}（生成中）"
             last_time = session['last_time']
 
             # 计算原始索引：因为 reversed，原始索引 = total - 1 - display_idx
@@ -300,7 +570,7 @@ class OpenAIChatToolWindow(ToolWindow):
                           self._current_history_index == original_index)
 
             card = self._create_history_card(title, last_time, original_index, is_current=is_current)
-            self.chat_layout.addWidget(card)
+            self.history_layout.addWidget(card)
 
         self._scroll_to_bottom()
 
@@ -343,40 +613,63 @@ class OpenAIChatToolWindow(ToolWindow):
         return card
 
     def _clear_chat_area(self):
+        self._cancel_transcript_build()
+        self._displayed_session_id = None
+        self._transcript_scroll = None
+        self._stream_cards.clear()
+        self._compare_panels.clear()
+        self._detach_welcome_card()
         while self.chat_layout.count():
             item = self.chat_layout.takeAt(0)
             if item.widget():
                 item.widget().deleteLater()
 
     def _delete_history_session(self, index: int):
+        session = self.session_manager.find_by_history_id(self.history_manager.get_history_id(index))
         self.history_manager.delete_history(index)
+        if session is not None:
+            self._clear_tool_cache(session)
         self._display_history_sessions()
 
+    def _clear_tool_cache(self, session: ChatSession):
+        """会话被删除或被替换出内存时，丢弃它的工具结果缓存"""
+        removed = self._tool_cache.clear_scope(session.session_id)
+        if removed:
+            logger.info(f"[ToolCache] 清除会话 {session.session_id} 的 {removed} 条缓存，统计: {self._tool_cache.stats()}")
+
     def _load_history_session(self, index: int):
         messages = self.history_manager.get_session_by_index(index)
         if messages is None:
             return
-        self.session_manager.set_session_from_messages(messages)
+        previous = self.session_manager.get_current_session()
+        self.session_manager.set_session_from_messages(messages, self.history_manager.get_history_id(index))
+        if previous is not None and previous not in self.session_manager.sessions:
+            # 当前会话被载入的历史覆盖，不会再发起请求
+            self._clear_tool_cache(previous)
         self._current_history_index = index  # 关键：标记当前正在编辑哪个历史
-        self._in_history_mode = False
-        self.chat_layout.setAlignment(Qt.AlignBottom)  # 关键：防止垂直拉伸
+        self._show_transcript_view()
         self.history_btn.setChecked(False)
         self._display_current_session()
 
-    def _append_user_message(self, content: str):
+    def _append_user_message(self, content: str, index: int = -1):
+        from app.widgets.side_dock_area.plugins.llm_chatter.message_card import MessageCard
+
         card = MessageCard(
             parent=self, role="user",
             tag_params={key: value for key, value in self.context_selector.context.items()}
         )
+        card.source_content = content  # 对应的消息内容，重新显示会话时据此比对
         card.update_content(content)
         card.finish_streaming()
         card.deleteRequested.connect(lambda: self._delete_message(card))
         card.actionRequested.connect(self._on_code_action)
-        self.chat_layout.addWidget(card)
+        self.chat_layout.insertWidget(index, card)
         self._scroll_to_bottom()
         return card
 
-    def _append_assistant_message(self) -> MessageCard:
+    def _append_assistant_message(self, index: int = -1) -> "MessageCard":
+        from app.widgets.side_dock_area.plugins.llm_chatter.message_card import MessageCard
+
         card = MessageCard(parent=self, role="assistant")
         card.actionRequested.connect(self._on_code_action)
         card.regenerateRequested.connect(lambda: self._regenerate_message(card))
@@ -385,17 +678,18 @@ class OpenAIChatToolWindow(ToolWindow):
             card.contextActionRequested.connect(self.homepage.on_context_action)
         else:
             card.contextActionRequested.connect(self.contextActionRequested.emit)
-        self.chat_layout.addWidget(card)
+        self.chat_layout.insertWidget(index, card)
         self._scroll_to_bottom()
         return card
 
-    def _update_assistant_message(self, card: MessageCard, new_content: str):
+    def _update_assistant_message(self, card: "MessageCard", new_content: str):
         card.update_content(new_content)
         if self._is_streaming:
             self._scroll_to_bottom()
 
-    def _delete_message(self, card: MessageCard):
+    def _delete_message(self, card: "MessageCard"):
         """删除用户消息时，连带删除下一条助手消息（如果存在）"""
+        self._flush_transcript_build()
         # 找到 card 在 layout 中的索引
         card_index = -1
         for i in range(self.chat_layout.count()):
@@ -413,7 +707,7 @@ class OpenAIChatToolWindow(ToolWindow):
         to_remove_indices = [card_index]
         if card.role == "user" and card_index + 1 < self.chat_layout.count():
             next_widget = self.chat_layout.itemAt(card_index + 1).widget()
-            if isinstance(next_widget, MessageCard) and next_widget.role == "assistant":
+            if getattr(next_widget, "role", None) == "assistant":
                 to_remove_indices.append(card_index + 1)
 
         # 从后往前删，避免索引错乱
@@ -428,6 +722,7 @@ class OpenAIChatToolWindow(ToolWindow):
                 session.messages.pop(idx)
 
     def _remove_message_at_index(self, index: int):
+        self._flush_transcript_build()
         if 0 <= index < self.chat_layout.count():
             item = self.chat_layout.itemAt(index)
             if item and item.widget():
@@ -439,7 +734,8 @@ class OpenAIChatToolWindow(ToolWindow):
             if session and 0 <= index < len(session.messages):
                 session.messages.pop(index)
 
-    def _regenerate_message(self, card: MessageCard):
+    def _regenerate_message(self, card: "MessageCard"):
+        self._flush_transcript_build()
         session = self.session_manager.get_current_session()
         if not session:
             return
@@ -460,8 +756,8 @@ class OpenAIChatToolWindow(ToolWindow):
             user_input = "\n".join([value[1] for value in params.values()]) + "\n\n" + user_input + "\n\n回复内容:\n"
         # 删除当前助手消息
         self._delete_message(card)
-        # 重新发送
-        self._on_send_clicked(user_input)
+        # 重新发送（绕过响应缓存，新回答会覆盖旧缓存）
+        self._on_send_clicked(user_input, use_cache=False)
 
     def _on_code_action(self, code: str, action: str="copy"):
         """统一处理代码块操作：插入、新建、复制等"""
@@ -479,6 +775,7 @@ class OpenAIChatToolWindow(ToolWindow):
         ))
 
     def handle_recommended_question(self, content: str, action: str):
+        self._ensure_initialized()
         if action == "ask":
             session = self.session_manager.get_current_session()
             session.add_user_message(
@@ -487,6 +784,8 @@ class OpenAIChatToolWindow(ToolWindow):
             )
             self.input_area.clear()
             self._append_user_message(content)
+            if self._use_prefetched_answer(session, content):
+                return
             self.send_preset_question(content)
 
     def send_preset_question(self, question: str):
@@ -498,6 +797,7 @@ class OpenAIChatToolWindow(ToolWindow):
         """
         if not isinstance(question, str) or not question.strip():
             return
+        self._ensure_initialized()
 
         # 如果处于历史模式，退出历史模式并回到当前会话
         if self._in_history_mode:
@@ -506,24 +806,19 @@ class OpenAIChatToolWindow(ToolWindow):
         # 触发标准发送流程（复用已有逻辑）
         self._on_send_clicked(user_text=question.strip())
 
-    def _on_send_clicked(self, user_text: str = ""):
+    def _on_send_clicked(self, user_text: str = "", use_cache: bool = True):
         # === 防止重复发送：自动中止当前请求 ===
         if self._is_streaming:
             self._on_stop_clicked()  # 安全中止当前 worker
         self.input_area.toggle_send_button(False)
-        # === 安全移除欢迎卡片（动态查找）===
-        welcome_card = None
-        for i in range(self.chat_layout.count()):
-            widget = self.chat_layout.itemAt(i).widget()
-            if isinstance(widget, MessageCard) and getattr(widget, '_is_welcome', False):
-                welcome_card = widget
-                break
-        if welcome_card is not None:
-            self.chat_layout.removeWidget(welcome_card)
-            welcome_card.deleteLater()
+        # === 移出欢迎卡片（保留视图供下次新建会话复用）===
+        self._detach_welcome_card()
 
         # === 原有发送逻辑继续 ===
         session = self.session_manager.get_current_session()
+        self._prefetcher.discard(session.session_id)
+        session.streaming_content = ""
+        session.compare_results = []
         if not user_text:
             user_text = self.input_area.toPlainText().strip()
             if not user_text:
@@ -537,11 +832,204 @@ class OpenAIChatToolWindow(ToolWindow):
 
         selected_name = self.model_combo.currentText()
         llm_config = self._valid_configs.get(selected_name)
+        compare_names = self._get_compare_names()
+        if llm_config and compare_names:
+            self._start_compare(session, user_text, selected_name, compare_names)
+            return
         assistant_card = self._append_assistant_message()
         if not llm_config:
             self._update_assistant_message(assistant_card, "[错误] 模型配置无效")
             return
 
+        messages = self._build_messages(session.messages[:-1], llm_config, user_text)
+
+        self._is_streaming = True
+        session.is_streaming = True
+        self._stream_cards[session.session_id] = assistant_card
+        # 先落盘用户消息，使生成中的会话切走后仍能从历史列表找回
+        self._auto_save_session(session)
+        # 在 _on_send_clicked 中，构建 messages 之后、创建 worker 之前，加入：
+        available_tools = self._get_available_mcp_tools()  # ← 新方法
+
+        worker_cls = self._worker_class(llm_config)
+        worker = worker_cls(
+            messages=messages,
+            llm_config=llm_config,
+            tools=available_tools,  # ← 传入 tools
+            tool_cache=self._tool_cache,
+            session_id=session.session_id,
+            fallback_configs=self._get_fallback_configs(selected_name, llm_config),
+            response_cache=get_response_cache() if is_response_cache_enabled(llm_config) else None,
+            read_cache=use_cache
+        )
+        # 信号绑定到会话而不是卡片：会话切到后台后回复继续写入其缓冲
+        worker.content_received.connect(lambda c, s=session: self._on_content_received(c, s))
+        worker.error_occurred.connect(lambda e, s=session: self._on_error(e, s))
+        worker.finished_with_content.connect(lambda r, s=session: self._on_worker_finished(r, s))
+        worker.tool_trace.connect(lambda t, s=session: self._on_tool_trace(t, s))
+        worker.fallback_used.connect(self._on_fallback_used)
+        worker.response_cached.connect(lambda s=session: self._on_content_received(
+            "> ♻️ 缓存回答（点击重新生成可获取最新回答）\n\n", s))
+        self._session_workers[session.session_id] = worker
+        self._submit_worker(worker)
+
+        self._toggle_send_stop(True)
+
+    def _worker_class(self, llm_config: Dict):
+        """按配置选择 asyncio 引擎任务或线程池 worker；openai 客户端随首个请求才导入"""
+        if self._use_async_engine(llm_config):
+            from app.widgets.side_dock_area.plugins.llm_chatter.async_engine import AsyncChatJob
+            return AsyncChatJob
+        from app.widgets.side_dock_area.plugins.llm_chatter.worker import OpenAIChatWorker
+        return OpenAIChatWorker
+
+    def _submit_worker(self, worker: "OpenAIChatWorker"):
+        from app.widgets.side_dock_area.plugins.llm_chatter.async_engine import AsyncChatJob, get_async_engine
+
+        if isinstance(worker, AsyncChatJob):
+            get_async_engine().submit(worker)
+        else:
+            self._chat_executor.submit(worker)
+
+    def _promote_worker(self, worker: "OpenAIChatWorker"):
+        """后台任务转为用户正在等待的回答：在调度器与执行器中都提升到交互优先级"""
+        from app.widgets.side_dock_area.plugins.llm_chatter.async_engine import AsyncChatJob
+
+        if isinstance(worker, AsyncChatJob):
+            worker.promote()
+        else:
+            self._chat_executor.promote(worker)
+
+    # ========== 多模型对比 ==========
+    def _toggle_compare_mode(self, enabled: bool):
+        if not enabled:
+            return
+        menu = CheckableMenu(parent=self, indicatorType=MenuIndicatorType.CHECK)
+        for name in self._valid_configs:
+            action = QAction(name, menu)
+            action.setCheckable(True)
+            action.setChecked(name in self._compare_names)
+            action.toggled.connect(lambda checked, n=name: self._on_compare_model_toggled(n, checked))
+            menu.addAction(action)
+        menu.exec(self.compare_btn.mapToGlobal(QPoint(0, self.compare_btn.height())))
+        if len(self._compare_names) < 2:
+            self.compare_btn.setChecked(False)
+            InfoBar.warning("未开启对比", "请至少勾选两个模型配置。", parent=self, duration=2000)
+
+    def _on_compare_model_toggled(self, name: str, checked: bool):
+        if checked and name not in self._compare_names:
+            self._compare_names.append(name)
+        elif not checked and name in self._compare_names:
+            self._compare_names.remove(name)
+
+    def _get_compare_names(self) -> List[str]:
+        """对比模式开启时返回参与对比的有效配置名，否则返回空列表"""
+        if not self.compare_btn.isChecked():
+            return []
+        names = [name for name in self._compare_names if name in self._valid_configs]
+        return names if len(names) >= 2 else []
+
+    def _start_compare(self, session: ChatSession, user_text: str, selected_name: str, compare_names: List[str]):
+        """将同一组消息并发发送给多个模型，各自流式写入对比面板的一列（仅提供只读工具）"""
+        # 消息按当前选中的模型组装一次，所有模型收到完全相同的输入
+        base_name = selected_name if selected_name in compare_names else compare_names[0]
+        messages = self._build_messages(session.messages[:-1], self._valid_configs[base_name], user_text)
+        # 同一问题会被 N 个模型并发执行：只提供只读（可缓存）的工具，避免有副作用的工具对同一画布重复执行
+        available_tools = [tool for tool in self._get_available_mcp_tools() if get_tool_cache_ttl(tool) is not None]
+
+        results = [{"name": name, "content": "", "metrics": None, "error": "", "done": False}
+                   for name in compare_names]
+        session.compare_results = results
+        session.is_streaming = True
+        self._is_streaming = True
+        self._append_compare_panel(session)
+        self._auto_save_session(session)
+
+        workers = []
+        for index, name in enumerate(compare_names):
+            llm_config = self._valid_configs[name]
+            worker_cls = self._worker_class(llm_config)
+            # 对比模式不启用备用模型，保证每列的指标来自所选端点
+            worker = worker_cls(
+                messages=messages,
+                llm_config=llm_config,
+                tools=available_tools,
+                tool_cache=self._tool_cache,
+                session_id=session.session_id,
+            )
+            results[index]["metrics"] = worker.metrics
+            worker.content_received.connect(
+                lambda c, s=session, r=results, i=index: self._on_compare_content(c, s, r, i))
+            worker.error_occurred.connect(lambda e, r=results, i=index: r[i].update(error=e))
+            worker.finished.connect(lambda s=session, r=results, i=index: self._on_compare_done(s, r, i))
+            workers.append(worker)
+        self._compare_workers[session.session_id] = workers
+        for worker in workers:
+            self._submit_worker(worker)
+        self._toggle_send_stop(True)
+
+    def _append_compare_panel(self, session: ChatSession, index: int = -1) -> "ComparePanel":
+        from app.widgets.side_dock_area.plugins.llm_chatter.compare_panel import ComparePanel
+
+        results = session.compare_results
+        panel = ComparePanel(self, [entry["name"] for entry in results], self)
+        panel.compare_results = results  # 重新显示会话时据此判断面板是否仍然对应当前结果
+        for column, entry in zip(panel.columns, results):
+            column.card.actionRequested.connect(self._on_code_action)
+            column.card.contextActionRequested.connect(self.handle_recommended_question)
+            column.append_content(entry["content"] + entry["error"])
+            if entry["done"]:
+                column.set_finished(entry["metrics"], entry["error"])
+        panel.keepRequested.connect(lambda i, s=session, r=results: self._keep_compare_result(s, r, i))
+        if session.is_streaming:
+            self._compare_panels[session.session_id] = panel
+        self.chat_layout.insertWidget(index, panel)
+        self._scroll_to_bottom()
+        return panel
+
+    def _on_compare_content(self, content_piece: str, session: ChatSession, results: List[Dict], index: int):
+        results[index]["content"] += content_piece
+        panel = self._compare_panels.get(session.session_id)
+        if panel is not None and session.compare_results is results:
+            panel.columns[index].append_content(content_piece)
+            self._scroll_to_bottom()
+
+    def _on_compare_done(self, session: ChatSession, results: List[Dict], index: int):
+        entry = results[index]
+        entry["done"] = True
+        metrics = entry["metrics"]
+        metrics.error = entry["error"]
+        get_metrics_recorder().record(metrics, session_id=session.session_id, compare=entry["name"])
+        if session.compare_results is not results:
+            return  # 对比已被新的提问替换
+        panel = self._compare_panels.get(session.session_id)
+        if panel is not None:
+            if entry["error"]:
+                panel.columns[index].append_content(entry["error"])
+            panel.columns[index].set_finished(metrics, entry["error"])
+        if all(item["done"] for item in results):
+            self._compare_workers.pop(session.session_id, None)
+            self._compare_panels.pop(session.session_id, None)
+            session.is_streaming = False
+            if session is self.session_manager.get_current_session():
+                self._sync_streaming_state()
+
+    def _keep_compare_result(self, session: ChatSession, results: List[Dict], index: int):
+        """把选中的回答写入会话，其余回答丢弃"""
+        if session.compare_results is not results or not results[index]["done"]:
+            return
+        for worker in self._compare_workers.pop(session.session_id, []):
+            if worker.isRunning():
+                self._cancel_worker(worker)
+        session.compare_results = []
+        session.is_streaming = False
+        session.add_assistant_message(content=results[index]["content"])
+        self._auto_save_session(session)
+        if session is self.session_manager.get_current_session():
+            self._display_current_session()
+
+    def _build_messages(self, history: List[Dict], llm_config: Dict, user_text: str) -> List[Dict]:
+        """组装发送给模型的消息：系统提示 + 历史文本 + 当前用户消息（按模型能力决定是否多模态）"""
         # 构建系统消息
         messages = []
         system_prompt = (self._system_prompt + llm_config.get("系统提示", "").strip()).strip()
@@ -549,7 +1037,7 @@ class OpenAIChatToolWindow(ToolWindow):
             messages.append({"role": "system", "content": system_prompt})
 
         # 添加历史消息（注意：历史消息必须是纯文本，不能含 image_url）
-        for msg in session.messages[:-1]:
+        for msg in history:
             # 历史消息只保留文本，丢弃图片（或你也可设计历史支持图片，但需更复杂处理）
             if isinstance(msg["content"], list):
                 # 如果历史中已有多模态，只取 text 部分（简化处理）
@@ -576,74 +1064,162 @@ class OpenAIChatToolWindow(ToolWindow):
             # 回退到纯文本
             context_text = self.context_selector.get_text_context()
             messages.append({"role": "user", "content": context_text + user_text})
+        return messages
+
+    def _end_session_stream(self, session: ChatSession) -> Optional["MessageCard"]:
+        """结束会话的生成状态，返回其前台卡片（会话不在前台时为 None）"""
+        session.is_streaming = False
+        self._session_workers.pop(session.session_id, None)
+        card = self._stream_cards.pop(session.session_id, None)
+        if session is self.session_manager.get_current_session():
+            self._sync_streaming_state()
+        return card
 
-        self._is_streaming = True
-        # 在 _on_send_clicked 中，构建 messages 之后、创建 worker 之前，加入：
-        available_tools = self._get_available_mcp_tools()  # ← 新方法
-
-        self._worker = OpenAIChatWorker(
-            messages=messages,
-            llm_config=llm_config,
-            tools=available_tools  # ← 传入 tools
+    def _on_error(self, error: str, session: ChatSession):
+        session.streaming_content += error
+        worker = self._session_workers.get(session.session_id)
+        card = self._end_session_stream(session)
+        if card is not None:
+            card.update_content(error)
+            card.source_content = session.streaming_content  # 未完成的回复保留在缓冲中
+        self._record_metrics(worker, card, error)
+
+    def _on_worker_finished(self, response: str, session: ChatSession):
+        session.streaming_content = ""
+        worker = self._session_workers.get(session.session_id)
+        card = self._end_session_stream(session)
+        if card is not None:
+            card.source_content = response  # 与写入会话的消息一致（不含工具轨迹与缓存提示）
+            card.finish_streaming()
+        self._record_metrics(worker, card)
+        session.add_assistant_message(content=response)
+        # ✅ 自动保存会话到历史（会话可能已在后台）
+        current_title = self._auto_save_session(session)
+        # self._generate_conversation_title(current_title, session.messages)
+        if worker is not None:
+            self._prefetch_followups(session, response, worker.llm_config)
+
+    def _record_metrics(self, worker: Optional["OpenAIChatWorker"], card: Optional["MessageCard"], error: str = ""):
+        """
+        补充卡片的渲染次数与耗时后写入指标日志；配置开启“显示性能指标”时在卡片底部显示。
+        会话在后台生成时没有前台卡片，只记录网络侧指标。
+        """
+        if worker is None:
+            return
+        metrics = worker.metrics
+        metrics.finish()  # 信号先于 run() 退出到达，这里以回复送达主线程的时刻为准
+        metrics.error = error
+        if card is not None:
+            metrics.set_render_stats(card.content_widget.render_count, card.content_widget.render_ms)
+        get_metrics_recorder().record(metrics, session_id=worker.session_id)
+        if card is not None and worker.llm_config.get("显示性能指标", False):
+            card.set_metrics(metrics)
+
+    # ========== 推荐追问预取 ==========
+    def _prefetch_followups(self, session: ChatSession, response: str, llm_config: Dict):
+        """
+        配置开启“预取追问”时，以后台优先级提前生成前 K 个推荐问题的回答（受 Token 预算限制）。
+        预取只提供只读（可缓存）的工具，避免投机请求产生副作用。
+        llm_config 为刚生成该回答的 worker 的配置：会话可能在后台完成，或用户已切换了下拉框中的模型。
+        """
+        if not llm_config.get("预取追问", False):
+            return
+        questions = extract_followup_questions(response)[:int(llm_config.get("预取数量", 2))]
+        if not questions:
+            return
+        budget = int(llm_config.get("预取Token预算", 8000))
+        tools = [tool for tool in self._get_available_mcp_tools() if get_tool_cache_ttl(tool) is not None]
+        worker_cls = self._worker_class(llm_config)
+        self._prefetcher.discard(session.session_id)
+        for question in questions:
+            messages = self._build_messages(session.messages, llm_config, question)
+            cost = estimate_tokens(messages) + int(llm_config.get("最大Token", 2048))
+            if cost > budget:
+                break
+            budget -= cost
+            worker = worker_cls(
+                messages=messages,
+                llm_config=llm_config,
+                tools=tools,
+                tool_cache=self._tool_cache,
+                session_id=session.session_id,
+                priority=PRIORITY_BACKGROUND,
+                response_cache=get_response_cache() if is_response_cache_enabled(llm_config) else None
+            )
+            self._prefetcher.add(session.session_id, question, worker, len(session.messages))
+            self._submit_worker(worker)
+
+    def _use_prefetched_answer(self, session: ChatSession, question: str) -> bool:
+        """点击的推荐问题已预取时直接从缓冲展示（未完成的继续流式写入），返回是否命中"""
+        if not self._prefetcher.has_pending():
+            return False
+        entry = self._prefetcher.take(session.session_id, question, len(session.messages) - 1)
+        if entry is None:
+            return False
+        if self._is_streaming:
+            self._on_stop_clicked()
+        self._promote_worker(entry.worker)
+        session.streaming_content = ""
+        session.compare_results = []
+        assistant_card = self._append_assistant_message()
+        session.is_streaming = True
+        self._stream_cards[session.session_id] = assistant_card
+        self._session_workers[session.session_id] = entry.worker
+        self._auto_save_session(session)
+        self._sync_streaming_state()
+        entry.attach(
+            lambda c, s=session: self._on_content_received(c, s),
+            lambda e, s=session: self._on_error(e, s),
+            lambda r, s=session: self._on_worker_finished(r, s),
         )
-        self._worker.content_received.connect(lambda c: self._on_content_received(c, assistant_card))
-        self._worker.error_occurred.connect(lambda e: self._on_error(e, assistant_card))
-        self._worker.finished_with_content.connect(lambda r: self._on_worker_finished(r, assistant_card))
-        self._worker.start()
+        return True
 
-        self._toggle_send_stop(True)
+    def _on_input_text_changed(self):
+        # 用户开始输入其他问题：预取结果大概率用不上，立即释放占用的请求额度
+        if self._prefetcher.has_pending() and self.input_area.toPlainText().strip():
+            self._prefetcher.discard()
 
-    def _on_error(self, error: str, card: MessageCard):
-        card.update_content(error)
-        self._is_streaming = False
-        self._toggle_send_stop(False)
-        self.input_area.toggle_send_button(True)
-
-    def _on_worker_finished(self, response: str, card: MessageCard):
-        self._is_streaming = False
-        card.finish_streaming()
-        self.input_area.toggle_send_button(True)
-        self._toggle_send_stop(False)
-        session = self.session_manager.get_current_session()
-        if session:
-            session.add_assistant_message(content=response)
-            # ✅ 自动保存当前会话到历史
-            current_title = self._auto_save_current_session()
-            # self._generate_conversation_title(current_title, session.messages)
-
-    def _auto_save_current_session(self):
-        """根据当前状态决定保存方式"""
-        session = self.session_manager.get_current_session()
+    def _auto_save_session(self, session: ChatSession):
+        """根据会话绑定的历史记录决定保存方式"""
         if not session or not session.messages:
             return
 
-        if self._current_history_index is not None:
+        index = self.history_manager.index_of(session.history_id)
+        if index is not None:
             # 正在续聊某个历史会话 → 更新它
-            self.history_manager.update_session(self._current_history_index, session.messages)
+            self.history_manager.update_session(index, session.messages)
         else:
-            # 全新会话 → 新增一条历史记录（首次保存）
-            self.history_manager.save_session(session.messages)
-            # 保存后，自动绑定到新历史索引（避免重复保存）
-            self._current_history_index = 0  # 因为 save_session 是 insert(0, ...)
-
-        return self.history_manager.get_current_title(self._current_history_index)
+            # 全新会话 → 新增一条历史记录（首次保存），并绑定其 id 避免重复保存
+            session.history_id = self.history_manager.save_session(session.messages)
+            index = self.history_manager.index_of(session.history_id)
+
+        # 新增记录会插入到最前，前台会话的历史索引需要随之刷新
+        current = self.session_manager.get_current_session()
+        if current is not None and current.history_id:
+            self._current_history_index = self.history_manager.index_of(current.history_id)
+        if self._in_history_mode:
+            self._display_history_sessions()
+        return self.history_manager.get_current_title(index)
 
     def _toggle_send_stop(self, is_sending: bool):
-        if is_sending:
-            self.model_combo.setDisabled(True)
-            self.history_btn.setDisabled(True)
-        else:
-            self.model_combo.setDisabled(False)
-            self.history_btn.setDisabled(False)
+        # 生成期间仍可切换会话 / 查看历史，回复会在后台继续写入原会话
+        self.model_combo.setDisabled(is_sending)
 
     def _on_stop_clicked(self):
-        if self._worker and self._worker.isRunning():
-            self._worker.cancel()
-            self._worker = None  # 可选：等待线程真正结束（避免 race condition）
-        self._worker = None
-        self._is_streaming = False
-        self._toggle_send_stop(False)
-        self.input_area.toggle_send_button(True)
+        session = self.session_manager.get_current_session()
+        worker = self._session_workers.get(session.session_id) if session else None
+        if worker and worker.isRunning():
+            self._cancel_worker(worker)
+        if session:
+            for entry in session.compare_results:
+                if not entry["done"]:
+                    entry["error"] = "[已取消] 用户手动中止请求"
+            for compare_worker in self._compare_workers.pop(session.session_id, []):
+                if compare_worker.isRunning():
+                    self._cancel_worker(compare_worker)
+            card = self._end_session_stream(session)
+            if card is not None:
+                card.source_content = session.streaming_content  # 中止时已输出的部分保留在缓冲中
         InfoBar.warning(
             title='已中止',
             content="问答请求已被手动中止。",
@@ -654,8 +1230,58 @@ class OpenAIChatToolWindow(ToolWindow):
             parent=self
         )
 
-    def _on_content_received(self, content_piece: str, assistant_card: MessageCard):
-        self._update_assistant_message(assistant_card, content_piece)
+    def _get_fallback_configs(self, selected_name: str, llm_config: Dict) -> List[Dict]:
+        """读取配置中的“备用模型”（配置名列表或逗号分隔字符串），按顺序返回有效配置"""
+        names = llm_config.get("备用模型") or []
+        if isinstance(names, str):
+            names = [name.strip() for name in names.replace("，", ",").split(",")]
+        return [self._valid_configs[name] for name in names
+                if name and name != selected_name and name in self._valid_configs]
+
+    def _on_fallback_used(self, model_name: str):
+        InfoBar.info(
+            title='已切换备用模型',
+            content=f"主模型暂不可用，本次回复由 {model_name} 生成。",
+            orient=Qt.Horizontal,
+            isClosable=True,
+            position=InfoBarPosition.TOP_RIGHT,
+            duration=3000,
+            parent=self
+        )
+
+    def _cancel_worker(self, worker: "OpenAIChatWorker"):
+        """
+        断开信号并关闭连接后立即返回，不在 GUI 线程上等待任务退出（调用方随即更新界面）；
+        关闭连接已能让任务迅速结束，执行器继续跟踪它，退出时在 finished 中记录中止耗时。
+        """
+        for signal in (worker.content_received, worker.error_occurred,
+                       worker.finished_with_content, worker.tool_trace, worker.fallback_used,
+                       worker.response_cached):
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass
+        worker.finished.connect(lambda w=worker: logger.info(
+            f"[Cancel] worker 已退出，中止耗时 {(w.cancel_latency or 0) * 1000:.0f} ms"))
+        worker.cancel()
+
+    def _on_content_received(self, content_piece: str, session: ChatSession):
+        session.streaming_content += content_piece
+        card = self._stream_cards.get(session.session_id)
+        if card is not None:
+            self._update_assistant_message(card, content_piece)
+
+    def _on_tool_trace(self, trace: dict, session: ChatSession):
+        """在卡片中展示工具调用轨迹（仅用于显示，不写入会话内容）"""
+        if trace["event"] == "call":
+            line = f"\n\n> 🔧 调用工具 `{trace['name']}`\n\n"
+        elif trace.get("error"):
+            line = f"\n\n> ❌ `{trace['tool_name']}` 失败：{trace['error']}\n\n"
+        elif trace.get("cached"):
+            line = f"\n\n> ♻️ `{trace['tool_name']}` 命中缓存\n\n"
+        else:
+            line = f"\n\n> ✅ `{trace['tool_name']}` 完成（{trace.get('elapsed', 0):.2f}s）\n\n"
+        self._on_content_received(line, session)
 
     # 对话标题总结
     def _generate_conversation_title(self, current_title: str, messages: List[Dict]):
@@ -668,6 +1294,13 @@ class OpenAIChatToolWindow(ToolWindow):
         if not llm_config:
             return
 
+        if self._use_async_engine(llm_config):
+            from app.widgets.side_dock_area.plugins.llm_chatter.async_engine import get_async_engine
+            get_async_engine().submit_title(current_title, messages, llm_config, self._on_title_generated)
+            return
+
+        from app.widgets.side_dock_area.plugins.llm_chatter.worker import TitleGenerationTask
+
         # 创建任务
         task = TitleGenerationTask(
             current_title=current_title,
@@ -677,6 +1310,13 @@ class OpenAIChatToolWindow(ToolWindow):
         )
         self._gen_thread_pool.start(task)
 
+    @staticmethod
+    def _use_async_engine(llm_config: Dict) -> bool:
+        """模型配置中开启“异步引擎”或设置环境变量 LLM_CHATTER_ASYNC=1 时，请求走单线程 asyncio 引擎"""
+        if os.environ.get("LLM_CHATTER_ASYNC") == "1":
+            return True
+        return bool(llm_config.get("异步引擎", False))
+
     def _on_title_generated(self, raw_output: str, error_msg: str = None):
         """从模型输出中提取 ```title ... ``` 中的标题"""
         if not raw_output:
@@ -701,6 +1341,8 @@ class OpenAIChatToolWindow(ToolWindow):
 
     def _get_available_mcp_tools(self) -> List[Dict]:
         """从 MCP 服务器或注册表中获取当前可用的工具定义"""
+        from app.mcp_server.stdio_server import GlobalMcpServer
+
         exports_dir = Path(r"D:\work\CanvasMind\canvas_files\projects")
         server = GlobalMcpServer(exports_dir)
         return server.handle_initialize(None)
\ No newline at end of file
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+流式 Markdown 渲染的纯函数部分（不依赖 Qt）：补全未闭合语法、注入上下文标签与思考卡片、
+Markdown 转 HTML 以及代码块增强。CodeWebViewer 每次渲染调用 render_markdown_body，
+基准测试可直接导入本模块。
+"""
+import re
+from html import escape
+from typing import Dict, Optional
+
+from app.widgets.side_dock_area.plugins.llm_chatter.profiling import span
+
+# ======== Markdown 实例 ========
+_md_instance = None
+ACTION_COLOR_MAP = {
+    "jump":   "#FFA500",   # 橙色
+    "create": "#9370DB",   # 皇家蓝
+    "generate":   "#32CD32",   # 石灰绿
+    "ask": "#FF6347",   # 番茄红
+    "view":   "#4169E1",   # 中紫色
+}
+DEFAULT_COLOR = "#888888"  # 未知类型兜底色
+
+
+def get_markdown_instance():
+    global _md_instance
+    if _md_instance is None:
+        from markdown import Markdown  # 首次渲染时才加载 markdown 及其扩展
+
+        _md_instance = Markdown(
+            extensions=['fenced_code', 'nl2br', 'tables'],
+            output_format='html5',
+            safe=False
+        )
+    return _md_instance
+
+
+def _unwrap_code_blocks_with_context_links(md_text: str) -> str:
+    """
+    如果代码块（```...```）内部包含 [xxx](yyy) 格式的上下文链接，
+    则移除 ``` 包裹，使其作为普通 Markdown 段落渲染，
+    从而让 [xxx](yyy) 能被正常转换为 context-tag。
+    """
+    def replacer(match):
+        lang_part = match.group(1) or ""
+        code_content = match.group(2)
+        # 检查是否包含 [xxx](yyy) 模式（允许有空格）
+        if re.search(r'\[[^\[\]]+\]\([^)\s]+\)', code_content) and lang_part in ("text"):
+            # 包含上下文链接 → 返回未包裹的原始内容（保留语言标识？不保留）
+            return code_content
+        else:
+            # 不包含 → 保留原样
+            if lang_part:
+                return f'```{lang_part}\n{code_content}```'
+            else:
+                return f'```\n{code_content}```'
+
+    # 匹配所有 ```...``` 代码块（包括带语言和不带语言的）
+    pattern = re.compile(r'```(\w*)\n(.*?)```', re.DOTALL)
+    return pattern.sub(replacer, md_text)
+
+
+# ======== 代码块原文登记 ========
+class CodePayloadRegistry:
+    """
+    单个查看器的代码块原文表。HTML 中的按钮只引用 block id（按出现顺序编号，流式追加时保持稳定），
+    点击时再按 id 取回原文，避免每个代码块在文档中内嵌多份 base64 副本。
+    """
+
+    def __init__(self):
+        self._payloads: Dict[str, str] = {}
+
+    def reset(self):
+        self._payloads.clear()
+
+    def register(self, code: str) -> str:
+        block_id = f"code-{len(self._payloads)}"
+        self._payloads[block_id] = code
+        return block_id
+
+    def get(self, block_id: str) -> Optional[str]:
+        return self._payloads.get(block_id)
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+
+# ======== Web 专用：代码块增强（使用 Pygments + 完整 CSS）========
+def _wrap_code_blocks_with_copy_button_web(html: str, registry: Optional[CodePayloadRegistry] = None) -> str:
+    """为代码块加上行号与操作按钮，代码原文登记到 registry（未提供时使用临时表）"""
+    registry = registry if registry is not None else CodePayloadRegistry()
+
+    def replacer(match):
+        lang = (match.group(1) or "").replace("language-", "").strip()
+        code_content_raw = match.group(2) or ""
+
+        try:
+            copy_text = code_content_raw.replace("&lt;", "<") \
+                .replace("&gt;", ">") \
+                .replace("&amp;", "&") \
+                .replace("&#39;", "'") \
+                .replace("&quot;", '"')
+        except:
+            copy_text = code_content_raw
+
+        block_id = registry.register(copy_text)
+
+        # —————— 关键：我们自己生成表格，不依赖 Pygments 行号 ——————
+        try:
+            from pygments import highlight
+            from pygments.lexers import get_lexer_by_name, TextLexer
+            from pygments.formatters import HtmlFormatter
+
+            lexer = get_lexer_by_name(lang, stripall=False) if lang else TextLexer()
+            formatter = HtmlFormatter(
+                style='dracula',
+                linenos=False,
+                noclasses=True,
+                cssclass='code-block',
+                prestyles='margin:0; padding:0; background:transparent; font-family: Consolas, monospace; font-size:13px; color:#D4D4D4;'
+            )
+            highlighted_code = highlight(copy_text, lexer, formatter)
+        except Exception:
+            highlighted_code = f'<pre style="margin:0; padding:0; background:transparent; font-family: Consolas, monospace; font-size:13px; color:#D4D4D4;">{escape(copy_text)}</pre>'
+
+        # —————— 手动构造带行号的表格 ——————
+        lines = copy_text.splitlines() or [""]
+        max_line = len(str(len(lines)))
+        line_numbers_html = "\n".join(
+            f'<td class="lineno" data-line="{i + 1}">{str(i + 1).rjust(max_line)}</td>'
+            for i in range(len(lines))
+        )
+        try:
+            import re as preg
+            pre_match = preg.search(r'<pre[^>]*>(.*?)</pre>', highlighted_code, preg.DOTALL)
+            if pre_match:
+                inner_html = pre_match.group(1)
+                code_lines = inner_html.split('\n')
+                if len(code_lines) < len(lines):
+                    code_lines.extend([''] * (len(lines) - len(code_lines)))
+            else:
+                code_lines = [escape(line) for line in lines]
+        except:
+            code_lines = [escape(line) for line in lines]
+
+        code_lines_html = "\n".join(f'<td class="code-line">{line}</td>' for line in code_lines)
+        table_rows = "\n".join(
+            f'<tr>{line_numbers_html.splitlines()[i]}{code_lines_html.splitlines()[i]}</tr>'
+            for i in range(len(lines))
+        )
+
+        table_html = f'''
+        <table class="code-table">
+            <tbody>
+                {table_rows}
+            </tbody>
+        </table>
+        '''
+
+        return f'''
+        <div data-block="{block_id}" style="
+            position: relative;
+            margin: 16px 0;
+            background: #1E1E1E;
+            border: 1px solid #3A3F47;
+            border-radius: 6px;
+            box-shadow: 0 2px 8px rgba(0,0,0,0.3);
+            font-family: Consolas, monospace;
+            font-size: 13px;
+        ">
+            <!-- 顶部工具栏区域（固定，不滚动） -->
+            <div style="
+                display: flex;
+                justify-content: space-between;
+                align-items: center;
+                padding: 6px 8px;
+                height: 28px;
+                background: rgba(30,30,30,0.8);
+                border-bottom: 1px solid #333;
+            ">
+                <!-- 左侧：语言标签 -->
+                {f'<span style="color: #FFA500; font-size: 13px; font-weight: bold;">{lang}</span>' if lang else '<span style="color: #888;">Plain Text</span>'}
+
+                <!-- 右侧：按钮组 -->
+                <div style="display: flex; gap: 15px; align-items: center; padding-right: 4px;">
+                    <button type="button" class="code-action" data-action="insert" title="插入代码">
+                        <img src="qrc:/icons/插入.svg" />
+                    </button>
+                    <button type="button" class="code-action" data-action="create" title="新建组件">
+                        <img src="qrc:/icons/新建.svg" />
+                    </button>
+                    <button type="button" class="code-action" data-action="copy" title="复制代码">
+                        <img src="qrc:/icons/复制.svg" />
+                    </button>
+                </div>
+            </div>
+
+            <!-- 可横向滚动的代码区域（仅此处滚动） -->
+            <div style="
+                padding: 8px 10px;
+                overflow-x: auto;
+                overflow-y: hidden;
+                scrollbar-width: thin;
+                -ms-overflow-style: -ms-autohiding-scrollbar;
+            ">
+                {table_html}
+            </div>
+        </div>
+        '''
+    pattern = r'<pre><code(?:\s+class="([^"]*)")?>(.*?)</code></pre>'
+    return re.sub(pattern, replacer, html, flags=re.DOTALL)
+
+# ======== 辅助函数（保持不变）========
+def _sanitize_incomplete_markdown(md_text: str) -> str:
+    if not md_text.strip():
+        return md_text
+    if md_text.count('```') % 2 == 1:
+        md_text += '\n```'
+    if not md_text.endswith('\n'):
+        md_text += '\n'
+    return md_text
+
+
+def _render_think_block(content: str, completed: bool = True) -> str:
+    content = (content.replace("&", "&amp;")
+               .replace("<", "&lt;")
+               .replace(">", "&gt;")
+               .replace('"', "&quot;"))
+    status_text = "💡 思考过程" if completed else "🧠 正在思考..."
+
+    open_attr = ' open' if not completed else ''
+
+    return f'''
+<details{open_attr} class="think-block" style="
+    margin: 12px 0;
+    background: #252D38;
+    border: 1px solid #3A3F47;
+    border-radius: 8px;
+    padding: 12px;
+    font-size: 13px;
+    color: #CCCCCC;
+">
+    <summary style="
+        cursor: pointer;
+        color: #FFA500;
+        font-weight: bold;
+        list-style: none;
+        outline: none;
+    ">{status_text}</summary>
+    <div style="margin-top: 8px; white-space: pre-wrap;">{content}</div>
+</details>
+'''
+
+
+def _inject_think_cards(md_text: str, completed: bool = True) -> str:
+    parts = []
+    i = 0
+    while i < len(md_text):
+        start_idx = md_text.find("<think>", i)
+        if start_idx == -1:
+            parts.append(md_text[i:])
+            break
+        parts.append(md_text[i:start_idx])
+        end_idx = md_text.find("</think>", start_idx + len("<think>"))
+        if end_idx != -1:
+            content = md_text[start_idx + len("<think>"):end_idx]
+            parts.append(_render_think_block(content, completed=True))
+            i = end_idx + len("</think>")
+        else:
+            content = md_text[start_idx + len("<think>"):]
+            parts.append(_render_think_block(content, completed=False))
+            i = len(md_text)
+    return ''.join(parts)
+
+
+def _inject_context_links(md_text: str) -> str:
+    """
+    将 [content](action) 转为可点击的 <span class="context-tag"> 标签
+    不再使用 <a>，避免链接行为和渲染异常
+    """
+    def replacer(match):
+        content = match.group(1)  # 如 "数据加载器"
+        action = match.group(2)   # 如 "jump"
+
+        # 安全编码，防止 XSS 或 JS 注入
+        import urllib.parse
+        encoded_content = urllib.parse.quote(content, safe='')
+        encoded_action = urllib.parse.quote(action, safe='')
+        return (
+            f'<span class="context-tag" '
+            f'data-type="{action}" '
+            f'data-content="{encoded_content}" '
+            f'data-action="{encoded_action}">'
+            f'{escape(content)}'
+            f'</span>'
+        )
+
+    return re.sub(r'`*\[([^\[\]]+?)\]\(([^)\s]+)\)`*', replacer, md_text)
+
+
+def render_markdown_body(md_text: str, completed: bool = False,
+                         registry: Optional[CodePayloadRegistry] = None) -> str:
+    """
+    流式 Markdown 文本 → HTML 正文的完整流程，Markdown 转换失败时退回转义后的纯文本。
+    registry 收集本次渲染的代码块原文（调用前应先 reset）。
+    """
+    if not md_text.strip():
+        return ""
+    with span("markdown.sanitize"):
+        safe_md = _sanitize_incomplete_markdown(md_text)
+    with span("markdown.unwrap_code_links"):
+        safe_md = _unwrap_code_blocks_with_context_links(safe_md)
+    with span("markdown.context_links"):
+        safe_md = _inject_context_links(safe_md)
+    with span("markdown.think_cards"):
+        processed_md = _inject_think_cards(safe_md, completed=completed)
+
+    try:
+        with span("markdown.convert", chars=len(processed_md)):
+            md = get_markdown_instance()
+            md.reset()
+            html_body = md.convert(processed_md)
+        with span("markdown.wrap_code"):
+            return _wrap_code_blocks_with_copy_button_web(html_body, registry)
+    except Exception:
+        return (md_text
+                .replace('&', '&amp;')
+                .replace('<', '&lt;')
+                .replace('>', '&gt;')
+                .replace('\n', '<br>'))
+
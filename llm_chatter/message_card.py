@@ -1,18 +1,18 @@
 # -*- coding: utf-8 -*-
-import base64
-import re
-import urllib
+import urllib.parse
+import json
+import time
 from datetime import datetime
-from html import escape
+from typing import Dict, List, Optional
 
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QUrl, QPoint
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal, pyqtSlot, QUrl, QPoint, QObject
 from PyQt5.QtGui import QWheelEvent
+from PyQt5.QtWebChannel import QWebChannel
 from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QSizePolicy, QApplication
 )
-from markdown import Markdown
 from qfluentwidgets import (
     FluentIcon, ToolTipFilter, TransparentToolButton,
     CardWidget, CaptionLabel, InfoBar, InfoBarPosition
@@ -25,299 +25,104 @@ try:
 except ImportError:
     ContextRegistry = None
 
-# ======== Markdown 实例 ========
-_md_instance = None
-ACTION_COLOR_MAP = {
-    "jump":   "#FFA500",   # 橙色
-    "create": "#9370DB",   # 皇家蓝
-    "generate":   "#32CD32",   # 石灰绿
-    "ask": "#FF6347",   # 番茄红
-    "view":   "#4169E1",   # 中紫色
-}
-DEFAULT_COLOR = "#888888"  # 未知类型兜底色
-
-
-def get_markdown_instance():
-    global _md_instance
-    if _md_instance is None:
-        _md_instance = Markdown(
-            extensions=['fenced_code', 'nl2br', 'tables'],
-            output_format='html5',
-            safe=False
-        )
-    return _md_instance
+from app.widgets.side_dock_area.plugins.llm_chatter.profiling import traced
+from app.widgets.side_dock_area.plugins.llm_chatter.web_shell import get_web_shell
+from app.widgets.side_dock_area.plugins.llm_chatter.welcome import WELCOME_MD, get_welcome_html
+
+# 纯函数渲染逻辑位于 markdown_render（无 Qt 依赖），此处保留原有名称的导入
+from app.widgets.side_dock_area.plugins.llm_chatter.markdown_render import (  # noqa: F401
+    ACTION_COLOR_MAP, DEFAULT_COLOR, CodePayloadRegistry, get_markdown_instance, render_markdown_body,
+    _sanitize_incomplete_markdown, _unwrap_code_blocks_with_context_links, _inject_context_links,
+    _inject_think_cards, _render_think_block, _wrap_code_blocks_with_copy_button_web
+)
 
 
-def _unwrap_code_blocks_with_context_links(md_text: str) -> str:
+# ======== 内容高度同步：合并所有卡片的高度变化，每帧统一应用一次 ========
+class HeightSyncScheduler(QObject):
     """
-    如果代码块（```...```）内部包含 [xxx](yyy) 格式的上下文链接，
-    则移除 ``` 包裹，使其作为普通 Markdown 段落渲染，
-    从而让 [xxx](yyy) 能被正常转换为 context-tag。
+    各卡片上报的内容高度先记入待处理表（同一卡片只保留最新值），
+    约一帧后统一设置高度，再对涉及的父容器各调用一次 updateGeometry，使整个列表只重新布局一次。
     """
-    def replacer(match):
-        lang_part = match.group(1) or ""
-        code_content = match.group(2)
-        # 检查是否包含 [xxx](yyy) 模式（允许有空格）
-        if re.search(r'\[[^\[\]]+\]\([^)\s]+\)', code_content) and lang_part in ("text"):
-            # 包含上下文链接 → 返回未包裹的原始内容（保留语言标识？不保留）
-            return code_content
-        else:
-            # 不包含 → 保留原样
-            if lang_part:
-                return f'```{lang_part}\n{code_content}```'
-            else:
-                return f'```\n{code_content}```'
-
-    # 匹配所有 ```...``` 代码块（包括带语言和不带语言的）
-    pattern = re.compile(r'```(\w*)\n(.*?)```', re.DOTALL)
-    return pattern.sub(replacer, md_text)
-
-
-# ======== Web 专用：代码块增强（使用 Pygments + 完整 CSS）========
-def _wrap_code_blocks_with_copy_button_web(html: str) -> str:
-    def replacer(match):
-        lang = (match.group(1) or "").replace("language-", "").strip()
-        code_content_raw = match.group(2) or ""
-
-        try:
-            copy_text = code_content_raw.replace("&lt;", "<") \
-                .replace("&gt;", ">") \
-                .replace("&amp;", "&") \
-                .replace("&#39;", "'") \
-                .replace("&quot;", '"')
-        except:
-            copy_text = code_content_raw
-
-        b64_copy = base64.b64encode(copy_text.encode('utf-8')).decode('ascii')
-
-        # —————— 关键：我们自己生成表格，不依赖 Pygments 行号 ——————
-        try:
-            from pygments import highlight
-            from pygments.lexers import get_lexer_by_name, TextLexer
-            from pygments.formatters import HtmlFormatter
-
-            lexer = get_lexer_by_name(lang, stripall=False) if lang else TextLexer()
-            formatter = HtmlFormatter(
-                style='dracula',
-                linenos=False,
-                noclasses=True,
-                cssclass='code-block',
-                prestyles='margin:0; padding:0; background:transparent; font-family: Consolas, monospace; font-size:13px; color:#D4D4D4;'
-            )
-            highlighted_code = highlight(copy_text, lexer, formatter)
-        except Exception:
-            highlighted_code = f'<pre style="margin:0; padding:0; background:transparent; font-family: Consolas, monospace; font-size:13px; color:#D4D4D4;">{escape(copy_text)}</pre>'
-
-        # —————— 手动构造带行号的表格 ——————
-        lines = copy_text.splitlines() or [""]
-        max_line = len(str(len(lines)))
-        line_numbers_html = "\n".join(
-            f'<td class="lineno" data-line="{i + 1}">{str(i + 1).rjust(max_line)}</td>'
-            for i in range(len(lines))
-        )
-        try:
-            import re as preg
-            pre_match = preg.search(r'<pre[^>]*>(.*?)</pre>', highlighted_code, preg.DOTALL)
-            if pre_match:
-                inner_html = pre_match.group(1)
-                code_lines = inner_html.split('\n')
-                if len(code_lines) < len(lines):
-                    code_lines.extend([''] * (len(lines) - len(code_lines)))
-            else:
-                code_lines = [escape(line) for line in lines]
-        except:
-            code_lines = [escape(line) for line in lines]
-
-        code_lines_html = "\n".join(f'<td class="code-line">{line}</td>' for line in code_lines)
-        table_rows = "\n".join(
-            f'<tr>{line_numbers_html.splitlines()[i]}{code_lines_html.splitlines()[i]}</tr>'
-            for i in range(len(lines))
-        )
+    FRAME_MS = 16
+
+    def __init__(self):
+        super().__init__()
+        self._pending: Dict["MessageCard", int] = {}
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.FRAME_MS)
+        self._timer.timeout.connect(self._flush)
+
+    def submit(self, card: "MessageCard", height: int):
+        self._pending[card] = max(1, height)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def discard(self, card: "MessageCard"):
+        self._pending.pop(card, None)
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        parents = []
+        for card, height in pending.items():
+            try:
+                if card.content_widget.minimumHeight() == height:
+                    continue
+                card.content_widget.setMinimumHeight(height)
+                card.updateGeometry()
+                parent = card.parentWidget()
+            except RuntimeError:
+                continue  # 卡片已被删除
+            if parent is not None and parent not in parents:
+                parents.append(parent)
+        for parent in parents:
+            parent.updateGeometry()
 
-        table_html = f'''
-        <table class="code-table">
-            <tbody>
-                {table_rows}
-            </tbody>
-        </table>
-        '''
-
-        return f'''
-        <div style="
-            position: relative;
-            margin: 16px 0;
-            background: #1E1E1E;
-            border: 1px solid #3A3F47;
-            border-radius: 6px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.3);
-            font-family: Consolas, monospace;
-            font-size: 13px;
-        ">
-            <!-- 顶部工具栏区域（固定，不滚动） -->
-            <div style="
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                padding: 6px 8px;
-                height: 28px;
-                background: rgba(30,30,30,0.8);
-                border-bottom: 1px solid #333;
-            ">
-                <!-- 左侧：语言标签 -->
-                {f'<span style="color: #FFA500; font-size: 13px; font-weight: bold;">{lang}</span>' if lang else '<span style="color: #888;">Plain Text</span>'}
-
-                <!-- 右侧：按钮组 -->
-                <div style="display: flex; gap: 15px; align-items: center; padding-right: 4px;">
-                    <button type="button" data-action="insert" data-copy="{b64_copy}" style="
-                        width: 28px;
-                        height: 28px;
-                        background: transparent;
-                        border: none;
-                        cursor: pointer;
-                        display: flex;
-                        align-items: center;
-                        justify-content: center;
-                        padding: 0;
-                        border-radius: 4px;
-                    " title="插入代码">
-                        <img src="qrc:/icons/插入.svg" style="width:20px; height:20px; pointer-events: none;" />
-                    </button>
-                    <button type="button" data-action="create" data-copy="{b64_copy}" style="
-                        width: 28px;
-                        height: 28px;
-                        background: transparent;
-                        border: none;
-                        cursor: pointer;
-                        display: flex;
-                        align-items: center;
-                        justify-content: center;
-                        padding: 0;
-                        border-radius: 4px;
-                    " title="新建组件">
-                        <img src="qrc:/icons/新建.svg" style="width:20px; height:20px; pointer-events: none;" />
-                    </button>
-                    <button type="button" data-action="copy" data-copy="{b64_copy}" style="
-                        width: 28px;
-                        height: 28px;
-                        background: transparent;
-                        border: none;
-                        cursor: pointer;
-                        display: flex;
-                        align-items: center;
-                        justify-content: center;
-                        padding: 0;
-                        border-radius: 4px;
-                    " title="复制代码">
-                        <img src="qrc:/icons/复制.svg" style="width:20px; height:20px; pointer-events: none;" />
-                    </button>
-                </div>
-            </div>
-
-            <!-- 可横向滚动的代码区域（仅此处滚动） -->
-            <div style="
-                padding: 8px 10px;
-                overflow-x: auto;
-                overflow-y: hidden;
-                scrollbar-width: thin;
-                -ms-overflow-style: -ms-autohiding-scrollbar;
-            ">
-                {table_html}
-            </div>
-        </div>
-        '''
-    pattern = r'<pre><code(?:\s+class="([^"]*)")?>(.*?)</code></pre>'
-    return re.sub(pattern, replacer, html, flags=re.DOTALL)
-
-# ======== 辅助函数（保持不变）========
-def _sanitize_incomplete_markdown(md_text: str) -> str:
-    if not md_text.strip():
-        return md_text
-    if md_text.count('```') % 2 == 1:
-        md_text += '\n```'
-    if not md_text.endswith('\n'):
-        md_text += '\n'
-    return md_text
-
-
-def _render_think_block(content: str, completed: bool = True) -> str:
-    content = (content.replace("&", "&amp;")
-               .replace("<", "&lt;")
-               .replace(">", "&gt;")
-               .replace('"', "&quot;"))
-    status_text = "💡 思考过程" if completed else "🧠 正在思考..."
-
-    open_attr = ' open' if not completed else ''
-
-    return f'''
-<details{open_attr} class="think-block" style="
-    margin: 12px 0;
-    background: #252D38;
-    border: 1px solid #3A3F47;
-    border-radius: 8px;
-    padding: 12px;
-    font-size: 13px;
-    color: #CCCCCC;
-">
-    <summary style="
-        cursor: pointer;
-        color: #FFA500;
-        font-weight: bold;
-        list-style: none;
-        outline: none;
-    ">{status_text}</summary>
-    <div style="margin-top: 8px; white-space: pre-wrap;">{content}</div>
-</details>
-'''
-
-
-def _inject_think_cards(md_text: str, completed: bool = True) -> str:
-    parts = []
-    i = 0
-    while i < len(md_text):
-        start_idx = md_text.find("<think>", i)
-        if start_idx == -1:
-            parts.append(md_text[i:])
-            break
-        parts.append(md_text[i:start_idx])
-        end_idx = md_text.find("</think>", start_idx + len("<think>"))
-        if end_idx != -1:
-            content = md_text[start_idx + len("<think>"):end_idx]
-            parts.append(_render_think_block(content, completed=True))
-            i = end_idx + len("</think>")
-        else:
-            content = md_text[start_idx + len("<think>"):]
-            parts.append(_render_think_block(content, completed=False))
-            i = len(md_text)
-    return ''.join(parts)
+
+_height_sync: Optional[HeightSyncScheduler] = None
+
+
+def get_height_sync() -> HeightSyncScheduler:
+    global _height_sync
+    if _height_sync is None:
+        _height_sync = HeightSyncScheduler()
+    return _height_sync
 
 
-def _inject_context_links(md_text: str) -> str:
+# ======== WebChannel 桥接对象：页面 → Python 的类型化调用 ========
+class ChatBridge(QObject):
     """
-    将 [content](action) 转为可点击的 <span class="context-tag"> 标签
-    不再使用 <a>，避免链接行为和渲染异常
+    通过 QWebChannel 暴露给页面的对象（JS 中为 chatBridge）。
+    代码块操作只传 block id，代码原文由 Python 侧按 id 查找；页面也可调用 payload(id) 取回原文。
     """
-    def replacer(match):
-        content = match.group(1)  # 如 "数据加载器"
-        action = match.group(2)   # 如 "jump"
-
-        # 安全编码，防止 XSS 或 JS 注入
-        import urllib.parse
-        encoded_content = urllib.parse.quote(content, safe='')
-        encoded_action = urllib.parse.quote(action, safe='')
-        return (
-            f'<span class="context-tag" '
-            f'data-type="{action}" '
-            f'data-content="{encoded_content}" '
-            f'data-action="{encoded_action}">'
-            f'{escape(content)}'
-            f'</span>'
-        )
+    codeActionRequested = pyqtSignal(str, str)  # (block id, action)
+    contextActionRequested = pyqtSignal(str, str)  # (content, action)
+    heightReported = pyqtSignal(int)
+
+    def __init__(self, resolve_payload, parent=None):
+        super().__init__(parent)
+        self._resolve_payload = resolve_payload
 
-    return re.sub(r'`*\[([^\[\]]+?)\]\(([^)\s]+)\)`*', replacer, md_text)
+    @pyqtSlot(str, str)
+    def codeAction(self, block_id: str, action: str):
+        self.codeActionRequested.emit(block_id, action)
 
-# ======== 自定义 WebEnginePage：监听 console.log ========
+    @pyqtSlot(str, str)
+    def contextAction(self, content: str, action: str):
+        self.contextActionRequested.emit(content, action)
+
+    @pyqtSlot(int)
+    def reportHeight(self, height: int):
+        self.heightReported.emit(height)
+
+    @pyqtSlot(str, result=str)
+    def payload(self, block_id: str) -> str:
+        return self._resolve_payload(block_id) or ""
+
+
+# ======== 自定义 WebEnginePage：监听 console.log（WebChannel 不可用时的兜底协议）========
 class ConsoleMonitorPage(QWebEnginePage):
-    codeActionRequested = pyqtSignal(str, str)  # (code: str, action: str)
+    codeActionRequested = pyqtSignal(str, str)  # (block id, action)
     contextActionRequested = pyqtSignal(str, str)  # (type, content, action)
     heightReported = pyqtSignal(int)
 
@@ -334,14 +139,12 @@ class ConsoleMonitorPage(QWebEnginePage):
                         self.contextActionRequested.emit(content, action)
                 except Exception:
                     pass
-            elif msg.count(":") == 2:
-                # 处理 copy/insert/create 等旧格式
-                _, action, b64_payload = msg.split(":")
-                try:
-                    text = base64.b64decode(b64_payload).decode('utf-8')
-                    self.codeActionRequested.emit(text, action)
-                except Exception:
-                    pass
+            elif msg.startswith("pywebview_action:code|||"):
+                # 代码块操作只携带 block id，原文由查看器按 id 查找
+                parts = msg.split("|||")
+                if len(parts) == 3:
+                    _, action, block_id = parts
+                    self.codeActionRequested.emit(block_id, action)
         elif msg.startswith("pywebview_height:"):
             try:
                 h = int(msg[len("pywebview_height:"):])
@@ -353,6 +156,7 @@ class ConsoleMonitorPage(QWebEnginePage):
 # ======== 核心：CodeWebViewer（基于 QWebEngineView）========
 class CodeWebViewer(QWebEngineView):
     contentHeightChanged = pyqtSignal(int)
+    contentRendered = pyqtSignal()  # 最新正文已显示到页面（外壳加载完成或 setBody 执行完毕）
     codeActionRequested = pyqtSignal(str, str)  # (code, action)
     contextActionRequested = pyqtSignal(str, str)  # (type, content, action)
 
@@ -362,10 +166,21 @@ class CodeWebViewer(QWebEngineView):
         self._streaming = True
         self._html_timer = None
         self._completed = False
-        self._resize_timer = None  # 用于 debounce 的定时器
+        self._content_height = -1  # 最近一次上报的内容高度，未变化时不再通知卡片
+        self.render_count = 0  # 渲染次数与累计耗时（毫秒），写入请求指标
+        self.render_ms = 0.0
+        self._payloads = CodePayloadRegistry()  # 当前页面中代码块的原文，按 block id 查找
+        self._shell_requested = False
+        self._shell_loaded = False
+        self._pending_body: Optional[str] = None
         # 使用自定义 Page 以捕获 console.log
         self._page = ConsoleMonitorPage(self)
         self.setPage(self._page)
+        # WebChannel 挂在 page 上，setHtml 重新加载后依然有效
+        self._bridge = ChatBridge(self._payloads.get, self)
+        self._channel = QWebChannel(self._page)
+        self._channel.registerObject("chatBridge", self._bridge)
+        self._page.setWebChannel(self._channel)
 
         self.setAttribute(Qt.WA_TranslucentBackground)
         self.page().setBackgroundColor(Qt.transparent)
@@ -374,242 +189,79 @@ class CodeWebViewer(QWebEngineView):
         self.setMinimumHeight(1)
 
         # 连接信号
-        self._page.codeActionRequested.connect(self.codeActionRequested.emit)
+        self._page.codeActionRequested.connect(self._on_code_block_action)
         self._page.contextActionRequested.connect(self.contextActionRequested.emit)
         self._page.heightReported.connect(self._on_js_height_reported)
+        self._bridge.codeActionRequested.connect(self._on_code_block_action)
+        self._bridge.contextActionRequested.connect(self.contextActionRequested.emit)
+        self._bridge.heightReported.connect(self._on_js_height_reported)
 
         self.loadFinished.connect(self._on_load_finished)
 
+    def _load_shell(self):
+        shell = get_web_shell()
+        base_path = shell.base_path()
+        self._shell_requested = True
+        self.setHtml(shell.html(), QUrl.fromLocalFile(base_path) if base_path else QUrl(""))
+
     def _on_load_finished(self, ok: bool):
-        if ok:
-            QTimer.singleShot(100, self._request_content_height)
+        if not ok:
+            self._shell_requested = False  # 下次渲染时重新加载外壳
+            return
+        self._shell_loaded = True
+        if self._pending_body is not None:
+            body, self._pending_body = self._pending_body, None
+            self.page().runJavaScript(f"setBody({json.dumps(body)});", self._on_body_applied)
+        else:
+            self.contentRendered.emit()
+        # 页面在 WebChannel 就绪前可能已经上报过一次，这里补一次强制上报兜底
+        self._request_content_height()
 
-    def _on_js_height_reported(self, height: int):
-        self.contentHeightChanged.emit(height)
+    def _on_body_applied(self, _result=None):
+        self.contentRendered.emit()
 
-    def _render(self):
+    def _on_js_height_reported(self, height: int):
+        if height != self._content_height:
+            self._content_height = height
+            self.contentHeightChanged.emit(height)
 
-        def _generate_context_tag_css():
-            css_rules = []
-            for act_type, color in ACTION_COLOR_MAP.items():
-                css_rules.append(
-                    f'.context-tag[data-type="{act_type}"] {{ '
-                    f'background: {color}20; '  # 20 = 12.5% 透明度（十六进制后加 20）
-                    f'border-color: {color}; '
-                    f'color: {color}; '
-                    f'}}\n'
-                    f'.context-tag[data-type="{act_type}"]:hover {{ '
-                    f'background: {color}40; '  # 40 ≈ 25% 透明度
-                    f'border-color: {color}aa; '  # 加亮一点
-                    f'transform: translateY(-1px); '
-                    f'}}'
-                )
-            # 默认兜底
-            css_rules.append(
-                f'.context-tag[data-type="other"], .context-tag:not([data-type]) {{ '
-                f'background: {DEFAULT_COLOR}20; '
-                f'border-color: {DEFAULT_COLOR}; '
-                f'color: {DEFAULT_COLOR}; '
-                f'}}'
-            )
-            return "\n".join(css_rules)
+    def _on_code_block_action(self, block_id: str, action: str):
+        code = self._payloads.get(block_id)
+        if code is not None:
+            self.codeActionRequested.emit(code, action)
 
-        if not self._markdown_text.strip():
-            html_body = ""
+    @traced("render")
+    def _render(self):
+        started = time.perf_counter()
+        self._payloads.reset()
+        html_body = render_markdown_body(self._markdown_text, completed=self._completed, registry=self._payloads)
+        self._apply_body(html_body)
+        self.render_count += 1
+        self.render_ms += (time.perf_counter() - started) * 1000
+
+    def _apply_body(self, html_body: str):
+        # 外壳页面（样式与脚本）只加载一次，之后只替换正文
+        if self._shell_loaded:
+            self.page().runJavaScript(f"setBody({json.dumps(html_body)});", self._on_body_applied)
+        elif self._shell_requested:
+            self._pending_body = html_body  # 外壳加载完成后再应用
         else:
-            safe_md = _sanitize_incomplete_markdown(self._markdown_text)
-            safe_md = _unwrap_code_blocks_with_context_links(safe_md)
-            safe_md = _inject_context_links(safe_md)
-            processed_md = _inject_think_cards(safe_md, completed=self._completed)
-
-            try:
-                md = get_markdown_instance()
-                md.reset()
-                html_body = md.convert(processed_md)
-                html_body = _wrap_code_blocks_with_copy_button_web(html_body)
-            except Exception:
-                html_body = (self._markdown_text
-                             .replace('&', '&amp;')
-                             .replace('<', '&lt;')
-                             .replace('>', '&gt;')
-                             .replace('\n', '<br>'))
-
-        full_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <style>
-                html, body {{
-                    background: transparent !important;
-                    color: white;
-                    font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Helvetica, Arial, sans-serif;
-                    font-size: 14px;
-                    line-height: 1.5;
-                    margin: 0;
-                    padding: 4px 0;
-                    overflow: hidden;
-                    height: auto;
-                    min-height: 1px;
-                }}
-                body > * {{
-                    max-width: 100%;
-                    overflow-wrap: break-word;
-                }}
-                .context-tag {{
-                    display: inline-block;
-                    padding: 2px 6px;
-                    margin: 0 2px;
-                    border: 1px solid;
-                    border-radius: 4px;
-                    font-size: 13px;
-                    font-weight: 500;
-                    cursor: pointer;
-                    user-select: none;
-                    transition: all 0.2s ease;
-                    /* 基础样式，具体颜色由 data-type 覆盖 */
-                }}
-                /* 动态生成的类型专属样式 */
-                {_generate_context_tag_css()}
-                .context-tag:hover {{
-                    background: rgba(255, 165, 0, 0.3);
-                    border-color: #FFB733;
-                    transform: translateY(-1px);
-                }}
-                pre, code {{
-                    white-space: pre-wrap;
-                    word-break: break-all;
-                }}
-                details {{
-                    margin: 12px 0;
-                    background: #252D38;
-                    border: 1px solid #3A3F47;
-                    border-radius: 8px;
-                    padding: 12px;
-                    font-size: 13px;
-                    color: #CCCCCC;
-                }}
-                summary {{
-                    color: #FFA500;
-                    font-weight: bold;
-                    cursor: pointer;
-                    outline: none;
-                    list-style: none;
-                }}
-                button[data-copy] {{
-                    z-index: 10;
-                }}
-                .code-table {{
-                    border-collapse: collapse;
-                    width: auto;
-                    min-width: 100%;
-                    white-space: nowrap;
-                    margin: 0;
-                    font-family: Consolas, monospace;
-                    font-size: 13px;
-                    color: #D4D4D4;
-                }}
-                .code-table td {{
-                    padding: 0;
-                    vertical-align: top;
-                    border: none;
-                }}
-                .code-table .lineno {{
-                    user-select: none;
-                    width: 28px !important;          /* ← 固定宽度 */
-                    -webkit-user-select: none;
-                    color: #666 !important;
-                    padding-right: 4px !important;
-                    border-right: 1px solid #444444 !important;
-                    text-align: right;
-                    white-space: nowrap;
-                    min-width: 2.2em;
-                }}
-                .code-table .code-line {{
-                    white-space: pre;
-                    padding-left: 8px;
-                    background: transparent !important;
-                }}
-                [style*="overflow-x: auto"]::-webkit-scrollbar {{
-                    height: 10px;
-                }}
-                [style*="overflow-x: auto"]::-webkit-scrollbar-track {{
-                    background: #252526;
-                    border-radius: 5px;
-                }}
-                [style*="overflow-x: auto"]::-webkit-scrollbar-thumb {{
-                    background: #454545;
-                    border-radius: 5px;
-                    border: 1px solid #3c3c3c;
-                }}
-                [style*="overflow-x: auto"]::-webkit-scrollbar-thumb:hover {{
-                    background: #5a5a5a;
-                }}
-            </style>
-        </head>
-        <body>
-            {html_body}
-            <script>
-                document.addEventListener('click', function(e) {{
-                    const btn = e.target.closest('button[data-action]');
-                    if (btn) {{
-                        e.preventDefault();
-                        const action = btn.getAttribute('data-action');
-                        const b64 = btn.getAttribute('data-copy');
-                        const text = atob(b64);
-                        if (navigator.clipboard && action === 'copy') {{
-                            navigator.clipboard.writeText(text).catch(() => {{
-                                console.log('pywebview_action:copy:' + b64);
-                            }});
-                        }} else {{
-                            console.log('pywebview_action:' + action + ':' + b64);
-                        }}
-                    }}
-                }});
-                document.addEventListener('click', function(e) {{
-                    const tag = e.target.closest('.context-tag');
-                    if (tag) {{
-                        e.preventDefault();
-                        const content = tag.getAttribute('data-content');
-                        const action = tag.getAttribute('data-action');
-                        if (content && action) {{
-                            console.log('pywebview_action:context|||' + content + '|||' + action);
-                        }}
-                    }}
-                }});
-                function reportHeight() {{
-                    const h = document.body.scrollHeight;
-                    console.log('pywebview_height:' + h);
-                }}
-            
-                document.addEventListener('DOMContentLoaded', function() {{
-                    setTimeout(reportHeight, 100);
-                    document.querySelectorAll('details.think-block').forEach(el => {{
-                        el.addEventListener('toggle', () => setTimeout(reportHeight, 20));
-                    }});
-                }});
-                if (window.ResizeObserver) {{
-                    const resizeObserver = new ResizeObserver(() => {{
-                        // 延迟一点，等 relayout 完成
-                        setTimeout(reportHeight, 30);
-                    }});
-                    resizeObserver.observe(document.body);
-                }} else {{
-                    // 降级：监听 window resize（不够精确，但兼容旧版）
-                    window.addEventListener('resize', () => setTimeout(reportHeight, 100));
-                }}
-                window.pywebview = {{
-                    reportHeight: reportHeight
-                }};
-            </script>
-        </body>
-        </html>
-        """
-        self.setHtml(full_html, QUrl(""))
-        QTimer.singleShot(100, self._request_content_height)
+            # 初始正文也经 setBody 清理后插入，不直接拼进页面源码
+            self._pending_body = html_body
+            self._load_shell()
+
+    def show_rendered(self, markdown_text: str, html_body: str):
+        """直接显示已渲染好的静态内容（如欢迎卡片），跳过 Markdown 渲染管线"""
+        if self._html_timer is not None:
+            self._html_timer.stop()
+        self._markdown_text = markdown_text
+        self._streaming = False
+        self._completed = True
+        self._payloads.reset()
+        self._apply_body(html_body)
 
     def _request_content_height(self):
-        self.page().runJavaScript("reportHeight();")
+        self.page().runJavaScript("reportHeight(true);")
 
     def append_chunk(self, text: str):
         if not text:
@@ -640,18 +292,6 @@ class CodeWebViewer(QWebEngineView):
             return False
         return True
 
-    def resizeEvent(self, event):
-        super().resizeEvent(event)
-        # 取消之前的定时器（关键！实现 debounce）
-        if self._resize_timer:
-            self._resize_timer.stop()
-            self._resize_timer.deleteLater()
-        # 创建新定时器
-        self._resize_timer = QTimer()
-        self._resize_timer.setSingleShot(True)
-        self._resize_timer.timeout.connect(self._request_content_height)
-        self._resize_timer.start(10)  # 80ms 足够响应拖拽结束
-
     def wheelEvent(self, event: QWheelEvent):
         # 获取滚动条（向上找 QScrollArea）
         scroll_area = self.parent().parent.chat_scroll_area
@@ -666,6 +306,94 @@ class CodeWebViewer(QWebEngineView):
 
         super().wheelEvent(event)
 
+    def reset(self):
+        """回收到视图池前清空内容与外部连接；外壳页面保持加载，只清空正文"""
+        if self._html_timer is not None:
+            self._html_timer.stop()
+        for signal in (self.contentHeightChanged, self.codeActionRequested,
+                       self.contextActionRequested, self.contentRendered):
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass
+        self._markdown_text = ""
+        self._streaming = True
+        self._completed = False
+        self._content_height = -1
+        self.render_count = 0
+        self.render_ms = 0.0
+        self._payloads.reset()
+        self._pending_body = None
+        self.setMinimumHeight(1)
+        if self._shell_loaded:
+            self.page().runJavaScript("lastHeight = -1; setBody('');")
+
+
+# ======== 预热的 WebView 池 ========
+class WebViewPool(QObject):
+    """
+    预先创建并加载好外壳页面的 CodeWebViewer，新建卡片时直接取用，省去 Chromium 创建页面与首次加载的开销。
+    卡片删除时视图回收到池中（超出容量则销毁）；池在空闲时逐个补充，避免一次性阻塞界面。
+    """
+    DEFAULT_SIZE = 3
+    REFILL_INTERVAL_MS = 200
+
+    def __init__(self, size: int = DEFAULT_SIZE):
+        super().__init__()
+        self.size = size
+        self._idle: List[CodeWebViewer] = []
+        self._refill_timer = QTimer(self)
+        self._refill_timer.setSingleShot(True)
+        self._refill_timer.setInterval(self.REFILL_INTERVAL_MS)
+        self._refill_timer.timeout.connect(self._refill_one)
+
+    def prewarm(self):
+        self._schedule_refill()
+
+    def acquire(self, parent: QWidget) -> CodeWebViewer:
+        view = None
+        while self._idle and view is None:
+            candidate = self._idle.pop()
+            try:
+                candidate.setParent(parent)
+                candidate.show()  # release() 时显式隐藏过，重新挂到卡片后需取消隐藏，否则卡片空白
+                view = candidate
+            except RuntimeError:
+                continue  # 视图已随应用退出被销毁
+        if view is None:
+            view = CodeWebViewer(parent)
+        self._schedule_refill()
+        return view
+
+    def release(self, view: CodeWebViewer):
+        if len(self._idle) >= self.size:
+            view.deleteLater()
+            return
+        view.reset()
+        view.hide()
+        view.setParent(None)
+        self._idle.append(view)
+
+    def _schedule_refill(self):
+        if len(self._idle) < self.size and not self._refill_timer.isActive():
+            self._refill_timer.start()
+
+    def _refill_one(self):
+        view = CodeWebViewer()
+        view._load_shell()
+        self._idle.append(view)
+        self._schedule_refill()
+
+
+_web_view_pool: Optional[WebViewPool] = None
+
+
+def get_web_view_pool() -> WebViewPool:
+    global _web_view_pool
+    if _web_view_pool is None:
+        _web_view_pool = WebViewPool()
+    return _web_view_pool
+
 
 # ======== MessageCard（适配 WebViewer）========
 class TagWidget(CardWidget):
@@ -703,6 +431,8 @@ class MessageCard(SimpleCardWidget):
         self.role = role
         self.context_tags = tag_params or {}
         self.timestamp = timestamp or datetime.now().strftime('%H:%M')
+        self.stats_label = None  # 性能浮层，开启“显示性能指标”时按需创建
+        self.source_content: Optional[str] = None  # 卡片对应的会话消息内容，由对话窗口设置
         self.setup_ui()
 
     def setup_ui(self):
@@ -790,7 +520,7 @@ class MessageCard(SimpleCardWidget):
             main_layout.addWidget(tags_container)
             main_layout.addWidget(CardSeparator(self))
 
-        self.content_widget = CodeWebViewer(self)
+        self.content_widget = get_web_view_pool().acquire(self)
         self.content_widget.contextActionRequested.connect(self.contextActionRequested.emit)
         self.content_widget.contentHeightChanged.connect(self._on_content_height_changed)
         self.content_widget.codeActionRequested.connect(
@@ -834,15 +564,38 @@ class MessageCard(SimpleCardWidget):
                 executor(callback_params, tag)
 
     def _on_content_height_changed(self, height):
-        self.content_widget.setMinimumHeight(max(1, height))
-        self.updateGeometry()
-        QTimer.singleShot(20, lambda: self.parentWidget().updateGeometry() if self.parentWidget() else None)
+        get_height_sync().submit(self, height)
 
     def update_content(self, new_content: str):
-        self.content_widget.append_chunk(new_content)
+        if self.content_widget is not None:
+            self.content_widget.append_chunk(new_content)
+
+    def set_metrics(self, metrics):
+        """在卡片底部显示本次请求的性能指标，悬停查看明细"""
+        if self.stats_label is None:
+            self.stats_label = CaptionLabel(self)
+            self.stats_label.setStyleSheet("color: #8A94A6;")
+            self.stats_label.installEventFilter(ToolTipFilter(self.stats_label))
+            self.layout().addWidget(self.stats_label)
+        self.stats_label.setText(metrics.summary() + f" · 渲染 {metrics.render_count} 次 / {metrics.render_ms:.0f} ms")
+        self.stats_label.setToolTip(metrics.detail())
 
     def finish_streaming(self):
-        self.content_widget.finish_streaming()
+        if self.content_widget is not None:
+            self.content_widget.finish_streaming()
+
+    def release_view(self):
+        """把内容视图归还视图池，之后卡片不再显示内容"""
+        view, self.content_widget = self.content_widget, None
+        if view is None:
+            return
+        get_height_sync().discard(self)
+        self.layout().removeWidget(view)
+        get_web_view_pool().release(view)
+
+    def deleteLater(self):
+        self.release_view()
+        super().deleteLater()
 
     def wheelEvent(self, event: QWheelEvent):
         # 获取滚动条（向上找 QScrollArea）
@@ -860,31 +613,7 @@ class MessageCard(SimpleCardWidget):
 
 
 def create_welcome_card(parent=None) -> MessageCard:
-    welcome_md = """\
-### 👋 你好！我是你的画布开发智能助手
-
-我已为你准备好以下能力，助你高效构建与调试画布：
-  
-- **🔗 上下文增强**  
-  可动态插入画布节点、组件信息、全局变量等上下文（点击下方 `+` 选择插入）。
-  
-- **⚡ 上下文联动**  
-  点击带链接的名称即可触发交互逻辑：
-  - **跳转节点**：`[节点名](jump)` → 定位到画布中对应节点  
-  - **创建组件**：`[组件名](create)` → 在画布中生成新组件节点  
-  - **生成代码**：`[组件名](generate)` → 跳转至组件开发界面并自动生成代码  
-
----
-
-### 💬 快速开始：点击下方问题直接提问
-
-- [帮我分析当前画布功能是否合理？](ask)  
-- [结合组件库，帮我完善当前画布：列出需新增的组件，如有前置节点需说明具体位置，如何连接，参数如何设置；若组件库缺失，也请说明需生成的新组件。](ask)  
-- [帮我审查当前组件代码，指出潜在问题并提供优化建议。](ask)
-
-"""
-
+    """欢迎卡片：正文使用预先渲染并缓存的 HTML"""
     card = MessageCard(role="welcome", timestamp="就绪", parent=parent)
-    card.update_content(welcome_md)
-    card.finish_streaming()
-    return card
\ No newline at end of file
+    card.content_widget.show_rendered(WELCOME_MD, get_welcome_html())
+    return card
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+
+from loguru import logger
+
+METRICS_LOG_FILE = Path("canvas_files") / "llm_logs" / "request_metrics.jsonl"
+METRICS_LOG_ROTATION = 5 * 1024 * 1024  # 单个日志文件上限（字节）
+METRICS_LOG_RETENTION = 5  # 保留的历史日志文件个数
+REGRESSION_WINDOW = 20  # 每个模型参与基线计算的最近请求数
+REGRESSION_MIN_SAMPLES = 5
+REGRESSION_FACTOR = 2.0  # 超过基线中位数的倍数即视为回退
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩百分位数（q 取 0~100），空列表返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RequestMetrics:
+    """
+    单次对话请求的性能指标：排队与连接耗时、首 Token 时间、Token 间隔分布、总耗时、输出速度、
+    输入输出规模以及渲染次数与耗时。
+    由 worker 在读取流时更新（工作线程写入，主线程在请求结束后读取并补充渲染数据）。
+    """
+
+    def __init__(self, model: str = ""):
+        self.model = model
+        self.started_at = time.perf_counter()
+        self.request_sent_at: Optional[float] = None  # 首次发出 HTTP 请求（通过调度器排队之后）
+        self.connected_at: Optional[float] = None  # 首次拿到响应头
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._last_chunk_at: Optional[float] = None
+        self.gaps: List[float] = []  # 相邻两个输出 chunk 的间隔（秒）
+        self.requests = 0  # 含工具调用轮次与重试
+        self.prompt_tokens_estimate = 0
+        self.prompt_tokens: Optional[int] = None  # 服务端返回 usage 时使用真实值
+        self.output_chars = 0
+        self.chunks = 0
+        self.completion_tokens: Optional[int] = None  # 服务端返回 usage 时使用真实值
+        self.render_count = 0
+        self.render_ms = 0.0
+        self.cached = False  # 回答来自响应缓存
+        self.error = ""
+
+    def on_request_sent(self, prompt_tokens: int):
+        """每轮请求发出前调用；工具调用后的下一轮不计入 Token 间隔"""
+        now = time.perf_counter()
+        if self.request_sent_at is None:
+            self.request_sent_at = now
+        self.requests += 1
+        self.prompt_tokens_estimate += prompt_tokens
+        self._last_chunk_at = None
+
+    def on_connected(self):
+        if self.connected_at is None:
+            self.connected_at = time.perf_counter()
+
+    def on_usage(self, usage):
+        """累计服务端返回的 usage（多轮请求时求和）"""
+        if usage is None:
+            return
+        if getattr(usage, "completion_tokens", None):
+            self.completion_tokens = (self.completion_tokens or 0) + usage.completion_tokens
+        if getattr(usage, "prompt_tokens", None):
+            self.prompt_tokens = (self.prompt_tokens or 0) + usage.prompt_tokens
+
+    def on_chunk(self, text: str):
+        if not text:
+            return  # 仅含 role 的首个 chunk 不算首 Token
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        if self._last_chunk_at is not None:
+            self.gaps.append(now - self._last_chunk_at)
+        self._last_chunk_at = now
+        self.output_chars += len(text)
+        self.chunks += 1
+
+    def set_render_stats(self, count: int, elapsed_ms: float):
+        """由主线程在回复结束后写入对应卡片的渲染次数与累计耗时"""
+        self.render_count = count
+        self.render_ms = elapsed_ms
+
+    def finish(self):
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+
+    @property
+    def queue_time(self) -> Optional[float]:
+        if self.request_sent_at is None:
+            return None
+        return self.request_sent_at - self.started_at
+
+    @property
+    def connect_time(self) -> Optional[float]:
+        if self.request_sent_at is None or self.connected_at is None:
+            return None
+        return self.connected_at - self.request_sent_at
+
+    def gap_percentiles(self) -> Dict[str, Optional[float]]:
+        """Token 间隔的 p50 / p90 / p99 / 最大值（毫秒）"""
+        gaps_ms = [gap * 1000 for gap in self.gaps]
+        result = {f"p{q}": percentile(gaps_ms, q) for q in (50, 90, 99)}
+        result["max"] = max(gaps_ms) if gaps_ms else None
+        return result
+
+    @property
+    def ttft(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def latency(self) -> Optional[float]:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    @property
+    def output_tokens(self) -> int:
+        if self.completion_tokens is not None:
+            return self.completion_tokens
+        # 与调度器一致的粗略估算：约 2 个字符 1 个 Token
+        return self.output_chars // 2
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        duration = self.finished_at - self.first_token_at
+        if duration <= 0:
+            return None
+        return self.output_tokens / duration
+
+    def to_dict(self) -> Dict:
+        def _round(value):
+            return round(value, 3) if value is not None else None
+
+        return {
+            "model": self.model,
+            "queue_time": _round(self.queue_time),
+            "connect_time": _round(self.connect_time),
+            "ttft": _round(self.ttft),
+            "latency": _round(self.latency),
+            "tokens_per_second": _round(self.tokens_per_second),
+            "gap_ms": {key: _round(value) for key, value in self.gap_percentiles().items()},
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens if self.prompt_tokens is not None else self.prompt_tokens_estimate,
+            "output_tokens": self.output_tokens,
+            "output_chars": self.output_chars,
+            "chunks": self.chunks,
+            "usage_reported": self.completion_tokens is not None,
+            "render_count": self.render_count,
+            "render_ms": _round(self.render_ms),
+            "cached": self.cached,
+            "error": self.error,
+        }
+
+    def summary(self) -> str:
+        """适合显示在卡片上的单行摘要"""
+        parts = []
+        if self.ttft is not None:
+            parts.append(f"首Token {self.ttft:.2f}s")
+        if self.latency is not None:
+            parts.append(f"总耗时 {self.latency:.2f}s")
+        if self.tokens_per_second is not None:
+            approx = "" if self.completion_tokens is not None else "≈"
+            parts.append(f"{approx}{self.tokens_per_second:.1f} tok/s")
+        parts.append(f"{self.output_chars} 字")
+        return " · ".join(parts)
+
+    def detail(self) -> str:
+        """卡片性能浮层使用的多行明细"""
+        def _ms(value):
+            return f"{value * 1000:.0f} ms" if value is not None else "-"
+
+        gaps = self.gap_percentiles()
+        gap_text = " / ".join(f"{gaps[key]:.0f}" if gaps[key] is not None else "-" for key in ("p50", "p90", "p99", "max"))
+        prompt = self.prompt_tokens if self.prompt_tokens is not None else f"≈{self.prompt_tokens_estimate}"
+        return "\n".join([
+            f"排队 {_ms(self.queue_time)} · 连接 {_ms(self.connect_time)} · 首Token {_ms(self.ttft)} · 总耗时 {_ms(self.latency)}",
+            f"Token 间隔 p50/p90/p99/max: {gap_text} ms",
+            f"输入 {prompt} tok · 输出 {self.output_tokens} tok（{self.output_chars} 字，{self.chunks} 块）",
+            f"渲染 {self.render_count} 次 · 累计 {self.render_ms:.0f} ms",
+        ])
+
+
+class MetricsRecorder:
+    """
+    把请求指标写入本地滚动日志（JSON Lines），并按模型维护最近若干次请求的首 Token 时间与 Token 间隔基线，明显变慢时立即告警。
+    """
+
+    def __init__(self, log_file: Path = METRICS_LOG_FILE):
+        self.log_file = log_file
+        self._writer: Optional[logging.Logger] = None
+        self._recent: Dict[str, Deque[Dict]] = {}
+        self._lock = threading.Lock()
+
+    def _ensure_sink(self):
+        """
+        指标行不经过 loguru：loguru 的记录会分发给宿主配置的所有 sink（含控制台），
+        这里用独立、不向上传播的标准库 logger，只写入指标文件。
+        """
+        if self._writer is not None:
+            return
+        self.log_file.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(str(self.log_file), maxBytes=METRICS_LOG_ROTATION,
+                                      backupCount=METRICS_LOG_RETENTION, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        writer = logging.getLogger(f"llm_chatter.metrics.{id(self)}")
+        writer.setLevel(logging.INFO)
+        writer.propagate = False
+        writer.addHandler(handler)
+        self._writer = writer
+
+    def record(self, metrics: RequestMetrics, **extra):
+        """记录一次已结束的请求；extra 为附加字段（如会话 ID、是否命中缓存）"""
+        entry = {"time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), **metrics.to_dict(), **extra}
+        with self._lock:
+            try:
+                self._ensure_sink()
+            except OSError as e:
+                logger.error(f"[Metrics] 创建指标日志失败: {e}")
+                return
+            self._writer.info(json.dumps(entry, ensure_ascii=False))
+            if not metrics.error and not metrics.cached:
+                self._check_regression(entry)
+
+    def _check_regression(self, entry: Dict):
+        history = self._recent.setdefault(entry["model"], deque(maxlen=REGRESSION_WINDOW))
+        if len(history) >= REGRESSION_MIN_SAMPLES:
+            for key, label in (("ttft", "首 Token 时间"), ("gap_p90", "Token 间隔 p90")):
+                value = entry["ttft"] if key == "ttft" else entry["gap_ms"]["p90"]
+                baseline = [item[key] for item in history if item[key] is not None]
+                if value is None or len(baseline) < REGRESSION_MIN_SAMPLES:
+                    continue
+                median = statistics.median(baseline)
+                if median > 0 and value > median * REGRESSION_FACTOR:
+                    logger.warning(f"[Metrics] {entry['model']} {label}明显变慢: {value:.3f} "
+                                   f"（最近 {len(baseline)} 次中位数 {median:.3f}）")
+        history.append({"ttft": entry["ttft"], "gap_p90": entry["gap_ms"]["p90"]})
+
+
+_metrics_recorder: Optional[MetricsRecorder] = None
+
+
+def get_metrics_recorder() -> MetricsRecorder:
+    global _metrics_recorder
+    if _metrics_recorder is None:
+        _metrics_recorder = MetricsRecorder()
+    return _metrics_recorder
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+离线 OpenAI 兼容模拟服务（仅依赖标准库），用于在无网络环境下复现流式行为、做延迟与负载测试。
+
+命令行启动：
+    python -m app.widgets.side_dock_area.plugins.llm_chatter.mock_server --port 8765 --script scenarios.json
+
+然后把模型配置的 API_URL 设为 http://127.0.0.1:8765/v1 即可（API_KEY 任意）。
+
+脚本为 JSON，场景字段（均可选）：
+    content            回复文本（默认回显最后一条用户消息）
+    ttft               首个 chunk 前的等待秒数
+    role_first         为 true 时先立即发送 role chunk（内容为空字符串）再等待 ttft，与多数网关的行为一致，
+                       可用于复现"只收到 role chunk 后停滞"
+    tokens_per_second  输出速度；0 表示不限速
+    chunk_chars        每个 chunk 的字符数（默认 2，约等于 1 个 Token）
+    stall_after        输出第 N 个 chunk 后停顿 stall_seconds 秒
+    stall_seconds
+    disconnect_after   输出第 N 个 chunk 后直接断开连接（不发送结束标记）
+    status             非 200 时直接返回错误，如 429
+    retry_after        错误响应的 Retry-After 头（秒）
+    fail_times         仅前 N 次请求返回 status，之后正常回复
+    tool_calls         [{"name": ..., "arguments": {...}}]，在最后一条消息不是工具结果时以增量形式返回
+场景选择顺序：models（按请求的 model 名）→ rules（match 正则匹配最后一条用户消息）→ queue（按请求顺序依次使用）→ default。
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+DEFAULT_SCENARIO = {"tokens_per_second": 0, "chunk_chars": 2}
+
+
+def _last_user_text(messages: List[Dict]) -> str:
+    for msg in reversed(messages or []):
+        if msg.get("role") == "user":
+            content = msg.get("content")
+            if isinstance(content, list):
+                return "\n".join(item.get("text", "") for item in content if item.get("type") == "text")
+            return content or ""
+    return ""
+
+
+class MockScript:
+    """场景脚本：决定每个请求使用哪个场景，并记录各场景已失败的次数"""
+
+    def __init__(self, script: Dict = None):
+        script = script or {}
+        self.default = {**DEFAULT_SCENARIO, **script.get("default", {})}
+        self.models: Dict[str, Dict] = script.get("models", {})
+        self.rules: List[Dict] = script.get("rules", [])
+        self.queue: List[Dict] = list(script.get("queue", []))
+        self._failures: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "MockScript":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def select(self, body: Dict) -> Dict:
+        with self._lock:
+            scenario = self.models.get(body.get("model", ""))
+            if scenario is None:
+                text = _last_user_text(body.get("messages"))
+                scenario = next((rule for rule in self.rules if re.search(rule.get("match", ""), text)), None)
+            if scenario is None and self.queue:
+                scenario = self.queue.pop(0)
+            scenario = scenario or self.default
+            # _key 标识场景本身，fail_times 据此累计失败次数
+            return {**self.default, **scenario, "_key": id(scenario)}
+
+    def should_fail(self, scenario: Dict) -> bool:
+        status = int(scenario.get("status", 200))
+        if status == 200:
+            return False
+        fail_times = scenario.get("fail_times")
+        if fail_times is None:
+            return True
+        with self._lock:
+            count = self._failures.get(scenario["_key"], 0)
+            self._failures[scenario["_key"]] = count + 1
+            return count < int(fail_times)
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_MockHTTPServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        scenario = self.server.script.select(body)
+        self.server.record(body, scenario)
+
+        if self.server.script.should_fail(scenario):
+            headers = {}
+            if scenario.get("retry_after") is not None:
+                headers["Retry-After"] = str(scenario["retry_after"])
+            status = int(scenario["status"])
+            self._send_json(status, {"error": {"message": f"mock error {status}", "type": "mock_error"}}, headers)
+            return
+
+        messages = body.get("messages") or []
+        tool_calls = scenario.get("tool_calls") if body.get("tools") else None
+        if tool_calls and messages and messages[-1].get("role") == "tool":
+            tool_calls = None  # 已拿到工具结果，本轮输出最终回答
+        content = "" if tool_calls else scenario.get("content", _last_user_text(messages))
+
+        if body.get("stream"):
+            self._stream(body, scenario, content, tool_calls)
+        else:
+            time.sleep(float(scenario.get("ttft", 0)))
+            self._send_json(200, self._completion(body, content, tool_calls))
+
+    # ---------------- 响应 ----------------
+    def _send_json(self, status: int, payload: Dict, headers: Dict = None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def _tool_call_payload(tool_calls: List[Dict]) -> List[Dict]:
+        return [{
+            "id": call.get("id") or f"call_{i}",
+            "type": "function",
+            "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}), ensure_ascii=False)},
+        } for i, call in enumerate(tool_calls)]
+
+    def _completion(self, body: Dict, content: str, tool_calls: Optional[List[Dict]]) -> Dict:
+        message = {"role": "assistant", "content": content or None}
+        if tool_calls:
+            message["tool_calls"] = self._tool_call_payload(tool_calls)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(content) // 2, "total_tokens": len(content) // 2},
+        }
+
+    def _write_chunk(self, payload) -> None:
+        data = payload if isinstance(payload, bytes) else f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream(self, body: Dict, scenario: Dict, content: str, tool_calls: Optional[List[Dict]]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "mock")
+
+        def chunk(delta: Dict, finish_reason=None, usage=None) -> Dict:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            if usage is not None:
+                payload["choices"] = []
+                payload["usage"] = usage
+            return payload
+
+        # 每个元素为一个 delta；工具调用先发 id/name，再把 arguments 拆成多段
+        deltas = []
+        if tool_calls:
+            for i, call in enumerate(self._tool_call_payload(tool_calls)):
+                deltas.append({"tool_calls": [{"index": i, "id": call["id"], "type": "function",
+                                               "function": {"name": call["function"]["name"], "arguments": ""}}]})
+                arguments = call["function"]["arguments"]
+                for start in range(0, len(arguments), 8):
+                    deltas.append({"tool_calls": [{"index": i, "function": {"arguments": arguments[start:start + 8]}}]})
+        else:
+            size = max(1, int(scenario.get("chunk_chars", 2)))
+            deltas = [{"content": content[start:start + size]} for start in range(0, len(content), size)]
+
+        rate = float(scenario.get("tokens_per_second", 0))
+        interval = 1.0 / rate if rate > 0 else 0.0
+        stall_after = scenario.get("stall_after")
+        disconnect_after = scenario.get("disconnect_after")
+        try:
+            if scenario.get("role_first"):
+                self._write_chunk(chunk({"role": "assistant", "content": ""}))
+                time.sleep(float(scenario.get("ttft", 0)))
+            else:
+                time.sleep(float(scenario.get("ttft", 0)))
+                self._write_chunk(chunk({"role": "assistant", "content": ""}))
+            for index, delta in enumerate(deltas):
+                if disconnect_after is not None and index >= int(disconnect_after):
+                    # 模拟连接中途断开：不发送结束标记直接关闭
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+                if stall_after is not None and index == int(stall_after):
+                    time.sleep(float(scenario.get("stall_seconds", 60)))
+                self._write_chunk(chunk(delta))
+                if interval:
+                    time.sleep(interval)
+            self._write_chunk(chunk({}, finish_reason="tool_calls" if tool_calls else "stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                tokens = len(content) // 2
+                self._write_chunk(chunk({}, usage={"prompt_tokens": 0, "completion_tokens": tokens,
+                                                   "total_tokens": tokens}))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            # 客户端取消或看门狗关闭了连接
+            self.close_connection = True
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, script: MockScript):
+        super().__init__(address, _MockHandler)
+        self.script = script
+        self.requests: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, body: Dict, scenario: Dict):
+        with self._lock:
+            self.requests.append({"time": time.time(), "model": body.get("model"), "stream": bool(body.get("stream")),
+                                  "messages": len(body.get("messages") or []), "scenario": scenario})
+
+
+class MockOpenAIServer:
+    """
+    在后台线程中运行的模拟服务，供基准测试与脚本使用：
+        with MockOpenAIServer({"default": {"content": "你好", "ttft": 0.2}}) as server:
+            llm_config["API_URL"] = server.url
+    """
+
+    def __init__(self, script=None, host: str = "127.0.0.1", port: int = 0):
+        if not isinstance(script, MockScript):
+            script = MockScript.load(script) if isinstance(script, str) else MockScript(script)
+        self._httpd = _MockHTTPServer((host, port), script)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self) -> List[Dict]:
+        return self._httpd.requests
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="场景脚本（JSON）路径")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.script, args.host, args.port)
+    logger.info(f"[MockServer] 已启动: {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
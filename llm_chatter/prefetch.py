@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# 与 _inject_context_links 相同的链接格式，只取 action 为 ask 的推荐问题
+_ASK_LINK_PATTERN = re.compile(r'`*\[([^\[\]]+?)\]\(ask\)`*')
+
+
+def extract_followup_questions(md_text: str) -> List[str]:
+    """按出现顺序提取回答中的推荐追问（去重）"""
+    questions = []
+    for match in _ASK_LINK_PATTERN.finditer(md_text or ""):
+        question = match.group(1).strip()
+        if question and question not in questions:
+            questions.append(question)
+    return questions
+
+
+class PrefetchEntry:
+    """
+    一个推荐问题的预取结果。生成期间内容先写入缓冲；
+    被用户点击后通过 attach() 回放已有内容并把后续增量转发给会话。
+    """
+
+    def __init__(self, worker, history_len: int):
+        self.worker = worker
+        self.history_len = history_len  # 预取时会话的消息数，用于判断上下文是否仍一致
+        self.content = ""
+        self.result: Optional[str] = None
+        self.error = ""
+        self.done = False
+        self._on_content: Optional[Callable[[str], None]] = None
+        self._on_error: Optional[Callable[[str], None]] = None
+        self._on_finished: Optional[Callable[[str], None]] = None
+        worker.content_received.connect(self._handle_content)
+        worker.error_occurred.connect(self._handle_error)
+        worker.finished_with_content.connect(self._handle_finished)
+
+    def _handle_content(self, content_piece: str):
+        self.content += content_piece
+        if self._on_content is not None:
+            self._on_content(content_piece)
+
+    def _handle_error(self, error: str):
+        self.error = error
+        self.done = True
+        if self._on_error is not None:
+            self._on_error(error)
+
+    def _handle_finished(self, response: str):
+        self.result = response
+        self.done = True
+        if self._on_finished is not None:
+            self._on_finished(response)
+
+    def attach(self, on_content: Callable[[str], None], on_error: Callable[[str], None],
+               on_finished: Callable[[str], None]):
+        """回放已缓冲的内容；未完成时继续转发后续信号"""
+        if self.content:
+            on_content(self.content)
+        if self.done:
+            if self.result is not None:
+                on_finished(self.result)
+            else:
+                on_error(self.error)
+            return
+        self._on_content, self._on_error, self._on_finished = on_content, on_error, on_finished
+
+
+class FollowupPrefetcher:
+    """
+    推荐追问的投机预取：回答结束后以后台优先级提前生成前 K 个推荐问题的回答。
+    用户点击命中时直接从缓冲流式展示；用户输入其他内容时取消全部预取。
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], PrefetchEntry] = {}
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def add(self, session_id: str, question: str, worker, history_len: int) -> PrefetchEntry:
+        entry = PrefetchEntry(worker, history_len)
+        self._entries[(session_id, question)] = entry
+        self.started += 1
+        return entry
+
+    def has_pending(self) -> bool:
+        return bool(self._entries)
+
+    def take(self, session_id: str, question: str, history_len: int) -> Optional[PrefetchEntry]:
+        """
+        取出与点击的问题及当前上下文匹配的预取结果，并丢弃该会话的其余预取。
+        失败的预取不算命中，由调用方正常发起请求。
+        """
+        entry = self._entries.pop((session_id, question), None)
+        self.discard(session_id)
+        if entry is not None and entry.history_len == history_len and not entry.error:
+            self.hits += 1
+            self._log_stats("命中")
+            return entry
+        if entry is not None:
+            self._cancel(entry)
+        self.misses += 1
+        self._log_stats("未命中")
+        return None
+
+    def discard(self, session_id: str = None):
+        """取消并丢弃某个会话（或全部会话）尚未使用的预取"""
+        for key in [k for k in self._entries if session_id is None or k[0] == session_id]:
+            self._cancel(self._entries.pop(key))
+            self.discarded += 1
+
+    @staticmethod
+    def _cancel(entry: PrefetchEntry):
+        if entry.worker.isRunning():
+            entry.worker.cancel()
+
+    def stats(self) -> Dict:
+        requested = self.hits + self.misses
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "discarded": self.discarded,
+            "hit_rate": round(self.hits / requested, 3) if requested else None,
+        }
+
+    def _log_stats(self, outcome: str):
+        logger.info(f"[Prefetch] 推荐问题{outcome}，统计: {self.stats()}")
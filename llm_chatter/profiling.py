@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+轻量级性能埋点：在热路径上记录命名区间（span），导出为 Chrome trace-event JSON
+（chrome://tracing 或 https://ui.perfetto.dev 打开）与汇总表，并可对接下来 N 次渲染启用 cProfile。
+
+未启用时 span() 直接返回共享的空上下文，traced 装饰的函数只多一次布尔判断。
+无需改代码即可在用户机器上开启：
+    LLM_CHATTER_PROFILE=1             记录 span，退出时导出 trace 与汇总表到 canvas_files/llm_logs/profile
+    LLM_CHATTER_PROFILE_RENDERS=N     对接下来 N 次渲染运行 cProfile，结果写入同一目录（隐含开启 span）
+也可在运行时调用 enable() / profile_next("render", n) / export_chrome_trace() / summary_table()。
+"""
+import atexit
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import statistics
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+PROFILE_DIR = Path("canvas_files") / "llm_logs" / "profile"
+MAX_EVENTS = 200000  # 超出后丢弃最早的事件，避免长时间运行占用过多内存
+
+_enabled = False
+_events: deque = deque(maxlen=MAX_EVENTS)
+_origin = time.perf_counter()
+_armed_profiles: Dict[str, int] = {}  # span 名称 → 剩余需要 cProfile 的次数
+_profile_lock = threading.Lock()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "started", "profiler")
+
+    def __init__(self, name: str, args: Dict):
+        self.name = name
+        self.args = args
+        self.profiler: Optional[cProfile.Profile] = None
+
+    def __enter__(self):
+        if _armed_profiles:
+            self.profiler = _take_profile_slot(self.name)
+        self.started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        finished = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.disable()
+            _dump_profile(self.name, self.profiler)
+        _events.append((self.name, threading.get_ident(), self.started, finished - self.started, self.args))
+        return False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    _events.clear()
+
+
+def span(name: str, **args):
+    """with span("render", chars=1024): ...；未启用时几乎无开销"""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def traced(name: str):
+    """把整个函数调用记录为一个 span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ======== cProfile ========
+def profile_next(name: str, count: int):
+    """对名为 name 的接下来 count 个 span 运行 cProfile（同时开启 span 记录）"""
+    enable()
+    with _profile_lock:
+        _armed_profiles[name] = _armed_profiles.get(name, 0) + max(0, count)
+
+
+def _take_profile_slot(name: str) -> Optional[cProfile.Profile]:
+    with _profile_lock:
+        remaining = _armed_profiles.get(name, 0)
+        if remaining <= 0:
+            return None
+        if remaining == 1:
+            del _armed_profiles[name]
+        else:
+            _armed_profiles[name] = remaining - 1
+    return cProfile.Profile()
+
+
+def _dump_profile(name: str, profiler: cProfile.Profile):
+    try:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        path = PROFILE_DIR / f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.prof"
+        profiler.dump_stats(str(path))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(15)
+        logger.info(f"[Profile] {name} 的 cProfile 结果已写入 {path}\n{text.getvalue()}")
+    except OSError as e:
+        logger.error(f"[Profile] 写入 cProfile 结果失败: {e}")
+
+
+# ======== 导出 ========
+def _snapshot() -> List[tuple]:
+    return list(_events)
+
+
+def export_chrome_trace(path: Optional[str] = None) -> Path:
+    """把已记录的 span 导出为 Chrome trace-event JSON（完整事件 ph="X"，时间单位微秒）"""
+    if path is None:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        path = PROFILE_DIR / f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    path = Path(path)
+    pid = os.getpid()
+    events = [{
+        "name": name, "cat": name.split(".", 1)[0], "ph": "X", "pid": pid, "tid": tid,
+        "ts": round((started - _origin) * 1e6, 1), "dur": round(duration * 1e6, 1), "args": args,
+    } for name, tid, started, duration, args in _snapshot()]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+    return path
+
+
+def summarize() -> Dict[str, Dict[str, float]]:
+    """按 span 名称汇总：次数、累计、平均、p95、最大耗时（毫秒）"""
+    durations: Dict[str, List[float]] = {}
+    for name, _tid, _started, duration, _args in _snapshot():
+        durations.setdefault(name, []).append(duration * 1000)
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "total_ms": sum(values),
+            "mean_ms": statistics.mean(values),
+            "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max_ms": values[-1],
+        }
+    return summary
+
+
+def summary_table() -> str:
+    """汇总表文本，按累计耗时降序"""
+    rows = sorted(summarize().items(), key=lambda item: item[1]["total_ms"], reverse=True)
+    if not rows:
+        return "（没有记录到 span）"
+    width = max(len("span"), *(len(name) for name, _ in rows))
+    lines = [f"{'span':<{width}}  {'count':>7}  {'total ms':>10}  {'mean ms':>9}  {'p95 ms':>9}  {'max ms':>9}"]
+    for name, stats in rows:
+        lines.append(f"{name:<{width}}  {stats['count']:>7}  {stats['total_ms']:>10.2f}  {stats['mean_ms']:>9.3f}  "
+                     f"{stats['p95_ms']:>9.3f}  {stats['max_ms']:>9.3f}")
+    return "\n".join(lines)
+
+
+def _export_at_exit():
+    if not _events:
+        return
+    try:
+        path = export_chrome_trace()
+        logger.info(f"[Profile] trace 已导出到 {path}\n{summary_table()}")
+    except OSError as e:
+        logger.error(f"[Profile] 导出 trace 失败: {e}")
+
+
+def _configure_from_env():
+    renders = int(os.environ.get("LLM_CHATTER_PROFILE_RENDERS", "0") or 0)
+    if os.environ.get("LLM_CHATTER_PROFILE") == "1" or renders > 0:
+        enable()
+        if renders > 0:
+            profile_next("render", renders)
+        atexit.register(_export_at_exit)
+        logger.info("[Profile] 已开启性能埋点")
+
+
+_configure_from_env()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+RESPONSE_CACHE_DIR = Path("canvas_files") / "llm_cache" / "responses"
+DEFAULT_RESPONSE_CACHE_TTL = 24 * 3600.0  # 默认缓存一天，可通过配置“缓存有效期”（秒）调整
+DEFAULT_RESPONSE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# 不影响模型输出的运行参数，不参与缓存键（避免调整超时、限流等设置后缓存全部失效）
+_NON_SEMANTIC_KEYS = {
+    "工具超时", "最大工具轮数", "重试次数", "首Token超时", "流式间隔超时", "停滞重试次数", "备用模型",
+    "每分钟请求数", "每分钟Token数", "最大并发", "异步引擎", "响应缓存", "缓存有效期",
+}
+
+
+def is_response_cache_enabled(llm_config: Dict) -> bool:
+    """响应缓存需在模型配置中显式开启（“响应缓存”）"""
+    return bool(llm_config.get("响应缓存", False))
+
+
+def _is_secret_key(key: str) -> bool:
+    upper = str(key).upper()
+    return "KEY" in upper or "SECRET" in upper or "PASSWORD" in upper or "密钥" in key or "密码" in key
+
+
+class ResponseCache:
+    """
+    完全相同请求的回答缓存，存放在磁盘上（每条一个 JSON 文件）。
+    键为 (去除密钥后的模型配置, 消息, 工具定义) 的规范化哈希；按 TTL 过期，
+    总大小超过上限时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, cache_dir: Path = RESPONSE_CACHE_DIR, max_bytes: int = DEFAULT_RESPONSE_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(llm_config: Dict, messages: List[Dict], tools: List[Dict] = None) -> str:
+        config = {k: v for k, v in llm_config.items() if k not in _NON_SEMANTIC_KEYS and not _is_secret_key(k)}
+        payload = {"config": config, "messages": messages, "tools": tools or []}
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str, ttl: float = DEFAULT_RESPONSE_CACHE_TTL) -> Optional[str]:
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            if time.time() - entry.get("created", 0) >= ttl:
+                path.unlink(missing_ok=True)
+                self.misses += 1
+                return None
+            # 以修改时间记录最近使用，供容量淘汰参考
+            os.utime(path, None)
+            self.hits += 1
+            return entry.get("content")
+
+    def put(self, key: str, content: str, model: str = ""):
+        if not content:
+            return
+        entry = {"created": time.time(), "model": model, "content": content}
+        with self._lock:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = self._path(key).with_suffix(".tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                os.replace(tmp_path, self._path(key))
+                self._prune()
+            except OSError as e:
+                logger.error(f"[ResponseCache] 写入缓存失败: {e}")
+
+    def _prune(self):
+        """总大小超过上限时按最近使用时间淘汰"""
+        files = []
+        total = 0
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(files):
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            for path in self.cache_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
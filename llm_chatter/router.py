@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional
+
+from loguru import logger
+
+
+class StreamStallError(Exception):
+    """流在输出任何内容之前停滞，且已用尽同一端点上的重试次数"""
+
+
+def endpoint_key(llm_config: Dict) -> str:
+    """端点标识：同一网关上的不同模型分别熔断"""
+    return f"{llm_config.get('API_URL') or 'openai'}|{llm_config.get('模型名称', '')}"
+
+
+def is_retryable(error: Exception) -> bool:
+    # openai 仅在真正发生请求错误时才需要，延迟导入以免调度器拖慢插件加载
+    from openai import APIConnectionError, APIStatusError, RateLimitError
+
+    if isinstance(error, (RateLimitError, APIConnectionError, StreamStallError)):
+        return True
+    # 5xx 视为网关临时故障
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """从 429/503 响应头读取建议等待时间（秒），支持 retry-after-ms、秒数与 HTTP 日期"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0  # 单次重试等待上限（秒），Retry-After 更长时改为切换端点
+
+
+def compute_backoff(attempt: int, retry_after: Optional[float] = None,
+                    base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """指数退避 + full jitter；服务端给出 Retry-After 时以其为下限，结果不超过 cap"""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, base))
+    return min(delay, cap)
+
+
+def max_retries_for(llm_config: Dict) -> int:
+    """同一端点上的重试次数（每个端点按自己的配置读取）"""
+    return int(llm_config.get("重试次数", 2))
+
+
+class CircuitBreaker:
+    """
+    单个端点的熔断器：连续失败达到阈值后打开，冷却期内跳过该端点；
+    冷却结束进入半开状态放行一次试探请求，成功则关闭，失败则重新打开。
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """只读检查：是否仍在冷却期内（或半开试探正在进行），不改变状态、不占用试探名额"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            return time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        """即将实际请求该端点时调用：冷却结束后转为半开并占用唯一的试探名额"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # 冷却结束（或上次试探未被实际使用）后再放行一次试探
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class EndpointRouter:
+    """按顺序在主配置与备用配置之间路由，跳过熔断中的端点"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, llm_config: Dict) -> CircuitBreaker:
+        key = endpoint_key(llm_config)
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker()
+            return self._breakers[key]
+
+    def plan(self, configs: List[Dict]) -> List[Dict]:
+        """
+        返回本次请求可尝试的配置顺序；全部熔断时仍保留主配置，避免直接失败。
+        这里只读检查熔断状态，真正请求某个端点前才由 RoutePlan 调用 allow()。
+        """
+        healthy = [config for config in configs if not self.breaker(config).is_open()]
+        if not healthy and configs:
+            logger.warning(f"[Router] 所有端点均处于熔断状态，仍尝试主端点 {endpoint_key(configs[0])}")
+            return configs[:1]
+        return healthy
+
+
+class RoutePlan:
+    """
+    一次请求的重试 / 熔断 / 备用端点决策。线程 worker 与 asyncio 引擎共用，只有等待方式不同：
+
+        route = RoutePlan([主配置] + 备用配置)
+        for llm_config in route.endpoints():
+            for attempt in range(max_retries_for(llm_config) + 1):
+                try: ... 请求 ...
+                except 可重试的异常 as e:
+                    delay = route.on_failure(llm_config, attempt, e)
+                    if delay is None: break      # 放弃当前端点
+                    等待 delay 秒后 continue
+                route.on_success(llm_config); return
+        route.raise_last_error()
+    """
+
+    def __init__(self, configs: List[Dict], router: "EndpointRouter" = None):
+        self.router = router or get_router()
+        self.candidates = self.router.plan(configs)
+        # 全部熔断时保留的主配置不再经过 allow()，否则必然被跳过
+        self._forced = len(self.candidates) == 1 and self.router.breaker(self.candidates[0]).is_open()
+        self._index = -1
+        self.last_error: Optional[Exception] = None
+
+    def endpoints(self) -> Iterator[Dict]:
+        for index, llm_config in enumerate(self.candidates):
+            if not self._forced and not self.router.breaker(llm_config).allow():
+                continue  # 规划之后被其他请求熔断，或半开试探已被占用
+            if index > 0:
+                logger.warning(f"[Router] 切换到备用端点 {endpoint_key(llm_config)}")
+            self._index = index
+            yield llm_config
+
+    def _has_fallback(self) -> bool:
+        return any(not self.router.breaker(config).is_open() for config in self.candidates[self._index + 1:])
+
+    def on_failure(self, llm_config: Dict, attempt: int, error: Exception) -> Optional[float]:
+        """记录一次可重试的失败，返回重试前应等待的秒数；None 表示放弃当前端点（切换或抛出）"""
+        breaker = self.router.breaker(llm_config)
+        breaker.record_failure()
+        self.last_error = error
+        key = endpoint_key(llm_config)
+        if isinstance(error, StreamStallError) or breaker.is_open():
+            return None  # 停滞或已熔断：直接切换到下一个端点
+        if attempt >= max_retries_for(llm_config):
+            return None  # 最后一次尝试失败后不再等待
+        retry_after = parse_retry_after(error)
+        if retry_after is not None and retry_after > BACKOFF_CAP and self._has_fallback():
+            logger.warning(f"[Router] {key} 要求等待 {retry_after:.0f}s，超过上限，改用备用端点")
+            return None
+        delay = compute_backoff(attempt, retry_after)
+        logger.warning(f"[Router] {key} 请求失败（{type(error).__name__}），{delay:.1f}s 后重试")
+        return delay
+
+    def on_success(self, llm_config: Dict):
+        self.router.breaker(llm_config).record_success()
+
+    def raise_last_error(self):
+        if self.last_error is None:
+            raise ValueError("没有可用的模型配置")
+        raise self.last_error
+
+
+_router: Optional[EndpointRouter] = None
+
+
+def get_router() -> EndpointRouter:
+    global _router
+    if _router is None:
+        _router = EndpointRouter()
+    return _router
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.widgets.side_dock_area.plugins.llm_chatter.router import endpoint_key
+
+PRIORITY_INTERACTIVE = 0  # 用户正在等待的对话
+PRIORITY_BACKGROUND = 10  # 标题生成、摘要、预取等后台任务
+
+_WINDOW = 60.0  # RPM / TPM 统计窗口（秒）
+
+
+def estimate_tokens(messages: List[Dict]) -> int:
+    """粗略估算消息 Token 数：中英文混合按每 2 个字符 1 个 Token 计"""
+    chars = 0
+    for msg in messages:
+        content = msg.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(item.get("text", "") for item in content if item.get("type") == "text")
+        chars += len(content)
+    return chars // 2 + 1
+
+
+class SchedulerTicket:
+    def __init__(self, key: str, tokens: int, priority: int, admitted_at: float, wait_time: float):
+        self.key = key
+        self.tokens = tokens
+        self.priority = priority
+        self.admitted_at = admitted_at
+        self.wait_time = wait_time
+        self.released = False
+
+
+class SchedulerWaiter:
+    """已在端点队列中登记、尚未放行的请求，供 poll() / withdraw() 使用"""
+
+    def __init__(self, key: str, tokens: int, priority: int, entry: tuple, started: float):
+        self.key = key
+        self.tokens = tokens
+        self.priority = priority
+        self.entry = entry
+        self.started = started
+
+
+class _EndpointState:
+    def __init__(self):
+        self.rpm = 0  # 0 表示不限制
+        self.tpm = 0
+        self.max_in_flight = 0
+        self.in_flight = 0
+        self.request_times: deque = deque()
+        self.token_events: deque = deque()  # (时间, token 数)
+        self.waiters: List[tuple] = []  # (优先级, 序号) 小顶堆
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def update_limits(self, llm_config: Dict):
+        self.rpm = int(llm_config.get("每分钟请求数", 0) or 0)
+        self.tpm = int(llm_config.get("每分钟Token数", 0) or 0)
+        self.max_in_flight = int(llm_config.get("最大并发", 0) or 0)
+
+    def _prune(self, now: float):
+        while self.request_times and now - self.request_times[0] >= _WINDOW:
+            self.request_times.popleft()
+        while self.token_events and now - self.token_events[0][0] >= _WINDOW:
+            self.token_events.popleft()
+
+    def seconds_until_admissible(self, tokens: int, priority: int, now: float) -> Optional[float]:
+        """0 表示可立即放行；None 表示需等待其他请求释放并发名额"""
+        self._prune(now)
+        if self.max_in_flight:
+            limit = self.max_in_flight
+            # 后台任务给交互请求预留一个并发名额
+            if priority > PRIORITY_INTERACTIVE and limit > 1:
+                limit -= 1
+            if self.in_flight >= limit:
+                return None
+        wait = 0.0
+        if self.rpm and len(self.request_times) >= self.rpm:
+            wait = max(wait, self.request_times[0] + _WINDOW - now)
+        if self.tpm and self.token_events:
+            used = sum(t for _, t in self.token_events)
+            if used + tokens > self.tpm:
+                # 依次等待最早的记录过期，直到窗口内有足够余量
+                for event_time, event_tokens in self.token_events:
+                    used -= event_tokens
+                    if used + tokens <= self.tpm:
+                        wait = max(wait, event_time + _WINDOW - now)
+                        break
+                else:
+                    wait = max(wait, self.token_events[-1][0] + _WINDOW - now)
+        return wait
+
+
+class LLMScheduler:
+    """
+    所有大模型调用的统一调度器：按端点限制每分钟请求数、每分钟 Token 数与最大并发，
+    同一端点上的等待者按优先级排队，交互对话优先于后台任务。
+    acquire() 在工作线程中阻塞调用，release() 归还并发名额并修正 Token 用量。
+    事件循环中不能阻塞等待，改用 enqueue() 登记后反复 poll()，放弃时 withdraw()。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._endpoints: Dict[str, _EndpointState] = {}
+        self._seq = itertools.count()
+
+    def _state(self, key: str) -> _EndpointState:
+        if key not in self._endpoints:
+            self._endpoints[key] = _EndpointState()
+        return self._endpoints[key]
+
+    def acquire(self, llm_config: Dict, tokens: int, priority: int = PRIORITY_INTERACTIVE,
+                cancel_event: threading.Event = None) -> Optional[SchedulerTicket]:
+        """等待直到该端点允许发起请求；cancel_event 被设置时返回 None"""
+        with self._cond:
+            waiter = self.enqueue(llm_config, tokens, priority)
+            try:
+                return self.wait_for(waiter, cancel_event)
+            finally:
+                self.withdraw(waiter)
+
+    def wait_for(self, waiter: SchedulerWaiter,
+                 cancel_event: threading.Event = None) -> Optional[SchedulerTicket]:
+        """阻塞等待已登记的请求被放行；cancel_event 被设置时返回 None（登记仍需调用方 withdraw）"""
+        with self._cond:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                ticket, wait = self.poll(waiter)
+                if ticket is not None:
+                    return ticket
+                # 轮询间隔较短，以便及时响应取消
+                self._cond.wait(timeout=min(wait, 0.25) if wait else 0.25)
+
+    def enqueue(self, llm_config: Dict, tokens: int, priority: int = PRIORITY_INTERACTIVE) -> SchedulerWaiter:
+        """按优先级登记到端点队列，之后由 poll() 检查是否轮到放行"""
+        key = endpoint_key(llm_config)
+        waiter = SchedulerWaiter(key, tokens, priority, (priority, next(self._seq)), time.monotonic())
+        with self._cond:
+            state = self._state(key)
+            state.update_limits(llm_config)
+            heapq.heappush(state.waiters, waiter.entry)
+        return waiter
+
+    def poll(self, waiter: SchedulerWaiter) -> Tuple[Optional[SchedulerTicket], Optional[float]]:
+        """
+        不阻塞地检查登记的请求：轮到且限额允许时放行并返回 (票据, None)，
+        否则返回 (None, 建议的等待秒数)；等待秒数为 None 表示需等其他请求释放名额。
+        """
+        with self._cond:
+            state = self._state(waiter.key)
+            if not state.waiters or state.waiters[0] != waiter.entry:
+                return None, None
+            now = time.monotonic()
+            wait = state.seconds_until_admissible(waiter.tokens, waiter.priority, now)
+            if wait is None or wait > 0:
+                return None, wait
+            heapq.heappop(state.waiters)
+            state.in_flight += 1
+            state.request_times.append(now)
+            state.token_events.append((now, waiter.tokens))
+            waited = now - waiter.started
+            state.admitted += 1
+            state.total_wait += waited
+            state.max_wait = max(state.max_wait, waited)
+            if waited > 1.0:
+                logger.info(f"[Scheduler] {waiter.key} 排队 {waited:.1f}s 后放行（优先级 {waiter.priority}）")
+            self._cond.notify_all()
+            return SchedulerTicket(waiter.key, waiter.tokens, waiter.priority, now, waited), None
+
+    def reprioritize(self, waiter: SchedulerWaiter, priority: int):
+        """调整尚在排队的登记的优先级（如用户采用了预取的后台回答），保持原登记顺序"""
+        with self._cond:
+            state = self._state(waiter.key)
+            waiter.priority = priority
+            if waiter.entry in state.waiters:
+                state.waiters.remove(waiter.entry)
+                waiter.entry = (priority, waiter.entry[1])
+                state.waiters.append(waiter.entry)
+                heapq.heapify(state.waiters)
+                self._cond.notify_all()
+
+    def withdraw(self, waiter: SchedulerWaiter):
+        """放弃尚未放行的登记（已放行时无操作）"""
+        with self._cond:
+            state = self._state(waiter.key)
+            if waiter.entry in state.waiters:
+                state.waiters.remove(waiter.entry)
+                heapq.heapify(state.waiters)
+                self._cond.notify_all()
+
+    def release(self, ticket: SchedulerTicket, used_tokens: int = None):
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            state = self._state(ticket.key)
+            state.in_flight = max(0, state.in_flight - 1)
+            if used_tokens is not None:
+                # 用实际用量替换放行时记录的预估值
+                for i, (event_time, _) in enumerate(state.token_events):
+                    if event_time == ticket.admitted_at:
+                        state.token_events[i] = (event_time, used_tokens)
+                        break
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Dict]:
+        """各端点的排队深度、并发数与等待时间统计"""
+        with self._cond:
+            now = time.monotonic()
+            result = {}
+            for key, state in self._endpoints.items():
+                state._prune(now)
+                result[key] = {
+                    "queue_depth": len(state.waiters),
+                    "in_flight": state.in_flight,
+                    "requests_last_minute": len(state.request_times),
+                    "tokens_last_minute": sum(t for _, t in state.token_events),
+                    "admitted": state.admitted,
+                    "avg_wait": state.total_wait / state.admitted if state.admitted else 0.0,
+                    "max_wait": state.max_wait,
+                }
+            return result
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
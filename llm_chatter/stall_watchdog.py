@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+
+STALL_LOG_FILE = Path("canvas_files") / "llm_logs" / "stall_events.jsonl"
+_stall_log_lock = threading.Lock()
+
+
+def record_stall_event(event: Dict):
+    """追加一条停滞事件到本地 JSONL 日志，供事后分析"""
+    event = {"time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), **event}
+    try:
+        with _stall_log_lock:
+            STALL_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+            with open(STALL_LOG_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.error(f"[Watchdog] 写入停滞日志失败: {e}")
+
+
+class StreamWatchdog:
+    """
+    在独立线程中监控流式响应的首 Token 等待时间与 chunk 间隔。
+    读取线程阻塞在 socket 上时也能触发；超时后调用 on_stall 中断流，
+    并在 stall 中记录 (类型, 已等待秒数)。
+    """
+
+    def __init__(self, first_token_timeout: float, chunk_gap_timeout: float,
+                 on_stall: Callable[[], None], poll_interval: float = 0.25):
+        self.first_token_timeout = first_token_timeout
+        self.chunk_gap_timeout = chunk_gap_timeout
+        self.on_stall = on_stall
+        self.poll_interval = poll_interval
+        self.stall: Optional[tuple] = None  # ("first_token" | "chunk_gap", elapsed)
+        self.first_token_seen = False
+        self._started_at = 0.0
+        self._last_activity = 0.0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._started_at = self._last_activity = time.monotonic()
+        self._thread = threading.Thread(target=self._watch, name="llm-stream-watchdog", daemon=True)
+        self._thread.start()
+
+    def feed(self):
+        """收到新数据时调用"""
+        self.first_token_seen = True
+        self._last_activity = time.monotonic()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            now = time.monotonic()
+            if not self.first_token_seen:
+                elapsed = now - self._started_at
+                if elapsed > self.first_token_timeout:
+                    self._trip("first_token", elapsed)
+                    return
+            else:
+                elapsed = now - self._last_activity
+                if elapsed > self.chunk_gap_timeout:
+                    self._trip("chunk_gap", elapsed)
+                    return
+
+    def _trip(self, kind: str, elapsed: float):
+        self.stall = (kind, elapsed)
+        try:
+            self.on_stall()
+        except Exception as e:
+            logger.error(f"[Watchdog] 中断流失败: {e}")
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_TOOL_CACHE_TTL = 60.0  # 声明为幂等但未给出 TTL 的工具，默认缓存 60 秒
+
+
+def get_tool_cache_ttl(tool) -> Optional[float]:
+    """
+    读取工具的缓存策略，返回 TTL（秒）；不可缓存返回 None。
+    工具可通过 idempotent / cache_ttl 属性声明，或使用 MCP annotations 中的
+    readOnlyHint / idempotentHint。
+    """
+    ttl = getattr(tool, "cache_ttl", None)
+    if ttl is not None:
+        return float(ttl) if float(ttl) > 0 else None
+    if getattr(tool, "idempotent", False):
+        return DEFAULT_TOOL_CACHE_TTL
+    annotations = getattr(tool, "annotations", None) or {}
+    if not isinstance(annotations, dict):
+        annotations = vars(annotations)
+    if annotations.get("readOnlyHint") or annotations.get("idempotentHint"):
+        return DEFAULT_TOOL_CACHE_TTL
+    return None
+
+
+class ToolResultCache:
+    """
+    幂等 MCP 工具的结果缓存，键为 (会话 ID, 工具名, 规范化参数)。
+    按 TTL 过期，超过容量时淘汰最久未使用的条目；可被多个 worker 线程同时访问。
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(scope: str, tool_name: str, tool_args: Any) -> Tuple[str, str, str]:
+        canonical_args = json.dumps(tool_args, sort_keys=True, ensure_ascii=False,
+                                    separators=(",", ":"), default=str)
+        return scope or "", tool_name, canonical_args
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, result = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(result)
+
+    def put(self, key: Tuple[str, str, str], result: Dict, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear_scope(self, scope: str) -> int:
+        """清除某个会话的全部缓存，返回清除的条目数"""
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == scope]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            requested = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requested, 3) if requested else None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+消息卡片页面的公共外壳：样式表与脚本在进程内只生成一次，写入磁盘缓存目录，
+页面以 <link> / <script src> 引用，Chromium 按 URL 复用已解析的资源。
+首次渲染加载空的外壳页面，正文（含首次渲染）一律通过 setBody(html) 替换正文容器。
+
+正文来自模型输出，Markdown 会原样保留其中的 HTML，而外壳以 file:// 为源并暴露 chatBridge，
+因此 setBody 先在惰性的 <template> 中解析正文，移除脚本类元素、事件属性与 javascript: 等链接后再插入。
+
+需求中的自定义 URL scheme 需要在创建 QApplication 之前注册，插件加载时机无法保证，
+因此改用本地文件（file://）作为外壳资源的来源；写入失败时退回内联样式与脚本。
+"""
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from app.widgets.side_dock_area.plugins.llm_chatter.markdown_render import ACTION_COLOR_MAP, DEFAULT_COLOR
+
+SHELL_CACHE_DIR = Path("canvas_files") / "llm_cache" / "web_shell"
+
+_SHELL_CSS_TEMPLATE = """\
+html, body {
+    background: transparent !important;
+    color: white;
+    font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Helvetica, Arial, sans-serif;
+    font-size: 14px;
+    line-height: 1.5;
+    margin: 0;
+    padding: 4px 0;
+    overflow: hidden;
+    height: auto;
+    min-height: 1px;
+}
+body > *, #chat-content > * {
+    max-width: 100%%;
+    overflow-wrap: break-word;
+}
+.context-tag {
+    display: inline-block;
+    padding: 2px 6px;
+    margin: 0 2px;
+    border: 1px solid;
+    border-radius: 4px;
+    font-size: 13px;
+    font-weight: 500;
+    cursor: pointer;
+    user-select: none;
+    transition: all 0.2s ease;
+    /* 基础样式，具体颜色由 data-type 覆盖 */
+}
+/* 动态生成的类型专属样式 */
+%(context_tag_css)s
+.context-tag:hover {
+    background: rgba(255, 165, 0, 0.3);
+    border-color: #FFB733;
+    transform: translateY(-1px);
+}
+pre, code {
+    white-space: pre-wrap;
+    word-break: break-all;
+}
+details {
+    margin: 12px 0;
+    background: #252D38;
+    border: 1px solid #3A3F47;
+    border-radius: 8px;
+    padding: 12px;
+    font-size: 13px;
+    color: #CCCCCC;
+}
+summary {
+    color: #FFA500;
+    font-weight: bold;
+    cursor: pointer;
+    outline: none;
+    list-style: none;
+}
+button.code-action {
+    z-index: 10;
+    width: 28px;
+    height: 28px;
+    background: transparent;
+    border: none;
+    cursor: pointer;
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    padding: 0;
+    border-radius: 4px;
+}
+button.code-action img {
+    width: 20px;
+    height: 20px;
+    pointer-events: none;
+}
+.code-table {
+    border-collapse: collapse;
+    width: auto;
+    min-width: 100%%;
+    white-space: nowrap;
+    margin: 0;
+    font-family: Consolas, monospace;
+    font-size: 13px;
+    color: #D4D4D4;
+}
+.code-table td {
+    padding: 0;
+    vertical-align: top;
+    border: none;
+}
+.code-table .lineno {
+    user-select: none;
+    width: 28px !important;          /* ← 固定宽度 */
+    -webkit-user-select: none;
+    color: #666 !important;
+    padding-right: 4px !important;
+    border-right: 1px solid #444444 !important;
+    text-align: right;
+    white-space: nowrap;
+    min-width: 2.2em;
+}
+.code-table .code-line {
+    white-space: pre;
+    padding-left: 8px;
+    background: transparent !important;
+}
+[style*="overflow-x: auto"]::-webkit-scrollbar {
+    height: 10px;
+}
+[style*="overflow-x: auto"]::-webkit-scrollbar-track {
+    background: #252526;
+    border-radius: 5px;
+}
+[style*="overflow-x: auto"]::-webkit-scrollbar-thumb {
+    background: #454545;
+    border-radius: 5px;
+    border: 1px solid #3c3c3c;
+}
+[style*="overflow-x: auto"]::-webkit-scrollbar-thumb:hover {
+    background: #5a5a5a;
+}
+"""
+
+SHELL_JS = """\
+// 优先使用 WebChannel；加载失败或尚未就绪时回退到 console.log 协议
+window.chatBridge = null;
+if (window.qt && qt.webChannelTransport && window.QWebChannel) {
+    new QWebChannel(qt.webChannelTransport, function(channel) {
+        window.chatBridge = channel.objects.chatBridge;
+    });
+}
+document.addEventListener('click', function(e) {
+    const btn = e.target.closest('button[data-action]');
+    if (btn) {
+        e.preventDefault();
+        const action = btn.getAttribute('data-action');
+        const block = btn.closest('[data-block]');
+        if (!block) return;
+        const blockId = block.getAttribute('data-block');
+        if (window.chatBridge) {
+            window.chatBridge.codeAction(blockId, action);
+        } else {
+            console.log('pywebview_action:code|||' + action + '|||' + blockId);
+        }
+    }
+});
+document.addEventListener('click', function(e) {
+    const tag = e.target.closest('.context-tag');
+    if (tag) {
+        e.preventDefault();
+        const content = tag.getAttribute('data-content');
+        const action = tag.getAttribute('data-action');
+        if (content && action) {
+            if (window.chatBridge) {
+                window.chatBridge.contextAction(decodeURIComponent(content), decodeURIComponent(action));
+            } else {
+                console.log('pywebview_action:context|||' + content + '|||' + action);
+            }
+        }
+    }
+});
+// 高度只从这里上报：同一帧内的多次变化合并为一次，且只在高度真正变化时发送
+let lastHeight = -1;
+let heightFrame = 0;
+function reportHeight(force) {
+    const h = document.body.scrollHeight;
+    if (h === lastHeight && !force) return;
+    lastHeight = h;
+    if (window.chatBridge) {
+        window.chatBridge.reportHeight(h);
+    } else {
+        console.log('pywebview_height:' + h);
+    }
+}
+function scheduleReportHeight() {
+    if (heightFrame) return;
+    heightFrame = requestAnimationFrame(() => {
+        heightFrame = 0;
+        reportHeight(false);
+    });
+}
+if (window.ResizeObserver) {
+    // 首次 observe、内容变化、宽度变化以及思考卡片展开收起都会触发
+    new ResizeObserver(scheduleReportHeight).observe(document.body);
+} else {
+    // 降级：监听 window resize（不够精确，但兼容旧版）
+    window.addEventListener('resize', scheduleReportHeight);
+    document.addEventListener('toggle', scheduleReportHeight, true);
+}
+// 模型输出中的 HTML 不可信：在 <template> 中解析（不执行脚本、不加载资源），清理后再插入页面
+const BLOCKED_TAGS = 'script,iframe,frame,frameset,object,embed,applet,link,meta,base,form,style,animate,set';
+const URL_ATTRS = ['href', 'src', 'action', 'formaction', 'xlink:href', 'data', 'poster', 'background'];
+function isUnsafeUrl(value) {
+    // 浏览器解析 URL 时会忽略控制字符与空白，如 "java\\tscript:"
+    const url = value.replace(/[\\u0000-\\u0020]/g, '').toLowerCase();
+    return /^(javascript|vbscript|file):/.test(url) || url.startsWith('data:text/html');
+}
+function sanitizeBody(html) {
+    const template = document.createElement('template');
+    template.innerHTML = html;
+    const content = template.content;
+    content.querySelectorAll(BLOCKED_TAGS).forEach(function(el) { el.remove(); });
+    content.querySelectorAll('*').forEach(function(el) {
+        Array.from(el.attributes).forEach(function(attr) {
+            const name = attr.name.toLowerCase();
+            if (name.startsWith('on') || (URL_ATTRS.indexOf(name) >= 0 && isUnsafeUrl(attr.value))) {
+                el.removeAttribute(attr.name);
+            }
+        });
+    });
+    return content;
+}
+// 流式更新只替换正文容器，样式与脚本保持不变
+function setBody(html) {
+    const container = document.getElementById('chat-content');
+    container.textContent = '';
+    container.appendChild(sanitizeBody(html));
+    scheduleReportHeight();
+}
+window.pywebview = {
+    reportHeight: reportHeight,
+    setBody: setBody
+};
+"""
+
+
+def _context_tag_css() -> str:
+    css_rules = []
+    for act_type, color in ACTION_COLOR_MAP.items():
+        css_rules.append(
+            f'.context-tag[data-type="{act_type}"] {{ '
+            f'background: {color}20; '  # 20 = 12.5% 透明度（十六进制后加 20）
+            f'border-color: {color}; '
+            f'color: {color}; '
+            f'}}\n'
+            f'.context-tag[data-type="{act_type}"]:hover {{ '
+            f'background: {color}40; '  # 40 ≈ 25% 透明度
+            f'border-color: {color}aa; '  # 加亮一点
+            f'transform: translateY(-1px); '
+            f'}}'
+        )
+    # 默认兜底
+    css_rules.append(
+        f'.context-tag[data-type="other"], .context-tag:not([data-type]) {{ '
+        f'background: {DEFAULT_COLOR}20; '
+        f'border-color: {DEFAULT_COLOR}; '
+        f'color: {DEFAULT_COLOR}; '
+        f'}}'
+    )
+    return "\n".join(css_rules)
+
+
+class WebShell:
+    """外壳资源（进程内单例）：css_href / js_href 为相对 base_dir 的文件名，base_dir 为 None 时内联"""
+
+    def __init__(self, cache_dir: Path = SHELL_CACHE_DIR):
+        self.css = _SHELL_CSS_TEMPLATE % {"context_tag_css": _context_tag_css()}
+        self.js = SHELL_JS
+        # 文件名带内容摘要：样式或脚本修改后自动换用新文件，不会读到旧缓存
+        digest = hashlib.sha1((self.css + self.js).encode("utf-8")).hexdigest()[:12]
+        self.css_href = f"shell-{digest}.css"
+        self.js_href = f"shell-{digest}.js"
+        self.base_dir: Optional[Path] = None
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            for name, content in ((self.css_href, self.css), (self.js_href, self.js)):
+                path = cache_dir / name
+                if not path.exists():
+                    path.write_text(content, encoding="utf-8")
+            self.base_dir = cache_dir.resolve()
+        except OSError as e:
+            logger.warning(f"[WebShell] 写入外壳资源失败，改为内联: {e}")
+
+    def html(self) -> str:
+        """空的外壳页面；正文不拼进页面源码，由 setBody 清理后插入"""
+        if self.base_dir is not None:
+            style = f'<link rel="stylesheet" href="{self.css_href}">'
+            script = f'<script src="{self.js_href}" charset="utf-8"></script>'
+        else:
+            style = f"<style>{self.css}</style>"
+            script = f"<script>{self.js}</script>"
+        return (
+            '<!DOCTYPE html><html><head><meta charset="utf-8">'
+            f'{style}</head><body><div id="chat-content"></div>'
+            '<script src="qrc:///qtwebchannel/qwebchannel.js"></script>'
+            f'{script}</body></html>'
+        )
+
+    def base_path(self) -> Optional[str]:
+        """setHtml 使用的 baseUrl 对应的本地目录（以 / 结尾），内联模式返回 None"""
+        return str(self.base_dir) + "/" if self.base_dir is not None else None
+
+
+_web_shell: Optional[WebShell] = None
+
+
+def get_web_shell() -> WebShell:
+    global _web_shell
+    if _web_shell is None:
+        _web_shell = WebShell()
+    return _web_shell
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+欢迎卡片的静态内容。正文 HTML 只渲染一次并缓存到磁盘（按内容与模板版本取摘要命名），
+之后新建会话直接复用，不再走 Markdown 渲染管线。
+"""
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+
+from loguru import logger
+
+from app.widgets.side_dock_area.plugins.llm_chatter.markdown_render import render_markdown_body
+
+WELCOME_CACHE_DIR = Path("canvas_files") / "llm_cache" / "welcome"
+# 渲染管线（markdown_render）输出的结构变化时递增，使旧缓存失效
+WELCOME_TEMPLATE_VERSION = 1
+
+WELCOME_MD = """\
+### 👋 你好！我是你的画布开发智能助手
+
+我已为你准备好以下能力，助你高效构建与调试画布：
+  
+- **🔗 上下文增强**  
+  可动态插入画布节点、组件信息、全局变量等上下文（点击下方 `+` 选择插入）。
+  
+- **⚡ 上下文联动**  
+  点击带链接的名称即可触发交互逻辑：
+  - **跳转节点**：`[节点名](jump)` → 定位到画布中对应节点  
+  - **创建组件**：`[组件名](create)` → 在画布中生成新组件节点  
+  - **生成代码**：`[组件名](generate)` → 跳转至组件开发界面并自动生成代码  
+
+---
+
+### 💬 快速开始：点击下方问题直接提问
+
+- [帮我分析当前画布功能是否合理？](ask)  
+- [结合组件库，帮我完善当前画布：列出需新增的组件，如有前置节点需说明具体位置，如何连接，参数如何设置；若组件库缺失，也请说明需生成的新组件。](ask)  
+- [帮我审查当前组件代码，指出潜在问题并提供优化建议。](ask)
+
+"""
+
+_rendered: Dict[str, str] = {}  # 摘要 → 正文 HTML，进程内只读一次磁盘
+
+
+def welcome_cache_key(markdown_text: str = WELCOME_MD) -> str:
+    return hashlib.sha1(f"{WELCOME_TEMPLATE_VERSION}\n{markdown_text}".encode("utf-8")).hexdigest()[:12]
+
+
+def get_welcome_html(markdown_text: str = WELCOME_MD, cache_dir: Optional[Path] = WELCOME_CACHE_DIR) -> str:
+    """欢迎内容的正文 HTML：依次查进程内缓存、磁盘缓存，都未命中时渲染并写回磁盘"""
+    key = welcome_cache_key(markdown_text)
+    html = _rendered.get(key)
+    if html is not None:
+        return html
+
+    path = cache_dir / f"welcome-{key}.html" if cache_dir is not None else None
+    if path is not None and path.exists():
+        try:
+            html = path.read_text(encoding="utf-8")
+        except OSError as e:
+            logger.warning(f"[Welcome] 读取欢迎页缓存失败: {e}")
+    if html is None:
+        html = render_markdown_body(markdown_text, completed=True)
+        if path is not None:
+            try:
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                path.write_text(html, encoding="utf-8")
+            except OSError as e:
+                logger.warning(f"[Welcome] 写入欢迎页缓存失败: {e}")
+    _rendered[key] = html
+    return html
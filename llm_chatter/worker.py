@@ -1,12 +1,53 @@
 # -*- coding: utf-8 -*-
+import inspect
+import json
+import socket
+import threading
 import time
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional
 
 import openai
+from loguru import logger
 from PyQt5.QtCore import QRunnable, pyqtSlot
-from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtCore import QObject, pyqtSignal
 from openai import OpenAI, APIError, APIConnectionError, RateLimitError, BadRequestError, APITimeoutError
 
+from app.widgets.side_dock_area.plugins.llm_chatter.metrics import RequestMetrics
+from app.widgets.side_dock_area.plugins.llm_chatter.profiling import span, traced
+from app.widgets.side_dock_area.plugins.llm_chatter.response_cache import (
+    DEFAULT_RESPONSE_CACHE_TTL, ResponseCache
+)
+from app.widgets.side_dock_area.plugins.llm_chatter.router import (
+    RoutePlan, StreamStallError, is_retryable, max_retries_for
+)
+from app.widgets.side_dock_area.plugins.llm_chatter.scheduler import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, SchedulerTicket, SchedulerWaiter, estimate_tokens, get_scheduler
+)
+from app.widgets.side_dock_area.plugins.llm_chatter.stall_watchdog import StreamWatchdog, record_stall_event
+from app.widgets.side_dock_area.plugins.llm_chatter.tool_cache import ToolResultCache, get_tool_cache_ttl
+
+
+def build_title_prompt(current_title: str, messages_for_summary: list) -> str:
+    # 构造 prompt（复用你的逻辑）
+    summary_text = ""
+    for msg in messages_for_summary[-4:]:
+        content = msg["content"]
+        if isinstance(content, list):
+            texts = [item["text"] for item in content if item["type"] == "text"]
+            content = "\n".join(texts)
+        role = "用户" if msg["role"] == "user" else "助手"
+        summary_text += f"{role}：{content}\n"
+
+    return (
+        "你是一个对话标题生成器。请根据以下对话内容，生成一个不超过20个字的中文标题.\n"
+        f"对话内容：\n{summary_text}\n\n"
+        f"概括整个对话的核心主题。当前已有对话标题为：{current_title}\n\n"
+        "请严格按以下格式输出，不要包含任何其他文字、解释或标点：\n\n"
+        "```title\n你的标题\n```\n\n"
+        "标题内容为：\n"
+    )
+
 
 class TitleGenerationTask(QRunnable):
     def __init__(self, current_title: str, messages_for_summary: list, llm_config: dict, callback):
@@ -20,37 +61,27 @@ class TitleGenerationTask(QRunnable):
     @pyqtSlot()
     def run(self):
         try:
-            # 构造 prompt（复用你的逻辑）
-            summary_text = ""
-            for msg in self.messages_for_summary[-4:]:
-                content = msg["content"]
-                if isinstance(content, list):
-                    texts = [item["text"] for item in content if item["type"] == "text"]
-                    content = "\n".join(texts)
-                role = "用户" if msg["role"] == "user" else "助手"
-                summary_text += f"{role}：{content}\n"
-
-            prompt = (
-                "你是一个对话标题生成器。请根据以下对话内容，生成一个不超过20个字的中文标题.\n"
-                f"对话内容：\n{summary_text}\n\n"
-                f"概括整个对话的核心主题。当前已有对话标题为：{self.current_title}\n\n"
-                "请严格按以下格式输出，不要包含任何其他文字、解释或标点：\n\n"
-                "```title\n你的标题\n```\n\n"
-                "标题内容为：\n"
-            )
+            prompt = build_title_prompt(self.current_title, self.messages_for_summary)
 
             # 调用 OpenAI API（同步调用，因为在线程中）
             client = openai.OpenAI(
                 api_key=self.llm_config["API_KEY"],
                 base_url=self.llm_config["API_URL"]
             )
-            resp = client.chat.completions.create(
-                model=self.llm_config["模型名称"],
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=500,
-                stream=False
-            )
+            messages = [{"role": "user", "content": prompt}]
+            # 后台任务：排在交互对话之后，避免占用实时回答的限流额度
+            scheduler = get_scheduler()
+            ticket = scheduler.acquire(self.llm_config, estimate_tokens(messages) + 500, PRIORITY_BACKGROUND)
+            try:
+                resp = client.chat.completions.create(
+                    model=self.llm_config["模型名称"],
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=500,
+                    stream=False
+                )
+            finally:
+                scheduler.release(ticket)
             raw_title = resp.choices[0].message.content.strip()
             # 安全回传（QRunnable 不能直接 emit 信号，但可调用主线程的槽，前提是用 QObject）
             self.callback(raw_title)
@@ -59,30 +90,252 @@ class TitleGenerationTask(QRunnable):
             self.callback(None, error=error_msg)
 
 
-class OpenAIChatWorker(QThread):
+# 工具执行线程池：所有 worker 共享，限制同时运行的 MCP 工具数量
+_tool_executor: Optional[ThreadPoolExecutor] = None
+_tool_executor_lock = threading.Lock()
+TOOL_POOL_SIZE = 4
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    global _tool_executor
+    with _tool_executor_lock:
+        if _tool_executor is None:
+            _tool_executor = ThreadPoolExecutor(max_workers=TOOL_POOL_SIZE, thread_name_prefix="mcp-tool")
+        return _tool_executor
+
+
+# 超时后仍在线程池中运行的工具（Python 线程无法强制终止，只能等工具自行响应 cancel_event 或结束）
+_orphaned_tool_count = 0
+_orphaned_tool_lock = threading.Lock()
+
+
+def get_orphaned_tool_count() -> int:
+    with _orphaned_tool_lock:
+        return _orphaned_tool_count
+
+
+def _track_orphaned_tool(future, tool_name: str):
+    """记录一个已超时但仍占用线程池的工具调用，结束时自动减计数"""
+    global _orphaned_tool_count
+    with _orphaned_tool_lock:
+        _orphaned_tool_count += 1
+        count = _orphaned_tool_count
+    logger.warning(f"[Tool] 工具 {tool_name} 超时后仍在运行，已通知取消；当前滞留线程 {count}/{TOOL_POOL_SIZE}")
+
+    def _on_done(_future):
+        global _orphaned_tool_count
+        with _orphaned_tool_lock:
+            _orphaned_tool_count -= 1
+        logger.info(f"[Tool] 超时的工具 {tool_name} 已结束，释放线程")
+
+    future.add_done_callback(_on_done)
+
+
+class _DictTool:
+    """
+    OpenAI 格式的字典工具：{"type": "function", "function": {...}, "execute": callable, ...}。
+    只有携带可调用 execute 的字典才能执行，其余键（timeout、cache_ttl、annotations 等）按属性读取。
+    """
+
+    def __init__(self, spec: Dict):
+        self._spec = spec
+        self.name = spec["function"]["name"]
+        self.execute = spec["execute"]
+
+    def __getattr__(self, item):
+        return self._spec.get(item)
+
+
+def _is_executable_dict_tool(tool) -> bool:
+    return (isinstance(tool, dict) and tool.get("type") == "function"
+            and bool((tool.get("function") or {}).get("name")) and callable(tool.get("execute")))
+
+
+def _tool_to_openai_schema(tool) -> Optional[Dict]:
+    """将 MCP 工具描述转换为 OpenAI function calling 格式"""
+    if isinstance(tool, dict):
+        # 已经是 OpenAI 格式；没有 execute 的字典无法执行，不提供给模型，避免每次调用都返回“未知工具”
+        if not _is_executable_dict_tool(tool):
+            return None
+        return {"type": "function", "function": tool["function"]}
+    name = getattr(tool, "name", None)
+    if not name:
+        return None
+    parameters = (getattr(tool, "input_schema", None) or getattr(tool, "inputSchema", None)
+                  or getattr(tool, "parameters", None) or {"type": "object", "properties": {}})
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": getattr(tool, "description", "") or "",
+            "parameters": parameters,
+        }
+    }
+
+
+REPLAY_CHUNK_CHARS = 64  # 缓存回放时每次发出的字符数
+STALL_TIMEOUT_MARGIN = 2.0  # 流式请求的读取超时比看门狗阈值多出的秒数，保证停滞先由看门狗判定
+
+
+def _force_close_stream(stream):
+    """
+    立即中断流式响应。仅调用 Stream.close() 无法唤醒另一个线程中阻塞的 recv，
+    因此先对底层 socket 执行 shutdown，再关闭 HTTP 响应。
+    """
+    http_response = getattr(stream, "response", None)
+    try:
+        network_stream = http_response.extensions.get("network_stream")
+        sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except Exception:
+        pass
+    try:
+        stream.close()
+    except Exception:
+        pass
+
+
+# 按 (API_KEY, API_URL) 复用的客户端：共享连接池，避免每条消息重新建连
+_shared_clients: Dict[tuple, OpenAI] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(api_key: str, base_url: Optional[str]) -> OpenAI:
+    key = (api_key, base_url)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            # 设置超时（连接 + 读取）
+            client = _shared_clients[key] = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=60.0,  # 总超时 60 秒
+                max_retries=0  # 重试与切换由 run() 中的路由逻辑负责
+            )
+        return client
+
+
+class OpenAIChatWorker(QObject):
+    """
+    单次对话请求。由 ChatJobExecutor 在复用的线程池中执行 run()；
+    状态依次为 pending → active →（cancelling →）finished。
+    """
+    PENDING, ACTIVE, CANCELLING, FINISHED = "pending", "active", "cancelling", "finished"
+
     content_received = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     finished_with_content = pyqtSignal(str)
-
-    def __init__(self, messages: List[Dict], llm_config: Dict, tools: List[Dict] = None, stream: bool = True):
+    tool_trace = pyqtSignal(dict)  # 工具调用轨迹：{"event": "call" | "result", ...}
+    fallback_used = pyqtSignal(str)  # 切换到备用模型时发出模型名称
+    response_cached = pyqtSignal()  # 本次回答来自响应缓存（随后按流式回放）
+    finished = pyqtSignal()  # run() 退出（无论成功、失败或取消）
+
+    def __init__(self, messages: List[Dict], llm_config: Dict, tools: List = None, stream: bool = True,
+                 tool_cache: ToolResultCache = None, session_id: str = "",
+                 fallback_configs: List[Dict] = None, priority: int = PRIORITY_INTERACTIVE,
+                 response_cache: ResponseCache = None, read_cache: bool = True):
         super().__init__()
         self.messages = messages
+        self.priority = priority  # 调度优先级：交互对话优先于后台任务
+        self._active_config = llm_config  # 当前正在使用的端点配置
         self.llm_config = llm_config
+        self.fallback_configs = fallback_configs or []  # 主配置首 Token 前失败时依次尝试
         self.tools = tools or []
+        self.tool_cache = tool_cache
+        self.session_id = session_id  # 工具缓存按会话隔离
+        self.response_cache = response_cache
+        self.read_cache = read_cache  # 重新生成时为 False：绕过缓存但仍写入新回答
         self.stream = stream
         self.full_response = ""
         self._is_cancelled = False
+        self._cancel_event = threading.Event()  # 传递给正在执行的工具
+        self._sched_waiter: Optional[SchedulerWaiter] = None  # 正在调度器中排队的登记
+        self.state = self.PENDING
+        self._done_event = threading.Event()
+        self._response = None  # 当前正在读取的流，取消时直接关闭
+        self._cancel_requested_at: Optional[float] = None
+        self.cancel_latency: Optional[float] = None  # 从 cancel() 到 run() 退出的耗时（秒）
+        self._tools_executed = False
+        # 从创建（即用户发送）开始计时，包含排队时间
+        self.metrics = RequestMetrics(llm_config.get("模型名称", ""))
+        self._load_runtime_options(llm_config)
+
+    def _load_runtime_options(self, llm_config: Dict):
+        """读取与当前模型配置相关的运行参数（切换备用端点时重新读取）"""
+        self.tool_timeout = float(llm_config.get("工具超时", 30))
+        self.max_tool_rounds = int(llm_config.get("最大工具轮数", 8))
+        self.max_retries = max_retries_for(llm_config)
+        # 停滞检测阈值（秒）与未输出任何内容时的自动重试次数
+        self.first_token_timeout = float(llm_config.get("首Token超时", 30))
+        self.chunk_gap_timeout = float(llm_config.get("流式间隔超时", 30))
+        self.stall_retries = int(llm_config.get("停滞重试次数", 1))
+
+    def promote(self, priority: int = PRIORITY_INTERACTIVE):
+        """后台任务被用户采用（如预取的回答）时提升优先级，正在调度器中排队的登记随之调整"""
+        self.priority = priority
+        waiter = self._sched_waiter
+        if waiter is not None:
+            get_scheduler().reprioritize(waiter, priority)
+
+    def _track_waiter(self, waiter: SchedulerWaiter):
+        """记录排队中的登记，供 promote() 调整；登记前后优先级已被提升时立即补上"""
+        self._sched_waiter = waiter
+        if waiter.priority != self.priority:
+            get_scheduler().reprioritize(waiter, self.priority)
 
     def cancel(self):
+        """
+        中止请求：除设置标志外，直接关闭底层 HTTP 响应，
+        使阻塞在读取下一个 chunk 的 run() 立即抛出异常退出。
+        """
+        if self._cancel_requested_at is None:
+            self._cancel_requested_at = time.monotonic()
+        if self.state != self.FINISHED:
+            self.state = self.CANCELLING
         self._is_cancelled = True
+        self._cancel_event.set()
+        response = self._response
+        if response is not None:
+            _force_close_stream(response)
+
+    def isRunning(self) -> bool:
+        return self.state in (self.PENDING, self.ACTIVE, self.CANCELLING)
+
+    def isFinished(self) -> bool:
+        return self.state == self.FINISHED
+
+    def wait(self, msecs: int) -> bool:
+        """等待 run() 退出，最多 msecs 毫秒；返回是否已退出"""
+        return self._done_event.wait(msecs / 1000)
+
+    def _emit_error(self, message: str):
+        # 取消导致的连接中断不应显示为错误
+        if self._is_cancelled:
+            self.error_occurred.emit("[已取消] 用户手动中止请求")
+        else:
+            self.error_occurred.emit(message)
 
     def _check_cancel(self) -> bool:
         return self._is_cancelled
 
-    def _execute_mcp_tool(self, tool, tool_args: dict) -> dict:
+    def _find_tool(self, name: str):
+        for tool in self.tools:
+            if isinstance(tool, dict):
+                if _is_executable_dict_tool(tool) and tool["function"]["name"] == name:
+                    return _DictTool(tool)
+            elif getattr(tool, "name", None) == name:
+                return tool
+        return None
+
+    def _execute_mcp_tool(self, tool, tool_args: dict, cancel_event: threading.Event = None) -> dict:
         """执行 MCP 工具并返回结果（结构化字典）"""
         try:
-            result = tool.execute(tool_args)
+            # 支持取消的工具可声明 cancel_event 参数
+            if cancel_event is not None and "cancel_event" in inspect.signature(tool.execute).parameters:
+                result = tool.execute(tool_args, cancel_event=cancel_event)
+            else:
+                result = tool.execute(tool_args)
             return {
                 "type": "tool_result",
                 "tool_name": tool.name,
@@ -97,84 +350,398 @@ class OpenAIChatWorker(QThread):
                 "error": str(e)
             }
 
-    def run(self):
+    def _execute_tool_calls(self, tool_calls: List[Dict]) -> Optional[List[Dict]]:
+        """
+        并发执行同一轮助手回复中的全部工具调用。
+        每个工具有独立超时；用户取消时立即返回 None，并通知仍在运行的工具。
+        每个调用有自己的 cancel_event：超时只通知该工具本身，用户取消则通知全部工具。
+        """
+        self._tools_executed = True
+        executor = get_tool_executor()
+        results: List[Optional[Dict]] = [None] * len(tool_calls)
+        pending = {}
+        for i, call in enumerate(tool_calls):
+            tool = self._find_tool(call["name"])
+            if tool is None:
+                results[i] = {"type": "tool_error", "tool_name": call["name"], "result": None,
+                              "error": f"未知工具: {call['name']}"}
+                self.tool_trace.emit({"event": "result", "id": call["id"], **results[i]})
+                continue
+            try:
+                tool_args = json.loads(call["arguments"] or "{}")
+            except json.JSONDecodeError as e:
+                results[i] = {"type": "tool_error", "tool_name": call["name"], "result": None,
+                              "error": f"参数不是合法 JSON: {e}"}
+                self.tool_trace.emit({"event": "result", "id": call["id"], **results[i]})
+                continue
+            cache_ttl = get_tool_cache_ttl(tool) if self.tool_cache is not None else None
+            cache_key = None
+            if cache_ttl:
+                cache_key = ToolResultCache.make_key(self.session_id, call["name"], tool_args)
+                cached = self.tool_cache.get(cache_key)
+                if cached is not None:
+                    results[i] = {**cached, "cached": True, "elapsed": 0.0}
+                    self.tool_trace.emit({"event": "result", "id": call["id"], **results[i]})
+                    continue
+            timeout = float(getattr(tool, "timeout", None) or self.tool_timeout)
+            call_cancel = threading.Event()
+            future = executor.submit(self._execute_mcp_tool, tool, tool_args, call_cancel)
+            pending[future] = (i, time.time() + timeout, time.time(), cache_key, cache_ttl, call_cancel)
+
+        while pending:
+            if self._is_cancelled:
+                for future, entry in pending.items():
+                    entry[-1].set()
+                    future.cancel()
+                return None
+            done, _ = wait(pending.keys(), timeout=0.1, return_when=FIRST_COMPLETED)
+            now = time.time()
+            for future in list(pending.keys()):
+                i, deadline, started, cache_key, cache_ttl, call_cancel = pending[future]
+                if future in done:
+                    results[i] = future.result()
+                    if cache_key is not None and results[i]["error"] is None:
+                        self.tool_cache.put(cache_key, results[i], cache_ttl)
+                elif now > deadline:
+                    call_cancel.set()
+                    # 已开始运行的 future 无法 cancel()，记录滞留线程以便排查线程池被占满
+                    if not future.cancel():
+                        _track_orphaned_tool(future, tool_calls[i]["name"])
+                    results[i] = {"type": "tool_error", "tool_name": tool_calls[i]["name"], "result": None,
+                                  "error": f"工具执行超时（{deadline - started:.0f}秒）"}
+                else:
+                    continue
+                del pending[future]
+                results[i]["elapsed"] = round(now - started, 3)
+                self.tool_trace.emit({"event": "result", "id": tool_calls[i]["id"], **results[i]})
+
+        return results
+
+    def _on_stream_stalled(self):
+        # 由看门狗线程调用：中断当前流，使 _consume_stream 退出
+        response = self._response
+        if response is not None:
+            _force_close_stream(response)
+
+    def _request_round(self, client: OpenAI, req_kwargs: Dict) -> Optional[tuple]:
+        """
+        发起一轮请求并读取完整响应，返回 (文本内容, 工具调用列表)；取消或停滞返回 None。
+        流式请求由看门狗监控，若停滞发生在尚未输出任何内容之前则透明重试。
+        """
+        attempt = 0
+        while True:
+            if self._is_cancelled:
+                self.error_occurred.emit("[已取消] 用户手动中止请求")
+                return None
+            # 经由全局调度器排队，遵守端点的 RPM / TPM / 并发限制
+            prompt_tokens = estimate_tokens(req_kwargs["messages"])
+            scheduler = get_scheduler()
+            self._track_waiter(scheduler.enqueue(self._active_config, prompt_tokens + req_kwargs["max_tokens"],
+                                                 self.priority))
+            try:
+                ticket = scheduler.wait_for(self._sched_waiter, self._cancel_event)
+            finally:
+                scheduler.withdraw(self._sched_waiter)
+                self._sched_waiter = None
+            if ticket is None:
+                self.error_occurred.emit("[已取消] 用户手动中止请求")
+                return None
+            output_start = len(self.full_response)
+            self.metrics.on_request_sent(prompt_tokens)
+            try:
+                if not self.stream:
+                    response = client.chat.completions.create(**req_kwargs)
+                    self.metrics.on_connected()
+                    return self._consume_message(response)
+                consumed, watchdog = self._stream_once(client, req_kwargs)
+            finally:
+                self._release_ticket(ticket, prompt_tokens, output_start)
+
+            if self._is_cancelled:
+                self.error_occurred.emit("[已取消] 用户手动中止请求")
+                return None
+            if watchdog.stall is None:
+                return consumed
+
+            kind, elapsed = watchdog.stall
+            retry = not watchdog.first_token_seen and attempt < self.stall_retries
+            record_stall_event({
+                "model": req_kwargs["model"],
+                "api_url": str(client.base_url),
+                "kind": kind,
+                "threshold": self.first_token_timeout if kind == "first_token" else self.chunk_gap_timeout,
+                "elapsed": round(elapsed, 3),
+                "response_chars": len(self.full_response),
+                "attempt": attempt,
+                "retried": retry,
+            })
+            if retry:
+                attempt += 1
+                logger.warning(f"[Watchdog] 首 Token 等待 {elapsed:.1f}s 超时，第 {attempt} 次重试")
+                continue
+            if not self.full_response and not watchdog.first_token_seen:
+                # 尚未输出任何内容，交由路由切换到备用端点
+                raise StreamStallError(f"等待首个 Token 超过 {self.first_token_timeout:.0f} 秒")
+            if kind == "first_token":
+                self.error_occurred.emit(f"[超时] 等待首个 Token 超过 {self.first_token_timeout:.0f} 秒")
+            else:
+                self.error_occurred.emit(f"[超时] 流式响应超过 {self.chunk_gap_timeout:.0f} 秒无数据")
+            return None
+
+    def _stream_once(self, client: OpenAI, req_kwargs: Dict) -> tuple:
+        """发起一次流式请求并在看门狗监控下读取，返回 (读取结果或 None, 看门狗)"""
+        self._response = None
+        watchdog = StreamWatchdog(self.first_token_timeout, self.chunk_gap_timeout, self._on_stream_stalled)
+        watchdog.start()
+        consumed = None
+        # 收到响应头之前 create() 不会返回，_response 为空，看门狗无法关闭连接；
+        # 用略长于看门狗阈值的读取超时兜底，停滞仍按看门狗的判定记录与重试
+        timeout = max(self.first_token_timeout, self.chunk_gap_timeout) + STALL_TIMEOUT_MARGIN
         try:
-            api_key = self.llm_config.get("API_KEY", "").strip()
-            base_url = self.llm_config.get("API_URL") or None
-            model = self.llm_config.get("模型名称", "gpt-4o").strip()
-            temperature = float(self.llm_config.get("温度", 0.7))
-            max_tokens = int(self.llm_config.get("最大Token", 2048))
-            enable_thinking = bool(self.llm_config.get("是否思考", True))
-
-            if not model:
-                self.error_occurred.emit("[错误] 模型名称未配置")
-                return
-
-            # 设置超时（连接 + 读取）
-            client = OpenAI(
-                api_key=api_key,
-                base_url=base_url,
-                timeout=60.0,  # 总超时 60 秒
-                max_retries=2  # 最多重试 2 次
-            )
-
-            # 构建请求参数
-            req_kwargs = {
-                "model": model,
-                "messages": self.messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "stream": self.stream,
+            response = self._response = client.chat.completions.create(**req_kwargs, timeout=timeout)
+            self.metrics.on_connected()
+            if self._is_cancelled or watchdog.stall:
+                # 在 create() 返回前发出的取消或停滞，这里补关一次
+                _force_close_stream(response)
+            else:
+                consumed = self._consume_stream(response, watchdog)
+        except Exception:
+            # 取消或看门狗关闭连接时读取会抛异常，其余异常交由 run() 处理
+            if watchdog.stall is None and not self._is_cancelled:
+                raise
+        finally:
+            watchdog.stop()
+        return consumed, watchdog
+
+    def _release_ticket(self, ticket: SchedulerTicket, prompt_tokens: int, output_start: int):
+        completion_tokens = (len(self.full_response) - output_start) // 2
+        get_scheduler().release(ticket, prompt_tokens + completion_tokens)
+
+    def _consume_stream(self, response, watchdog: StreamWatchdog = None) -> Optional[tuple]:
+        """
+        读取一轮流式响应，返回 (文本内容, 工具调用列表)；取消时返回 None（由调用方提示）。
+        """
+        round_state = self._new_round_state()
+        with span("worker.stream"):
+            for chunk in response:
+                if self._is_cancelled:
+                    return None
+                if self._apply_chunk(chunk, round_state) and watchdog is not None:
+                    watchdog.feed()
+        return self._finish_round_state(round_state)
+
+    @staticmethod
+    def _new_round_state() -> Dict:
+        return {"content": "", "tool_calls": {}}
+
+    @staticmethod
+    def _finish_round_state(round_state: Dict) -> tuple:
+        tool_calls = round_state["tool_calls"]
+        return round_state["content"], [tool_calls[i] for i in sorted(tool_calls)]
+
+    @traced("worker.chunk")
+    def _apply_chunk(self, chunk, round_state: Dict) -> bool:
+        """
+        处理一个流式 chunk，返回是否收到了有效数据（非空文本或工具调用增量）。
+        首个 chunk 通常只带 role 与空字符串内容，不算收到数据，否则看门狗会把随后的停滞当作 chunk 间隔，
+        跳过首 Token 超时与未输出内容时的透明重试。
+        工具调用的 name/arguments 以增量形式到达，按 index 累积。
+        """
+        self.metrics.on_usage(getattr(chunk, "usage", None))
+        if not chunk.choices:
+            return False
+        received = False
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content = delta.content
+            round_state["content"] += content
+            self.full_response += content
+            self.metrics.on_chunk(content)
+            self.content_received.emit(content)
+            received = True
+
+        for tc in (getattr(delta, "tool_calls", None) or []):
+            call = round_state["tool_calls"].setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+            if tc.id:
+                call["id"] = tc.id
+            if tc.function is not None:
+                if tc.function.name:
+                    is_new_call = not call["name"]
+                    call["name"] += tc.function.name
+                    if is_new_call:
+                        self.tool_trace.emit({"event": "call", "id": call["id"], "name": call["name"]})
+                if tc.function.arguments:
+                    call["arguments"] += tc.function.arguments
+            received = True
+        return received
+
+    def _consume_message(self, response) -> tuple:
+        """非流式响应：一次性取出文本与工具调用"""
+        message = response.choices[0].message
+        content = message.content or ""
+        if content:
+            self.full_response += content
+            self.metrics.on_chunk(content)
+            self.content_received.emit(content)
+        self.metrics.on_usage(getattr(response, "usage", None))
+        tool_calls = []
+        for tc in (message.tool_calls or []):
+            tool_calls.append({"id": tc.id, "name": tc.function.name, "arguments": tc.function.arguments or ""})
+            self.tool_trace.emit({"event": "call", "id": tc.id, "name": tc.function.name})
+        return content, tool_calls
+
+    def _build_request(self, llm_config: Dict) -> Optional[tuple]:
+        """根据模型配置构建请求参数，返回 (API_KEY, API_URL, 请求参数)；配置无效时提示并返回 None"""
+        api_key = llm_config.get("API_KEY", "").strip()
+        base_url = llm_config.get("API_URL") or None
+        model = llm_config.get("模型名称", "gpt-4o").strip()
+        temperature = float(llm_config.get("温度", 0.7))
+        max_tokens = int(llm_config.get("最大Token", 2048))
+        enable_thinking = bool(llm_config.get("是否思考", True))
+
+        if not model:
+            self.error_occurred.emit("[错误] 模型名称未配置")
+            return None
+
+        # 构建请求参数
+        req_kwargs = {
+            "model": model,
+            "messages": self.messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": self.stream,
+        }
+
+        # 仅对支持 thinking 的官方 API 才加 extra_body（避免第三方报错）
+        # 这里保守处理：只在 base_url 为 None 或 openai 官方域名时启用
+        if enable_thinking and (not base_url or "openai" in (base_url or "")):
+            req_kwargs["extra_body"] = {
+                "enable_thinking": True,
+                "chat_template_kwargs": {"enable_thinking": True}
             }
-
-            # 仅对支持 thinking 的官方 API 才加 extra_body（避免第三方报错）
-            # 这里保守处理：只在 base_url 为 None 或 openai 官方域名时启用
-            if enable_thinking and (not base_url or "openai" in (base_url or "")):
-                req_kwargs["extra_body"] = {
-                    "enable_thinking": True,
-                    "chat_template_kwargs": {"enable_thinking": True}
-                }
+        return api_key, base_url, req_kwargs
+
+    def _run_once(self, llm_config: Dict) -> bool:
+        """
+        使用单个模型配置完成一次完整回复（含工具调用轮次）。
+        正常结束返回 True；取消或停滞且已提示时返回 False；请求失败抛出异常交由 run() 路由。
+        """
+        request = self._build_request(llm_config)
+        if request is None:
+            return False
+        api_key, base_url, req_kwargs = request
+        client = get_shared_client(api_key, base_url)
+
+        self._load_runtime_options(llm_config)
+        self._active_config = llm_config
+        self.metrics.model = req_kwargs["model"]
+        tool_specs = [spec for spec in map(_tool_to_openai_schema, self.tools) if spec]
+        conversation = list(self.messages)
+
+        for round_idx in range(self.max_tool_rounds + 1):
+            req_kwargs["messages"] = conversation
+            # 最后一轮不再提供工具，强制模型给出最终回答
+            if tool_specs and round_idx < self.max_tool_rounds:
+                req_kwargs["tools"] = tool_specs
+            else:
+                req_kwargs.pop("tools", None)
 
             # 执行请求
-            response = client.chat.completions.create(**req_kwargs)
+            consumed = self._request_round(client, req_kwargs)
+            if consumed is None:
+                return False
+            round_content, tool_calls = consumed
+            if not tool_calls:
+                break
+
+            results = self._execute_tool_calls(tool_calls)
+            if results is None:
+                self.error_occurred.emit("[已取消] 用户手动中止请求")
+                return False
+            self._append_tool_round(conversation, round_content, tool_calls, results)
+
+        return True
+
+    @staticmethod
+    def _append_tool_round(conversation: List[Dict], round_content: str, tool_calls: List[Dict], results: List[Dict]):
+        """把助手的工具调用与对应结果追加到对话中，供下一轮请求使用"""
+        conversation.append({
+            "role": "assistant",
+            "content": round_content or None,
+            "tool_calls": [
+                {"id": call["id"], "type": "function",
+                 "function": {"name": call["name"], "arguments": call["arguments"]}}
+                for call in tool_calls
+            ]
+        })
+        for call, result in zip(tool_calls, results):
+            conversation.append({
+                "role": "tool",
+                "tool_call_id": call["id"],
+                "content": json.dumps(result, ensure_ascii=False, default=str)
+            })
 
+    def run(self):
+        if self._is_cancelled:
+            # 排队期间已被取消
+            self._mark_finished()
+            return
+        self.state = self.ACTIVE
+        try:
+            if self._replay_cached_response():
+                return
+            route = RoutePlan([self.llm_config] + self.fallback_configs)
             self.full_response = ""
-            last_chunk_time = time.time()
-
-            for chunk in response:
-                if self._is_cancelled:
-                    self.error_occurred.emit("[已取消] 用户手动中止请求")
+            for llm_config in route.endpoints():
+                if llm_config is not self.llm_config:
+                    self.fallback_used.emit(llm_config.get("模型名称", ""))
+                # 重试次数按当前端点自己的配置读取
+                for attempt in range(max_retries_for(llm_config) + 1):
+                    try:
+                        completed = self._run_once(llm_config)
+                    except Exception as e:
+                        # 已输出内容（或已执行工具）后不再重试，避免重复输出
+                        if self._is_cancelled or self.full_response or self._tools_executed or not is_retryable(e):
+                            raise
+                        delay = route.on_failure(llm_config, attempt, e)
+                        if delay is None:
+                            break
+                        if self._cancel_event.wait(delay):
+                            self.error_occurred.emit("[已取消] 用户手动中止请求")
+                            return
+                        continue
+                    route.on_success(llm_config)
+                    if completed:
+                        self._complete(llm_config)
                     return
+            route.raise_last_error()
 
-                # 防止无限等待（虽然有 timeout，但流式可能卡在某 chunk）
-                if time.time() - last_chunk_time > 30:
-                    self.error_occurred.emit("[超时] 流式响应超过 30 秒无数据")
-                    return
-
-                if chunk.choices and chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    self.full_response += content
-                    self.content_received.emit(content)
-                    last_chunk_time = time.time()
+        except Exception as e:
 
-            self.finished_with_content.emit(self.full_response)
+            self._emit_api_error(e)
 
+        finally:
+            self._mark_finished()
 
+    def _emit_api_error(self, e: Exception):
+        """将请求异常转换为用户可读的错误提示"""
+        try:
+            raise e
         except BadRequestError as e:
 
-            self.error_occurred.emit(f"[请求错误] {e.message or str(e)}")
+            self._emit_error(f"[请求错误] {e.message or str(e)}")
 
         except RateLimitError:
 
-            self.error_occurred.emit("[速率限制] 请求过于频繁，请稍后再试")
+            self._emit_error("[速率限制] 请求过于频繁，请稍后再试")
 
         except APIConnectionError:
 
-            self.error_occurred.emit("[连接失败] 无法连接到 API 服务器，请检查网络或 API_URL")
+            self._emit_error("[连接失败] 无法连接到 API 服务器，请检查网络或 API_URL")
 
         except APITimeoutError:  # ✅ 使用 APITimeoutError
 
-            self.error_occurred.emit("[超时] 请求超时（60秒），请检查网络或模型负载")
+            self._emit_error("[超时] 请求超时（60秒），请检查网络或模型负载")
 
         except APIError as e:
 
@@ -184,15 +751,19 @@ class OpenAIChatWorker(QThread):
 
             if "context length" in error_str and "overflow" in error_str:
 
-                self.error_occurred.emit(error_str)
+                self._emit_error(error_str)
 
             else:
 
-                self.error_occurred.emit(f"[API 错误] {error_str}")
+                self._emit_error(f"[API 错误] {error_str}")
+
+        except StreamStallError as e:
+
+            self._emit_error(f"[超时] {e}")
 
         except ValueError as e:
 
-            self.error_occurred.emit(f"[配置错误] 参数类型无效: {str(e)}")
+            self._emit_error(f"[配置错误] 参数类型无效: {str(e)}")
 
         except Exception as e:
 
@@ -200,8 +771,51 @@ class OpenAIChatWorker(QThread):
 
             if "max_tokens" in error_str.lower() or "context length" in error_str.lower():
 
-                self.error_occurred.emit("[错误] 模型上下文或最大Token超出限制，请减少输入长度或调低 max_tokens")
+                self._emit_error("[错误] 模型上下文或最大Token超出限制，请减少输入长度或调低 max_tokens")
 
             else:
 
-                self.error_occurred.emit(f"[未知错误] {error_str}")
+                self._emit_error(f"[未知错误] {error_str}")
+
+    def _response_cache_key(self) -> str:
+        tool_specs = [spec for spec in map(_tool_to_openai_schema, self.tools) if spec]
+        return ResponseCache.make_key(self.llm_config, self.messages, tool_specs)
+
+    def _replay_cached_response(self) -> bool:
+        """命中响应缓存时按流式路径分段回放，返回是否命中"""
+        if self.response_cache is None or not self.read_cache:
+            return False
+        ttl = float(self.llm_config.get("缓存有效期", DEFAULT_RESPONSE_CACHE_TTL))
+        content = self.response_cache.get(self._response_cache_key(), ttl)
+        if content is None:
+            return False
+        self.metrics.cached = True
+        self.response_cached.emit()
+        for start in range(0, len(content), REPLAY_CHUNK_CHARS):
+            if self._is_cancelled:
+                self.error_occurred.emit("[已取消] 用户手动中止请求")
+                return True
+            piece = content[start:start + REPLAY_CHUNK_CHARS]
+            self.full_response += piece
+            self.metrics.on_chunk(piece)
+            self.content_received.emit(piece)
+        self.finished_with_content.emit(self.full_response)
+        return True
+
+    def _complete(self, llm_config: Dict):
+        """
+        回答完整结束。仅缓存主端点、未调用工具的回答：
+        备用模型的回答不应记在主配置名下，工具结果则可能随时间变化。
+        """
+        if self.response_cache is not None and llm_config is self.llm_config and not self._tools_executed:
+            self.response_cache.put(self._response_cache_key(), self.full_response, self.metrics.model)
+        self.finished_with_content.emit(self.full_response)
+
+    def _mark_finished(self):
+        self._response = None
+        if self._cancel_requested_at is not None:
+            self.cancel_latency = time.monotonic() - self._cancel_requested_at
+        self.metrics.finish()
+        self.state = self.FINISHED
+        self._done_event.set()
+        self.finished.emit()